@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 14:08:45 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+from threading import Thread
+import time
+import mock_cnpq as mock
+import utils_download_manifest as manifest
+import utils_download_metrics as metrics
+
+STR_SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# seconds given to Chrome and its webdriver to start before the search
+N_WEBDRIVER_TIMEOUT = 120
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+
+    It expects one positional argument:
+        - output_folder (str): The folder of the run. The search results go to
+          its 'capes_x_lattes' subfolder and the zip files to 'xml_lattes',
+          as in run_pipeline; the logs of the stages and the report go to the
+          folder itself. Use an empty folder: the journal and the manifest of
+          an earlier run would skip the work already done.
+    And accepts the options of the mock server (see mock_cnpq.add_args_mock),
+    the options of the stages and:
+        - --names (int): The number of names of the synthetic CAPES file.
+        - --capes-file (str): A CAPES Excel file to use instead.
+        - --skip-search (bool): Skip download_id_lattes, which needs Chrome, and
+          download the IDs the mock search would have found.
+        - --download-rounds (int): The number of runs of download_xml_lattes,
+          so the IDs that failed are retried within their budget.
+    """
+    parser = argparse.ArgumentParser(description='Mede a busca e o download '
+                                     'contra o servidor local que imita o CNPq.')
+    parser.add_argument('output_folder', metavar='output_path', type=str,
+                        help='pasta vazia onde serao gravados os resultados e o relatorio')
+    parser.add_argument('--names', type=int, default=200,
+                        help='numero de nomes do arquivo Capes sintetico')
+    parser.add_argument('--capes-file', type=str, default=None,
+                        help='arquivo Excel da Capes a ser usado no lugar do sintetico')
+    parser.add_argument('--skip-search', action='store_true',
+                        help='pula a busca (que exige o Chrome) e baixa os IDs que '
+                        'ela encontraria')
+    parser.add_argument('--search-rate', type=float, default=20.0,
+                        help='numero maximo de requisicoes por segundo da busca')
+    parser.add_argument('--preview-workers', type=int, default=8,
+                        help='numero de paginas de preview buscadas em paralelo')
+    parser.add_argument('--download-rate', type=float, default=20.0,
+                        help='numero maximo de requisicoes por segundo do download')
+    parser.add_argument('--download-workers', type=int, default=4,
+                        help='numero maximo de downloads simultaneos')
+    parser.add_argument('--captcha-workers', type=int, default=4,
+                        help='numero de captchas resolvidos simultaneamente')
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='numero maximo de captchas gastos com um mesmo ID')
+    parser.add_argument('--download-rounds', type=int, default=2,
+                        help='numero de execucoes do download')
+    mock.add_args_mock(parser)
+
+    return parser.parse_args()
+
+
+def get_lst_names(n_names):
+    """
+    Generate distinct researcher names.
+
+    Args:
+        n_names (int): The number of names.
+
+    Returns:
+        list: The names, in upper case without accents, as in the CAPES file.
+    """
+    rnd = random.Random(n_names)
+    set_names = set()
+    while len(set_names) < n_names:
+        set_names.add('{} {}{} {}'.format(rnd.choice(mock.LST_FIRST_NAMES),
+                                          rnd.choice('ABCDEFGHIJLMNOPRST') + ' '
+                                          if len(set_names) > 2000 else '',
+                                          rnd.choice(mock.LST_SURNAMES),
+                                          rnd.choice(mock.LST_SURNAMES)))
+
+    return sorted(set_names)
+
+
+def write_capes_file(str_capes_path, lst_names):
+    """
+    Write a synthetic CAPES Excel file with the columns read by download_id_lattes.
+
+    Args:
+        str_capes_path (str): The path of the Excel file.
+        lst_names (list): The names of the researchers.
+
+    Returns:
+        None
+    """
+    import pandas as pd
+
+    rnd = random.Random(len(lst_names))
+    pd.DataFrame({'ID_PESSOA': [str(1000 + n) for n in range(len(lst_names))],
+                  'NM_DOCENTE': lst_names,
+                  'NM_IES_TITULACAO': [rnd.choice(mock.LST_INSTITUTIONS).upper()
+                                       for _ in lst_names],
+                  'AN_TITULACAO': [str(rnd.randint(1985, 2020)) for _ in lst_names],
+                  'NM_AREA_AVALIACAO': [rnd.choice(mock.LST_AREAS).upper()
+                                        for _ in lst_names]}).to_excel(str_capes_path,
+                                                                      index=False)
+
+
+def run_stage(lst_command, str_log_path, dict_env):
+    """
+    Run a stage script against the mock server, logging its output.
+
+    Args:
+        lst_command (list): The script and its arguments.
+        str_log_path (str): The file that receives stdout and stderr.
+        dict_env (dict): The environment, pointing to the mock server.
+
+    Returns:
+        tuple: The wall time in seconds and the exit status.
+    """
+    time_start = time.monotonic()
+    with open(str_log_path, mode='a', encoding='utf-8') as file_log:
+        completed = subprocess.run([sys.executable] + lst_command, cwd=STR_SCRIPTS_PATH,
+                                   env=dict_env, stdout=file_log, stderr=subprocess.STDOUT,
+                                   check=False)
+
+    return time.monotonic() - time_start, completed.returncode
+
+
+def get_webdriver_error(dict_env):
+    """
+    Start and close the Chrome of the search in a subprocess, as
+    download_id_lattes does.
+
+    Args:
+        dict_env (dict): The environment of the search stage.
+
+    Returns:
+        str or None: The last line of the error if Chrome or its webdriver
+        could not be started, otherwise None.
+
+    Without a webdriver the search would retry each name forever, as every
+    error is classified as 'other' and retried after a backoff.
+    """
+    try:
+        completed = subprocess.run([sys.executable, '-c', 'import download_id_lattes as search; '
+                                    'search.get_browser().quit()'],
+                                   cwd=STR_SCRIPTS_PATH, env=dict_env, capture_output=True,
+                                   text=True, timeout=N_WEBDRIVER_TIMEOUT, check=False)
+    except subprocess.TimeoutExpired:
+        return 'o Chrome nao iniciou em {}s'.format(N_WEBDRIVER_TIMEOUT)
+
+    if completed.returncode == 0:
+        return None
+
+    lst_lines = [x for x in completed.stderr.splitlines() if x.strip()]
+
+    return lst_lines[-1] if lst_lines else 'status {}'.format(completed.returncode)
+
+
+def get_dict_latency(lst_seconds):
+    """
+    Get the p50, p95, p99 and max of a list of durations, in seconds.
+    """
+    lst_sorted = sorted(lst_seconds)
+    n_size = len(lst_sorted)
+    if not n_size:
+        return {}
+
+    return {str_key: round(lst_sorted[min(n_size - 1, int(n_size * float_q))], 3)
+            for str_key, float_q in [('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0)]}
+
+
+def get_n_circuit_opens(str_log_path):
+    """
+    Count how many times the circuit breaker paused the workers of a stage.
+    """
+    with open(str_log_path, encoding='utf-8', errors='replace') as file_log:
+        return sum('circuit open' in x for x in file_log)
+
+
+def get_dict_search_report(str_search_folder_path, float_seconds):
+    """
+    Summarize the search stage from the files it wrote.
+
+    Returns:
+        dict: Names searched, hits, IDs to download, throughput in names per
+        second and the client-side latency per name.
+    """
+    with open(os.path.join(str_search_folder_path, 'search_latency.csv'),
+              encoding='utf-8') as file_latency:
+        lst_rows = list(csv.DictReader(file_latency))
+
+    with open(os.path.join(str_search_folder_path, 'idlattes_to_download.csv'),
+              encoding='utf-8') as file_ids:
+        n_ids = len([x for x in file_ids if x.strip()])
+
+    return {'seconds': round(float_seconds, 1),
+            'names': len(lst_rows),
+            'hits': sum(int(x['N_HITS']) for x in lst_rows),
+            'ids_to_download': n_ids,
+            'names_per_second': round(len(lst_rows) / float_seconds, 2),
+            'latency': get_dict_latency([float(x['SECONDS']) for x in lst_rows])}
+
+
+def get_dict_download_report(str_xml_folder_path, lst_rounds, n_max_attempts):
+    """
+    Summarize the download rounds from the manifest and the metrics log.
+
+    Returns:
+        dict: Per round the wall time; the CVs downloaded, CVs and MB per
+        second over all rounds, the manifest by status and by attempts, which
+        shows the retries, and the metrics summary of the last round.
+    """
+    str_manifest_path = manifest.get_manifest_path(str_xml_folder_path)
+    float_seconds = sum(x['seconds'] for x in lst_rounds)
+    n_ok = len(manifest.get_lst_ids_ok(str_manifest_path))
+
+    dict_summary = None
+    with open(metrics.get_metrics_path(str_xml_folder_path), encoding='utf-8') as file_metrics:
+        for str_line in file_metrics:
+            dict_event = json.loads(str_line)
+            if dict_event['event'] == 'summary':
+                dict_summary = dict_event
+
+    n_bytes = sum(os.path.getsize(os.path.join(str_xml_folder_path, x))
+                  for x in os.listdir(str_xml_folder_path) if x.endswith('.zip'))
+
+    return {'rounds': lst_rounds,
+            'seconds': round(float_seconds, 1),
+            'cvs': n_ok,
+            'cvs_per_second': round(n_ok / float_seconds, 2) if float_seconds else None,
+            'mb_per_second': round(n_bytes / 2 ** 20 / float_seconds, 2) if float_seconds else None,
+            'manifest': manifest.get_lst_summary(str_manifest_path, n_max_attempts),
+            'attempts': manifest.get_lst_attempts_histogram(str_manifest_path),
+            'last_round': dict_summary}
+
+
+def show_report(dict_report):
+    """
+    Displays the benchmark report.
+
+    Args:
+        dict_report (dict): The report, with the keys 'search' (absent when
+            skipped), 'download' and 'server'.
+
+    Returns:
+        None
+    """
+    if 'search' in dict_report:
+        dict_search = dict_report['search']
+        print('search: {names} nomes em {seconds}s ({names_per_second}/s), {hits} resultados, '
+              '{ids_to_download} IDs para baixar, circuito aberto {circuit_opens} vez(es) - '
+              'latencia por nome {latency}'.format(**dict_search))
+
+    dict_download = dict_report['download']
+    print('download: {cvs} CVs em {seconds}s ({cvs_per_second} CVs/s, {mb_per_second} MB/s), '
+          'circuito aberto {circuit_opens} vez(es)'.format(**dict_download))
+    for n_round, dict_round in enumerate(dict_download['rounds'], 1):
+        print('  rodada {}: {}s, status {}'.format(n_round, dict_round['seconds'],
+                                                  dict_round['returncode']))
+    for str_status, n_attempts, n_count in dict_download['attempts']:
+        print('  {} {} com {} tentativa(s)'.format(n_count, str_status, n_attempts))
+    for str_status, str_error, n_count in dict_download['manifest']:
+        print('  manifest: {} {} {}'.format(n_count, str_status, str_error or ''))
+    if dict_download['last_round']:
+        print('  metricas so da rodada {}, a ultima (os contadores do servidor abaixo '
+              'somam todas as rodadas):'.format(len(dict_download['rounds'])))
+        metrics.show_summary(dict_download['last_round'])
+
+    dict_server = dict_report['server']
+    for str_endpoint, dict_endpoint in dict_server['endpoints'].items():
+        if dict_endpoint['requests']:
+            print('server {}: {} requisicoes, {} erros injetados, {:.1f} MB, latencia {}'.format(
+                str_endpoint, dict_endpoint['requests'], dict_endpoint['errors'],
+                dict_endpoint['bytes'] / 2 ** 20, dict_endpoint['latency']))
+    print('server captcha: {} - saldo {}'.format(dict_server['captcha'], dict_server['balance']))
+
+
+def main():
+    """
+    Run the search and the download against a local mock of CNPq.
+
+    The mock server runs in this process on a free port. The stage scripts
+    run as subprocesses, unchanged, pointed to it by LATTES_BASE_URL and
+    using its fake captcha service through LATTES_FAKE_CAPTCHA, so nothing
+    is sent to CNPq and no DeathByCaptcha credit is spent. The download runs
+    --download-rounds times, as an operator would rerun it, which exercises
+    the retry budget of the manifest. Unless --skip-search is given, the
+    run stops first if Chrome and its webdriver cannot be started. The
+    report combines the files written by the stages with the counters of
+    the server and is also saved to benchmark_report.json.
+
+    Example:
+        $ python benchmark_mock_cnpq.py /tmp/bench --skip-search --names 500 --error-rate 0.05
+    """
+    args = get_args()
+
+    if not args.skip_search:
+        str_error = get_webdriver_error(os.environ)
+        if str_error:
+            print('A busca exige o Chrome e o seu webdriver, que nao puderam ser iniciados: '
+                  '{}'.format(str_error))
+            print('Instale-os ou use --skip-search.')
+            sys.exit(1)
+
+    str_output_path = os.path.abspath(args.output_folder)
+    str_search_folder_path = os.path.join(str_output_path, 'capes_x_lattes')
+    str_xml_folder_path = os.path.join(str_output_path, 'xml_lattes') + '/'
+    str_ids_path = os.path.join(str_search_folder_path, 'idlattes_to_download.csv')
+
+    for str_folder_path in [str_search_folder_path, str_xml_folder_path]:
+        if not os.path.exists(str_folder_path):
+            os.makedirs(str_folder_path)
+
+    dict_mock = mock.get_dict_mock(args)
+    server = mock.get_server(dict_mock, '127.0.0.1', 0)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    dict_env = dict(os.environ, LATTES_BASE_URL='http://{}:{}'.format(*server.server_address),
+                    LATTES_FAKE_CAPTCHA='1')
+    dict_report = {}
+
+    if args.skip_search:
+        with open(str_ids_path, mode='w', encoding='utf-8') as file_ids:
+            for str_name in get_lst_names(args.names):
+                for str_k_id, _, _ in mock.get_lst_hits(dict_mock, str_name):
+                    file_ids.write(mock.get_id_lattes(str_k_id) + '\n')
+    else:
+        str_capes_path = args.capes_file
+        if not str_capes_path:
+            str_capes_path = os.path.join(str_output_path, 'capes_mock.xlsx')
+            write_capes_file(str_capes_path, get_lst_names(args.names))
+
+        float_seconds, _ = run_stage(['download_id_lattes.py', str_capes_path,
+                                      str_search_folder_path, '--rate', str(args.search_rate),
+                                      '--preview-workers', str(args.preview_workers)],
+                                     os.path.join(str_output_path, 'search.log'), dict_env)
+        dict_report['search'] = get_dict_search_report(str_search_folder_path, float_seconds)
+        dict_report['search']['circuit_opens'] = get_n_circuit_opens(
+            os.path.join(str_output_path, 'search.log'))
+
+    lst_rounds = []
+    for _ in range(args.download_rounds):
+        float_seconds, n_returncode = run_stage(
+            ['download_xml_lattes.py', str_ids_path, str_xml_folder_path,
+             '--rate', str(args.download_rate), '--download-workers', str(args.download_workers),
+             '--captcha-workers', str(args.captcha_workers),
+             '--max-attempts', str(args.max_attempts)],
+            os.path.join(str_output_path, 'download.log'), dict_env)
+        lst_rounds.append({'seconds': round(float_seconds, 1), 'returncode': n_returncode})
+
+    dict_report['download'] = get_dict_download_report(str_xml_folder_path, lst_rounds,
+                                                       args.max_attempts)
+    dict_report['download']['circuit_opens'] = get_n_circuit_opens(
+        os.path.join(str_output_path, 'download.log'))
+    dict_report['server'] = mock.get_dict_stats(dict_mock)
+    server.shutdown()
+
+    show_report(dict_report)
+
+    with open(os.path.join(str_output_path, 'benchmark_report.json'), mode='w',
+              encoding='utf-8') as file_report:
+        json.dump(dict_report, file_report, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 17:05:51 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# modules that only the stage subcommands may import
+LST_HEAVY_MODULES = ['pandas', 'selenium', 'requests', 'dbc_api_python3', 'fuzzywuzzy',
+                     'duckdb', 'download_id_lattes', 'download_xml_lattes', 'parse_xml_lattes',
+                     'merge_capes_x_lattes', 'query_lattes']
+
+STR_SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+
+    It accepts the options:
+        - --runs (int): The number of times each command is timed.
+        - --max-seconds (float): The highest median startup time accepted.
+    """
+    parser = argparse.ArgumentParser(description='Mede o tempo de inicializacao '
+                                     'do lattes_cli.')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='numero de execucoes de cada comando')
+    parser.add_argument('--max-seconds', type=float, default=0.5,
+                        help='tempo mediano maximo aceito, em segundos')
+
+    return parser.parse_args()
+
+
+def get_lst_heavy_modules_loaded(lst_argv):
+    """
+    Run lattes_cli in a subprocess and get the heavy modules it imported.
+
+    Args:
+        lst_argv (list): The command-line arguments given to lattes_cli.
+
+    Returns:
+        list: The modules of LST_HEAVY_MODULES imported by the command.
+    """
+    str_code = ('import sys, lattes_cli\n'
+                'sys.argv = ["lattes_cli.py"] + sys.argv[1:]\n'
+                'try:\n'
+                '    lattes_cli.main()\n'
+                'except SystemExit:\n'
+                '    pass\n'
+                'print("loaded:", *[x for x in {} if x in sys.modules])\n'
+                .format(LST_HEAVY_MODULES))
+
+    completed = subprocess.run([sys.executable, '-c', str_code] + lst_argv,
+                               cwd=STR_SCRIPTS_PATH, capture_output=True, text=True,
+                               check=False)
+
+    return [x for str_line in completed.stdout.splitlines() if str_line.startswith('loaded:')
+            for x in str_line.split()[1:]]
+
+
+def get_median_seconds(lst_argv, n_runs):
+    """
+    Time a lattes_cli command, from the start of the interpreter to its exit.
+
+    Args:
+        lst_argv (list): The command-line arguments given to lattes_cli.
+        n_runs (int): The number of runs.
+
+    Returns:
+        float: The median wall time in seconds.
+    """
+    lst_seconds = []
+    for _ in range(n_runs):
+        time_start = time.perf_counter()
+        subprocess.run([sys.executable, 'lattes_cli.py'] + lst_argv, cwd=STR_SCRIPTS_PATH,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        lst_seconds.append(time.perf_counter() - time_start)
+
+    return sorted(lst_seconds)[n_runs // 2]
+
+
+def main():
+    """
+    Check that lattes_cli starts fast and imports no heavy dependency.
+
+    Times --help, the help of each stage subcommand, an argument error and
+    status on an empty data folder, and checks in each case that none of the
+    stage modules, nor pandas, selenium, requests or the DeathByCaptcha client,
+    was imported. Exits with status 1 if a heavy module was imported or a
+    median time is above --max-seconds. The interpreter startup alone is also
+    timed, as the baseline.
+
+    Example:
+        $ python check_cli_startup.py
+        python -c pass: 0.018s
+        --help: 0.041s
+        ...
+    """
+    args = get_args()
+
+    with tempfile.TemporaryDirectory() as str_data_folder:
+        lst_commands = [['--help'], ['search', '--help'], ['download', '--help'],
+                        ['parse', '--help'], ['merge', '--help'], ['query', '--help'],
+                        ['download'], ['status', os.path.abspath(str_data_folder)]]
+
+        time_start = time.perf_counter()
+        for _ in range(args.runs):
+            subprocess.run([sys.executable, '-c', 'pass'], check=False)
+        print('python -c pass: {:.3f}s'.format((time.perf_counter() - time_start) / args.runs))
+
+        b_ok = True
+        for lst_argv in lst_commands:
+            float_seconds = get_median_seconds(lst_argv, args.runs)
+            lst_loaded = get_lst_heavy_modules_loaded(lst_argv)
+            print('{}: {:.3f}s {}'.format(' '.join(lst_argv).replace(str_data_folder, '<tmp>'),
+                                         float_seconds,
+                                         'importou ' + ', '.join(lst_loaded) if lst_loaded else ''))
+            b_ok = b_ok and not lst_loaded and float_seconds <= args.max_seconds
+
+    sys.exit(0 if b_ok else 1)
+
+if __name__ == "__main__":
+    main()
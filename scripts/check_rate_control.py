@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov  3 10:21:37 2026
+
+@author: andrefelix
+"""
+
+import sys
+import time
+from threading import Thread
+import utils_rate_control as rate
+
+# cooldown short enough for the check, window long enough to tell a blocked
+# caller from one released by the probe
+FLOAT_COOLDOWN = 0.2
+FLOAT_WINDOW = 5.0
+
+
+def check_failure_other_thread():
+    """
+    Check that a failed probe reported by another thread reopens the circuit
+    with a longer cooldown.
+    """
+    breaker = get_breaker_half_open()
+    n_probe = run_in_thread(breaker.wait)
+
+    breaker.record_failure(n_probe)
+    float_cooldown = breaker.time_open_until - time.monotonic()
+
+    return not breaker.b_half_open and FLOAT_COOLDOWN < float_cooldown <= 2 * FLOAT_COOLDOWN
+
+
+def check_other_outcomes_ignored():
+    """
+    Check that outcomes recorded without the token of the probe leave the
+    circuit half open.
+    """
+    breaker = get_breaker_half_open()
+    n_probe = run_in_thread(breaker.wait)
+
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_success(n_probe + 1)
+
+    return breaker.b_half_open and breaker.n_probe == n_probe
+
+
+def check_probe_passed_on():
+    """
+    Check that the token of the probe lets another thread send a further
+    request of the same probe without waiting.
+    """
+    breaker = get_breaker_half_open()
+    n_probe = run_in_thread(breaker.wait)
+
+    time_start = time.monotonic()
+    n_probe_passed = run_in_thread(breaker.wait, n_probe)
+
+    return n_probe_passed == n_probe and time.monotonic() - time_start < 0.5
+
+
+def check_success_other_thread():
+    """
+    Check that a successful probe reported by another thread closes the
+    circuit and releases the callers blocked by it well before the window.
+    """
+    breaker = get_breaker_half_open()
+    n_probe = run_in_thread(breaker.wait)
+
+    lst_seconds = []
+    time_start = time.monotonic()
+    thread = Thread(target=lambda: (breaker.wait(), lst_seconds.append(time.monotonic() -
+                                                                        time_start)))
+    thread.start()
+    time.sleep(0.1)
+    breaker.record_success(n_probe)
+    thread.join()
+
+    return not breaker.is_open() and lst_seconds[0] < FLOAT_WINDOW / 2
+
+
+def get_breaker_half_open():
+    """
+    Get a circuit breaker whose circuit opened and whose cooldown is over.
+    """
+    breaker = rate.CircuitBreaker(0.5, 4, FLOAT_WINDOW, FLOAT_COOLDOWN, 2.0)
+    for _ in range(4):
+        breaker.record_failure()
+    time.sleep(FLOAT_COOLDOWN + 0.05)
+
+    return breaker
+
+
+def run_in_thread(func, *args):
+    """
+    Call func in a new thread and wait for its return value.
+    """
+    lst_return = []
+    thread = Thread(target=lambda: lst_return.append(func(*args)))
+    thread.start()
+    thread.join()
+
+    return lst_return[0]
+
+
+def main():
+    """
+    Check the half open circuit when the probe is acquired and recorded on
+    different threads, as the preview pool of download_id_lattes does.
+
+    Each check opens a CircuitBreaker, lets the cooldown pass and acquires the
+    probe on a thread of its own, then records the outcome from the main
+    thread. Exits with status 1 if any check fails.
+
+    Example:
+        $ python check_rate_control.py
+        check_success_other_thread: ok
+        check_failure_other_thread: ok
+        ...
+    """
+    b_ok = True
+    for func in [check_success_other_thread, check_failure_other_thread,
+                 check_probe_passed_on, check_other_outcomes_ignored]:
+        b_check = func()
+        print('{}: {}'.format(func.__name__, 'ok' if b_check else 'FALHOU'))
+        b_ok = b_ok and b_check
+
+    sys.exit(0 if b_ok else 1)
+
+if __name__ == "__main__":
+    main()
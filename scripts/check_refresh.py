@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Nov  2 09:48:15 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import subprocess
+import sys
+from threading import Thread
+import benchmark_mock_cnpq as benchmark
+import mock_cnpq as mock
+import utils_download_manifest as manifest
+import utils_download_metrics as metrics
+import utils_search_journal as journal
+
+STR_SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# a K-id the search never returns; its preview page shows another CNPq ID
+STR_WRONG_K_ID = 'K0000000A0'
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+
+    It expects one positional argument:
+        - output_folder (str): An empty folder for the files of the check.
+    And accepts the options of the mock server (see mock_cnpq.add_args_mock),
+    without injected HTTP or captcha errors and with 30% of the previews
+    without the CNPq ID by default, and:
+        - --names (int): The number of names whose IDs are downloaded.
+    """
+    parser = argparse.ArgumentParser(description='Verifica o --refresh do download '
+                                     'contra o mock do CNPq.')
+    parser.add_argument('output_folder', metavar='output_path', type=str,
+                        help='pasta vazia onde serao gravados os arquivos da verificacao')
+    parser.add_argument('--names', type=int, default=40,
+                        help='numero de nomes cujos IDs sao baixados')
+    mock.add_args_mock(parser)
+    # a refresh download that fails is not retried in the same run, so by
+    # default neither the pages nor the captchas fail
+    parser.set_defaults(error_rate=0.0, captcha_incorrect_rate=0.0, captcha_reject_rate=0.0,
+                        preview_no_id_rate=0.3)
+
+    return parser.parse_args()
+
+
+def get_set_ids_downloaded(str_metrics_path):
+    """
+    Get the IDs downloaded successfully according to a download metrics log.
+    """
+    set_ids = set()
+    with open(str_metrics_path, encoding='utf-8') as file_log:
+        for str_line in file_log:
+            dict_event = json.loads(str_line)
+            if dict_event['event'] == 'download' and dict_event.get('status') == 'ok':
+                set_ids.add(dict_event['id'])
+
+    return set_ids
+
+
+def write_dados_gerais(str_csv_path, lst_ids, set_ids_changed):
+    """
+    Write a lattes_dados_gerais.csv with the update dates of the mock, a year
+    earlier for the IDs of set_ids_changed.
+    """
+    with open(str_csv_path, mode='w', newline='', encoding='utf-8') as file_csv:
+        writer = csv.writer(file_csv)
+        writer.writerow(['FILE-NAME', 'DATA-ATUALIZACAO'])
+        for str_id_lattes in lst_ids:
+            str_day, str_month, str_year = mock.get_date_updated(str_id_lattes)
+            if str_id_lattes in set_ids_changed:
+                str_year = str(int(str_year) - 1)
+            writer.writerow([str_id_lattes, str_day + str_month + str_year])
+
+
+def main():
+    """
+    Check that the refresh of the download queues again only the CVs updated.
+
+    Starts the mock of CNPq (see benchmark_mock_cnpq) and downloads the IDs of
+    --names names. Then writes a search journal and a lattes_dados_gerais.csv
+    in which:
+        - one ID in three has a stored date a year earlier than the mock's;
+        - one ID in five has no K-id in the journal;
+        - one ID has a K-id whose preview page shows another CNPq ID.
+    Runs the download again with --refresh and --kid-cache and checks that
+    exactly the IDs with an earlier date and a right K-id are downloaded
+    again, and that the CV page is requested only for the K-ids whose
+    preview does not show the CNPq ID (see --preview-no-id-rate). Exits with
+    status 1 if any check fails.
+
+    Example:
+        $ python check_refresh.py /tmp/refresh --names 40
+        download: 47 IDs, 47 ok
+        refresh: 47 checked, 12 changed, 25 unchanged, 10 unknown (9 without K-id), 0 never parsed
+        baixados de novo: 12 de 12 esperados, 0 inesperados, 11 de 11 paginas visualizacv.do
+    """
+    args = get_args()
+    str_output_path = os.path.abspath(args.output_folder)
+    str_xml_folder_path = os.path.join(str_output_path, 'xml_lattes')
+    str_ids_path = os.path.join(str_output_path, 'idlattes_to_download.csv')
+    str_journal_path = journal.get_journal_path(str_output_path)
+    str_dados_gerais_path = os.path.join(str_output_path, 'lattes_dados_gerais.csv')
+    os.makedirs(str_xml_folder_path, exist_ok=True)
+
+    dict_mock = mock.get_dict_mock(args)
+    server = mock.get_server(dict_mock, '127.0.0.1', 0)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    dict_env = dict(os.environ, LATTES_BASE_URL='http://{}:{}'.format(*server.server_address),
+                    LATTES_FAKE_CAPTCHA='1')
+
+    dict_id_kid = dict()
+    for str_name in benchmark.get_lst_names(args.names):
+        for str_k_id, _, _ in mock.get_lst_hits(dict_mock, str_name):
+            dict_id_kid[mock.get_id_lattes(str_k_id)] = str_k_id
+
+    with open(str_ids_path, mode='w', encoding='utf-8') as file_ids:
+        file_ids.write(''.join(x + '\n' for x in dict_id_kid))
+
+    lst_command = [sys.executable, os.path.join(STR_SCRIPTS_PATH, 'download_xml_lattes.py'),
+                   str_ids_path, str_xml_folder_path, '--rate', '50']
+    subprocess.run(lst_command, cwd=STR_SCRIPTS_PATH, env=dict_env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+    lst_ids = sorted(manifest.get_lst_ids_ok(manifest.get_manifest_path(str_xml_folder_path)))
+    print('download: {} IDs, {} ok'.format(len(dict_id_kid), len(lst_ids)))
+
+    set_ids_no_kid = set(lst_ids[::5])
+    str_id_wrong_kid = lst_ids[1]
+    set_ids_changed = set(lst_ids[::3])
+    for str_id_lattes in lst_ids:
+        if str_id_lattes not in set_ids_no_kid:
+            journal.write_kid_cache(str_journal_path, STR_WRONG_K_ID if str_id_lattes ==
+                                    str_id_wrong_kid else dict_id_kid[str_id_lattes],
+                                    str_id_lattes)
+    write_dados_gerais(str_dados_gerais_path, lst_ids, set_ids_changed)
+    set_ids_expected = set_ids_changed - set_ids_no_kid - {str_id_wrong_kid}
+    n_detail_pages_expected = sum(1 for x in set(lst_ids) - set_ids_no_kid if
+                                  mock.is_preview_without_id(dict_mock, STR_WRONG_K_ID if x ==
+                                                             str_id_wrong_kid else dict_id_kid[x]))
+
+    str_metrics_path = metrics.get_metrics_path(str_xml_folder_path)
+    os.replace(str_metrics_path, str_metrics_path + '.{}'.format(
+        datetime.datetime.now().strftime('%Y%m%d%H%M%S')))
+    n_detail_pages = mock.get_dict_stats(dict_mock)['endpoints']['visualizacv.do']['requests']
+
+    process = subprocess.run(lst_command + ['--refresh', str_dados_gerais_path,
+                                            '--kid-cache', str_journal_path],
+                             cwd=STR_SCRIPTS_PATH, env=dict_env, check=True,
+                             stdout=subprocess.PIPE, text=True)
+    server.shutdown()
+    print(''.join(x + '\n' for x in process.stdout.splitlines() if x.startswith('refresh:')),
+          end='')
+
+    set_ids_downloaded = get_set_ids_downloaded(str_metrics_path) & set(lst_ids)
+    n_detail_pages = mock.get_dict_stats(dict_mock)['endpoints']['visualizacv.do']['requests'] - \
+        n_detail_pages
+
+    print('baixados de novo: {} de {} esperados, {} inesperados, {} de {} paginas '
+          'visualizacv.do'.format(len(set_ids_downloaded & set_ids_expected),
+                                  len(set_ids_expected), len(set_ids_downloaded - set_ids_expected),
+                                  n_detail_pages, n_detail_pages_expected))
+
+    sys.exit(0 if set_ids_downloaded == set_ids_expected and
+             n_detail_pages == n_detail_pages_expected else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 26 14:37:20 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import collections
+import csv
+import os
+import subprocess
+import sys
+from threading import Thread
+import time
+import benchmark_mock_cnpq as benchmark
+import mock_cnpq as mock
+import utils_download_manifest as manifest
+
+STR_SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# lines shown of the output of a shard process that failed
+N_LOG_LINES = 20
+
+LST_PARSE_FILES = ['lattes_producao.csv', 'lattes_dados_gerais.csv', 'lattes_formacao.csv',
+                   'id_lattes_to_disambiguate.csv', 'lattes_producao_item.csv',
+                   'lattes_producao_cv.csv']
+
+
+def exit_on_shard_failure(lst_returncodes, lst_log_paths):
+    """
+    Show the end of the log of each shard process that failed and exit with
+    status 1, before the files of the shards are read.
+
+    Args:
+        lst_returncodes (list): The exit status of each process, as returned
+            by run_shards.
+        lst_log_paths (list): The output file of each process.
+    """
+    if not any(lst_returncodes):
+        return
+
+    for n_shard, (n_returncode, str_log_path) in enumerate(zip(lst_returncodes, lst_log_paths),
+                                                           start=1):
+        if n_returncode:
+            with open(str_log_path, encoding='utf-8', errors='replace') as file_log:
+                lst_lines = file_log.read().splitlines()
+            print('shard {}/{}: saida {}, {}'.format(n_shard, len(lst_returncodes), n_returncode,
+                                                     str_log_path))
+            print(''.join('    {}\n'.format(x) for x in lst_lines[-N_LOG_LINES:]), end='')
+
+    sys.exit(1)
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+
+    It expects one positional argument:
+        - output_folder (str): An empty folder for the files of the check.
+    And accepts the options of the mock server (see mock_cnpq.add_args_mock)
+    and:
+        - --shards (int): The number of shard processes.
+        - --names (int): The number of names whose IDs are downloaded.
+    """
+    parser = argparse.ArgumentParser(description='Verifica o --shard do download e '
+                                     'do parse com processos locais.')
+    parser.add_argument('output_folder', metavar='output_path', type=str,
+                        help='pasta vazia onde serao gravados os arquivos da verificacao')
+    parser.add_argument('--shards', type=int, default=3,
+                        help='numero de shards executados em paralelo')
+    parser.add_argument('--names', type=int, default=60,
+                        help='numero de nomes cujos IDs sao baixados')
+    mock.add_args_mock(parser)
+
+    return parser.parse_args()
+
+
+def get_counter_rows(str_csv_path):
+    """
+    Get the rows of a CSV file as a multiset, ignoring the order of the rows
+    and of the columns, and the empty values.
+    """
+    with open(str_csv_path, newline='', encoding='utf-8') as file_csv:
+        return collections.Counter(tuple(sorted((x, y) for x, y in dict_row.items() if y))
+                                   for dict_row in csv.DictReader(file_csv))
+
+
+def get_n_manifest_rows(str_download_folder_path):
+    """
+    Count the IDs in the download manifest of a folder, whatever their status.
+    """
+    return sum(n_count for _, _, n_count in manifest.get_lst_summary(
+        manifest.get_manifest_path(str_download_folder_path), 1))
+
+
+def run_shards(lst_command, n_shards, str_cwd, dict_env, str_log_folder_path):
+    """
+    Run a stage script once per shard, all at the same time.
+
+    Args:
+        lst_command (list): The script and its arguments, without --shard.
+        n_shards (int): The number of shards.
+        str_cwd (str): The working folder of the processes.
+        dict_env (dict): The environment of the processes.
+        str_log_folder_path (str): The folder of the output of each process,
+            '<script>.shard_<i>_of_<N>.log'.
+
+    Returns:
+        tuple: The wall time in seconds, the exit status of each process and
+        the path of its output.
+    """
+    time_start = time.monotonic()
+    lst_log_paths = [os.path.join(str_log_folder_path, '{}.shard_{}_of_{}.log'.format(
+        os.path.splitext(lst_command[0])[0], n_shard, n_shards))
+                     for n_shard in range(1, n_shards + 1)]
+    lst_command = [sys.executable, os.path.join(STR_SCRIPTS_PATH, lst_command[0])] + \
+        lst_command[1:]
+
+    lst_processes = []
+    for n_shard, str_log_path in enumerate(lst_log_paths, start=1):
+        with open(str_log_path, mode='w', encoding='utf-8') as file_log:
+            lst_processes.append(subprocess.Popen(
+                lst_command + ['--shard', '{}/{}'.format(n_shard, n_shards)], cwd=str_cwd,
+                env=dict_env, stdout=file_log, stderr=subprocess.STDOUT))
+
+    lst_returncodes = [x.wait() for x in lst_processes]
+
+    return time.monotonic() - time_start, lst_returncodes, lst_log_paths
+
+
+def main():
+    """
+    Check the sharding of the download and of the parse on this machine.
+
+    Starts the mock of CNPq (see benchmark_mock_cnpq), downloads the IDs of
+    --names names with --shards download processes at the same time and
+    reduces them, checking that each ID was handled by exactly one shard and
+    that the reduced manifest and zip files cover the list. Then parses the
+    zip files once without --shard and once with --shards processes, reduces
+    the CSV files of the shards and checks that they hold the same rows as
+    the unsharded run, in the 'full' and 'sharded' subfolders. The output of
+    each shard process goes to a log file in the output folder; if one fails,
+    the end of its log is shown before any file of the shards is read. Exits
+    with status 1 if a shard process or any check fails.
+
+    Example:
+        $ python check_shards.py /tmp/shards --shards 4 --error-rate 0.05
+        download: 3 shards em 12.4s, 187 IDs, 187 no manifesto, 181 zip
+        parse: 3.1s sem shard, 2.2s com 3 shards
+        lattes_producao.csv: 53120 linhas ok
+        ...
+    """
+    args = get_args()
+    str_output_path = os.path.abspath(args.output_folder)
+    str_xml_folder_path = os.path.join(str_output_path, 'xml_lattes')
+    str_ids_path = os.path.join(str_output_path, 'idlattes_to_download.csv')
+
+    for str_folder in ['xml_lattes', 'full', 'sharded']:
+        os.makedirs(os.path.join(str_output_path, str_folder), exist_ok=True)
+
+    dict_mock = mock.get_dict_mock(args)
+    server = mock.get_server(dict_mock, '127.0.0.1', 0)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    dict_env = dict(os.environ, LATTES_BASE_URL='http://{}:{}'.format(*server.server_address),
+                    LATTES_FAKE_CAPTCHA='1')
+
+    set_ids = set()
+    with open(str_ids_path, mode='w', encoding='utf-8') as file_ids:
+        for str_name in benchmark.get_lst_names(args.names):
+            for str_k_id, _, _ in mock.get_lst_hits(dict_mock, str_name):
+                set_ids.add(mock.get_id_lattes(str_k_id))
+                file_ids.write(mock.get_id_lattes(str_k_id) + '\n')
+
+    float_seconds, lst_returncodes, lst_log_paths = run_shards(
+        ['download_xml_lattes.py', str_ids_path, str_xml_folder_path, '--rate', '50'],
+        args.shards, STR_SCRIPTS_PATH, dict_env, str_output_path)
+    server.shutdown()
+    exit_on_shard_failure(lst_returncodes, lst_log_paths)
+
+    lst_n_shard_rows = [get_n_manifest_rows(os.path.join(
+        str_xml_folder_path, 'shard_{}_of_{}'.format(n_shard, args.shards)))
+                        for n_shard in range(1, args.shards + 1)]
+
+    subprocess.run([sys.executable, os.path.join(STR_SCRIPTS_PATH, 'reduce_shards.py'),
+                    str_xml_folder_path], check=True, stdout=subprocess.DEVNULL)
+
+    set_ids_ok = set(manifest.get_lst_ids_ok(manifest.get_manifest_path(str_xml_folder_path)))
+    n_manifest = get_n_manifest_rows(str_xml_folder_path)
+    set_zip_ids = {x.split('.')[0] for x in os.listdir(str_xml_folder_path)
+                   if x.endswith('.zip')}
+
+    print('download: {} shards em {:.1f}s (saida {}), {} IDs, {} no manifesto, {} zip'.format(
+        args.shards, float_seconds, lst_returncodes, len(set_ids), n_manifest,
+        len(set_zip_ids)))
+
+    b_ok = sum(lst_n_shard_rows) == n_manifest == len(set_ids) and set_ids_ok == set_zip_ids
+
+    time_start = time.monotonic()
+    subprocess.run([sys.executable, os.path.join(STR_SCRIPTS_PATH, 'parse_xml_lattes.py'),
+                    str_xml_folder_path, os.path.join(str_output_path, 'full')],
+                   check=True, stdout=subprocess.DEVNULL)
+    float_seconds_full = time.monotonic() - time_start
+
+    str_sharded_path = os.path.join(str_output_path, 'sharded')
+    float_seconds, lst_returncodes, lst_log_paths = run_shards(
+        ['parse_xml_lattes.py', str_xml_folder_path, str_sharded_path],
+        args.shards, STR_SCRIPTS_PATH, dict_env, str_output_path)
+    exit_on_shard_failure(lst_returncodes, lst_log_paths)
+    subprocess.run([sys.executable, os.path.join(STR_SCRIPTS_PATH, 'reduce_shards.py'),
+                    str_sharded_path], check=True, stdout=subprocess.DEVNULL)
+
+    print('parse: {:.1f}s sem shard, {:.1f}s com {} shards (saida {})'.format(
+        float_seconds_full, float_seconds, args.shards, lst_returncodes))
+
+    for str_file_name in LST_PARSE_FILES:
+        counter_full = get_counter_rows(os.path.join(str_output_path, 'full', str_file_name))
+        counter_sharded = get_counter_rows(os.path.join(str_sharded_path, str_file_name))
+        b_same = counter_full == counter_sharded
+        print('{}: {} linhas {}'.format(str_file_name, sum(counter_full.values()),
+                                        'ok' if b_same else 'DIFERENTE ({} com shards)'.format(
+                                            sum(counter_sharded.values()))))
+        b_ok = b_ok and b_same
+
+    sys.exit(0 if b_ok else 1)
+
+if __name__ == "__main__":
+    main()
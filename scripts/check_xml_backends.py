@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 30 16:20:48 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import filecmp
+import glob
+import os
+import sys
+import time
+import zipfile
+import mock_cnpq as mock
+import parse_xml_lattes as parse
+import utils_xml as xml_backend
+
+# CVs written by hand for the cases the generated ones do not have, encoded
+# in ISO-8859-1 as the real files
+STR_FIXTURE_HEADER = '<?xml version="1.0" encoding="ISO-8859-1" ?>'
+
+DICT_FIXTURES = {
+    # accented letters as raw ISO-8859-1 bytes and as character references,
+    # and the predefined entities
+    '9000000000000001': (
+        STR_FIXTURE_HEADER +
+        '<CURRICULO-VITAE NUMERO-IDENTIFICADOR="9000000000000001" DATA-ATUALIZACAO="01022020">'
+        '<DADOS-GERAIS NOME-COMPLETO="João Conceição &amp; Ara&#250;jo">'
+        '<FORMACAO-ACADEMICA-TITULACAO><DOUTORADO NOME-INSTITUICAO="Universidade '
+        'Estadual Paulista J&#250;lio de Mesquita Filho" ANO-DE-OBTENCAO-DO-TITULO="2001"/>'
+        '</FORMACAO-ACADEMICA-TITULACAO></DADOS-GERAIS>'
+        '<PRODUCAO-BIBLIOGRAFICA><ARTIGOS-PUBLICADOS><ARTIGO-PUBLICADO>'
+        '<DADOS-BASICOS-DO-ARTIGO NATUREZA="COMPLETO" TITULO-DO-ARTIGO="Análise '
+        '&lt;in vitro&gt; de &quot;proteínas&quot;" ANO-DO-ARTIGO="2019" DOI=""/>'
+        '<DETALHAMENTO-DO-ARTIGO TITULO-DO-PERIODICO-OU-REVISTA="Revista '
+        'Brasileira de Gen&#233;tica" ISSN="1234-567X"/>'
+        '<AUTORES NOME-COMPLETO-DO-AUTOR="João Araújo" ORDEM-DE-AUTORIA="1"/>'
+        '</ARTIGO-PUBLICADO></ARTIGOS-PUBLICADOS></PRODUCAO-BIBLIOGRAFICA>'
+        '</CURRICULO-VITAE>').encode('iso-8859-1'),
+    # comments, processing instructions, whitespace and line breaks between
+    # the elements and inside the attributes
+    '9000000000000002': (
+        STR_FIXTURE_HEADER +
+        '<!-- gerado pelo Lattes -->\n'
+        '<CURRICULO-VITAE NUMERO-IDENTIFICADOR="9000000000000002">\n'
+        '  <DADOS-GERAIS NOME-COMPLETO="Maria\nda  Silva"><?lattes versao="1"?>\n'
+        '  </DADOS-GERAIS>\n'
+        '  <PRODUCAO-BIBLIOGRAFICA><ARTIGOS-PUBLICADOS>\n'
+        '    <ARTIGO-PUBLICADO><!-- sem detalhamento -->\n'
+        '      <DADOS-BASICOS-DO-ARTIGO TITULO-DO-ARTIGO="Estudo&#10;em duas linhas" '
+        'ANO-DO-ARTIGO="2020" DOI="https://doi.org/10.1590/ABC.2020"/>\n'
+        '    </ARTIGO-PUBLICADO>\n'
+        '  </ARTIGOS-PUBLICADOS></PRODUCAO-BIBLIOGRAFICA>\n'
+        '</CURRICULO-VITAE>\n').encode('iso-8859-1'),
+    # a CV without productions nor doctorate
+    '9000000000000003': (
+        STR_FIXTURE_HEADER +
+        '<CURRICULO-VITAE NUMERO-IDENTIFICADOR="9000000000000003">'
+        '<DADOS-GERAIS NOME-COMPLETO="Pedro Lima"><FORMACAO-ACADEMICA-TITULACAO>'
+        '<GRADUACAO NOME-INSTITUICAO="Universidade de São Paulo"/>'
+        '</FORMACAO-ACADEMICA-TITULACAO></DADOS-GERAIS></CURRICULO-VITAE>').encode('iso-8859-1'),
+    # an empty CV, as returned for a removed ID
+    '9000000000000004': (STR_FIXTURE_HEADER + '<CURRICULO-VITAE/>').encode('iso-8859-1'),
+    # a truncated download, which neither backend parses
+    '9000000000000005': (
+        STR_FIXTURE_HEADER +
+        '<CURRICULO-VITAE NUMERO-IDENTIFICADOR="9000000000000005"><DADOS-GERAIS '
+        'NOME-COMPLETO="Ana').encode('iso-8859-1'),
+}
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+
+    It expects one positional argument:
+        - output_folder (str): A folder for the CSV files of each backend.
+    And accepts the following options:
+        - --input-folder (str): A folder of zip files downloaded from CNPq.
+        - --cvs (int): The number of CVs generated when there is no input folder.
+        - --size (int): The approximate size, in bytes, of each generated CV.
+        - --repeat (int): The number of timed runs of each backend.
+    """
+    parser = argparse.ArgumentParser(description='Verifica que os backends XML do parse '
+                                     'geram os mesmos arquivos csv e compara seus tempos.')
+    parser.add_argument('output_folder', metavar='output_path', type=str,
+                        help='pasta onde serao gravados os arquivos csv de cada backend')
+    parser.add_argument('--input-folder', type=str, default=None,
+                        help='pasta com arquivos zip baixados do CNPq. Padrao: '
+                        'curriculos gerados pelo mock_cnpq')
+    parser.add_argument('--cvs', type=int, default=200,
+                        help='numero de curriculos gerados quando nao ha pasta de entrada')
+    parser.add_argument('--size', type=int, default=100000,
+                        help='tamanho aproximado, em bytes, de cada curriculo gerado')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='numero de execucoes cronometradas de cada backend')
+
+    return parser.parse_args()
+
+
+def get_lst_cvs(args):
+    """
+    Get the CVs of the check, the fixtures of DICT_FIXTURES included.
+
+    Returns:
+        list: Tuples (CNPq ID, bytes of curriculo.xml).
+    """
+    if args.input_folder:
+        lst_cvs = []
+        for str_zip_file_name in sorted(glob.glob(os.path.join(args.input_folder, '*.zip'))):
+            with zipfile.ZipFile(str_zip_file_name) as lattes_zip:
+                lst_cvs.append((os.path.basename(str_zip_file_name).split('.')[0],
+                                lattes_zip.read('curriculo.xml')))
+    else:
+        lst_cvs = [(str(x).zfill(16), mock.get_cv_xml(str(x).zfill(16), args.size))
+                   for x in range(1, args.cvs + 1)]
+
+    return lst_cvs + list(DICT_FIXTURES.items())
+
+
+def parse_lst_cvs(lst_cvs):
+    """
+    Parse CVs with the backend of utils_xml, as parse_zip_cv does.
+
+    Args:
+        lst_cvs (list): Tuples (CNPq ID, bytes of curriculo.xml).
+
+    Returns:
+        tuple: The lists returned by parse_root, one per CV, the seconds spent
+        by the XML parser and the seconds spent extracting the attributes.
+    """
+    lst_lattes = []
+    float_parse = 0.0
+    float_extract = 0.0
+    for str_id, bytes_xml in lst_cvs:
+        time_start = time.perf_counter()
+        try:
+            root = xml_backend.parse_bytes(bytes_xml)
+        except Exception:
+            root = None
+        time_parsed = time.perf_counter()
+        lst_lattes.append(parse.parse_root(str_id, root))
+        float_parse += time_parsed - time_start
+        float_extract += time.perf_counter() - time_parsed
+
+    return lst_lattes, float_parse, float_extract
+
+
+def main():
+    """
+    Check that the XML backends of the parse give the same CSV files, and
+    compare their speed.
+
+    Parses the CVs, the zip files of --input-folder or --cvs CVs generated by
+    mock_cnpq, plus the fixtures of DICT_FIXTURES, in this process with each
+    backend of utils_xml. Checks that both return the same values for every
+    CV and write byte-identical CSV files, in a subfolder of the output
+    folder per backend, and prints the best of --repeat runs of the XML
+    parser and of the extraction of the attributes. Without lxml only the
+    etree backend runs. Exits with status 1 if any check fails.
+
+    Example:
+        $ python check_xml_backends.py /tmp/xml_backends --cvs 500
+        205 curriculos, 20.4 MB
+        etree: parse 1.52s, extracao 0.98s, total 2.50s
+        lxml: parse 0.97s, extracao 1.37s, total 2.34s (1.07x)
+        valores ok
+        lattes_producao.csv: ok
+        ...
+    """
+    args = get_args()
+    lst_cvs = get_lst_cvs(args)
+    print('{} curriculos, {:.1f} MB'.format(len(lst_cvs),
+                                            sum(len(x[1]) for x in lst_cvs) / 1e6))
+
+    lst_backends = xml_backend.LST_BACKENDS if xml_backend.lxml_etree is not None else ['etree']
+    if len(lst_backends) == 1:
+        print('lxml nao instalado: apenas o backend etree sera executado')
+
+    dict_lattes = dict()
+    dict_seconds = dict()
+    for str_backend in reversed(lst_backends):
+        xml_backend.set_backend(str_backend)
+        float_parse, float_extract = float('inf'), float('inf')
+        for _ in range(max(1, args.repeat)):
+            lst_lattes, float_run_parse, float_run_extract = parse_lst_cvs(lst_cvs)
+            float_parse = min(float_parse, float_run_parse)
+            float_extract = min(float_extract, float_run_extract)
+        dict_lattes[str_backend] = lst_lattes
+        dict_seconds[str_backend] = float_parse + float_extract
+
+        str_speedup = ''
+        if str_backend != 'etree':
+            str_speedup = ' ({:.2f}x)'.format(dict_seconds['etree'] / dict_seconds[str_backend])
+        print('{}: parse {:.2f}s, extracao {:.2f}s, total {:.2f}s{}'.format(
+            str_backend, float_parse, float_extract, dict_seconds[str_backend], str_speedup))
+
+        str_output_path = os.path.join(args.output_folder, str_backend, '')
+        os.makedirs(str_output_path, exist_ok=True)
+        parse.save_lst_lattes(lst_lattes, str_output_path)
+
+    b_ok = True
+    if len(lst_backends) > 1:
+        lst_ids = [str_id for (str_id, _), lst_etree, lst_lxml in zip(
+            lst_cvs, dict_lattes['etree'], dict_lattes['lxml']) if lst_etree != lst_lxml]
+        print('valores ok' if not lst_ids else
+              'valores DIFERENTES em {} curriculos: {}'.format(len(lst_ids), ', '.join(lst_ids)))
+        b_ok = not lst_ids
+
+        for str_file_name in sorted(os.listdir(os.path.join(args.output_folder, 'etree'))):
+            b_same = filecmp.cmp(os.path.join(args.output_folder, 'etree', str_file_name),
+                                 os.path.join(args.output_folder, 'lxml', str_file_name),
+                                 shallow=False)
+            print('{}: {}'.format(str_file_name, 'ok' if b_same else 'DIFERENTE'))
+            b_ok = b_ok and b_same
+
+    sys.exit(0 if b_ok else 1)
+
+if __name__ == "__main__":
+    main()
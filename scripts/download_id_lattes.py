@@ -8,50 +8,82 @@ Created on Mon Oct 17 08:50:07 2022
 
 import argparse
 import datetime
-import glob
-from threading import Thread
+import html
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
 import re
 import time
 import os
+import unicodedata
+from requests.adapters import HTTPAdapter
+import requests
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
 import pandas as pd
+import utils_args as cli_args
 import utils_lattes_cnpq as util
+import utils_profile as profile
+import utils_rate_control as rate
+import utils_search_journal as journal
+import utils_shard as shard
 
 
 B_HEADLESS = True
 
+URL_PREVIEW = util.URL_BASE + '/buscatextual/preview.do?metodo=apresentar&id={}'
+URL_DETAIL = util.URL_BASE + '/buscatextual/visualizacv.do?id={}'
+TIMEOUT_REQUEST = (10, 60)
 
-def download_idcnpq_by_lst_id_names(str_thread_index, str_download_folder_path,
-                                    lst_id_names):
+# CAPES columns compared with the snippet of each search hit, when present
+LST_COLS_CONTEXT = ['NM_IES_TITULACAO', 'AN_TITULACAO', 'NM_ENTIDADE_ENSINO',
+                    'SG_ENTIDADE_ENSINO', 'NM_AREA_AVALIACAO', 'NM_AREA_CONHECIMENTO']
+
+SET_STOPWORDS = {'com', 'das', 'dos', 'para', 'pela', 'pelo', 'and', 'the'}
+
+
+def download_idcnpq_by_lst_id_names(str_thread_index, str_journal_path,
+                                    lst_id_names, dict_search):
     """
-    Downloads CNPQ IDs by names from the CNPQ website and saves them to text files.
+    Downloads CNPQ IDs by names from the CNPQ website and saves them to the search journal.
 
     This function iterates through a list of ID-name pairs, searches for each
     name on the CNPQ website,
-    retrieves CNPQ IDs associated with the names, and saves them to text files
-    in the specified folder.
+    retrieves CNPQ IDs associated with the names, and appends them to the
+    search journal.
 
     Args:
         str_thread_index (str): The index of the current thread.
-        str_download_folder_path (str): Path to the folder where files will be downloaded.
-        lst_id_names (list): A list of tuples containing CNPQ ID and name pairs.
+        str_journal_path (str): Path to the search journal file.
+        lst_id_names (list): A list of tuples containing a list of CAPES IDs
+        and the name they share.
+        dict_search (dict): Resources shared by all threads, as returned by
+        get_dict_search.
 
     Returns:
         None
 
+    Each name is searched once and its results are written for every CAPES ID
+    that shares it. Errors are classified by the rate control, which backs off according to
+    the error class and may pause every thread when CNPq is failing.
+    The time spent on each name is appended to dict_search['lst_latency'].
+    When dict_search['on_result'] is set, it is called with the CAPES IDs and
+    the hits of each name once they are in the journal.
+
     Example:
-        >>> download_idcnpq_by_lst_id_names('1', '/path/to/downloads',
-        [('123', 'John Doe'), ('456', 'Jane Smith')])
+        >>> download_idcnpq_by_lst_id_names('1', '/path/to/downloads/search_journal.sqlite',
+        [(['123', '789'], 'john doe'), (['456'], 'jane smith')],
+        get_dict_search('/path/to/downloads/search_journal.sqlite', 5.0, 3, 8))
     """
+    rate_control = dict_search['rate_control']
 
     browser = None
     n_error_count = 0
 
     while lst_id_names:
+        n_probe = None
         try:
             if browser:
                 del browser
@@ -61,24 +93,36 @@ def download_idcnpq_by_lst_id_names(str_thread_index, str_download_folder_path,
             wait_browser = WebDriverWait(browser, 60)
 
             while lst_id_names:
-                str_id, str_name = lst_id_names.pop(0)
+                lst_id, str_name = lst_id_names.pop(0)
 
-                lst_idcnpq = get_lst_idcnpq_by_name(browser, wait_browser, str_name)
+                time_start = time.time()
+                n_probe = rate_control.acquire()
+                lst_idcnpq = get_lst_idcnpq_by_name(browser, wait_browser,
+                                                    str_name, dict_search, n_probe)
+                rate_control.record_success(n_probe)
+                n_probe = None
+                dict_search['lst_latency'].append((str_name, len(lst_idcnpq),
+                                                   time.time() - time_start))
 
                 if not lst_idcnpq:
                     continue
 
-                with open('{}/{}.txt'.format(str_download_folder_path, str(str_id)),
-                          'w') as file:
-                    file.write('\n'.join(lst_idcnpq))
+                journal.write_search_result(str_journal_path, lst_id, lst_idcnpq)
+
+                if dict_search['on_result']:
+                    dict_search['on_result'](lst_id, lst_idcnpq)
         except KeyboardInterrupt:
             return
         except Exception as excpt:
             n_error_count += 1
+            str_error_class, float_delay = rate_control.record_failure(excpt, n_probe)
             print('')
-            print('Error count thread {}: {}'.format(str_thread_index, str(n_error_count)))
+            print('Error count thread {}: {} ({}, backoff {:.0f}s)'.format(str_thread_index,
+                                                                       str(n_error_count),
+                                                                       str_error_class,
+                                                                       float_delay))
             print(excpt)
-            time.sleep(30)
+            time.sleep(float_delay)
 
     if browser:
         browser.close()
@@ -93,7 +137,13 @@ def get_args():
     It expects two arguments:
     - input_file: The name of the Excel file to be processed. It should point to an Excel
       file downloaded from the CAPES website, containing the variables ID_PESSOA and NM_DOCENTE.
-    - output_folder: The path where the resulting text files will be saved.
+    - output_folder: The path where the search journal and the resulting CSV
+      files will be saved.
+    And accepts the options:
+    - --rate: The maximum number of requests per second sent to CNPq.
+    - --preview-workers: The number of preview pages fetched concurrently.
+    - --kid-cache: The journal holding the K-id cache, to share it between runs.
+    - --min-score: The minimum snippet score of a homonym hit to be downloaded.
 
     Returns:
         argparse.Namespace: An object containing the parsed command-line arguments.
@@ -109,14 +159,7 @@ def get_args():
         '/path/to/output_folder'
     """
     parser = argparse.ArgumentParser(description='Arquivo de IDs para processar')
-
-    parser.add_argument('input_file', metavar='content_file', type=str,
-                        help='nome do arquivo a ser processado. Deve apontar '
-                        'para um arquivo Excel baixado do site da Capes. O '
-                        'arquivo deve conter as variaves ID_PESSOA e NM_DOCENTE')
-
-    parser.add_argument('output_folder', metavar='output_path', type=str,
-                        help='caminho onde serao gravados os arquivos txt')
+    cli_args.add_args_search(parser)
 
     return parser.parse_args()
 
@@ -146,7 +189,7 @@ def get_browser():
     chrome_options.add_argument('--no-sandbox')
     chrome_options.add_argument('--disable-gpu')
     chrome_options.add_argument('disable-blink-features=AutomationControlled')
-    chrome_options.add_argument('user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.72 Safari/537.36')
+    chrome_options.add_argument('user-agent={}'.format(util.USER_AGENT))
 
     if B_HEADLESS:
         chrome_options.add_argument('headless')
@@ -154,101 +197,134 @@ def get_browser():
     return webdriver.Chrome(options=chrome_options)
 
 
-def get_lst_capes_to_download(df_capes,
-                              str_download_folder_path):
+def get_dict_search(str_kid_cache_path, float_rate, n_threads_count, n_preview_workers):
     """
-    Retrieves a list of CAPES IDs to download based on the provided DataFrame
-    and download folder path.
-
-    This function takes a DataFrame containing CAPES data and a path to the folder
-    where files are downloaded.
-    It extracts the 'ID_PESSOA' column from the DataFrame and compares it with
-    the list of downloaded files.
-    It then returns a list of CAPES IDs that have not been downloaded yet,
-    sorted in ascending order.
+    Creates the resources shared by every search thread.
 
     Args:
-        df_capes (pandas.DataFrame): DataFrame containing CAPES data with 'ID_PESSOA' column.
-        str_download_folder_path (str): Path to the folder where files are downloaded.
+        str_kid_cache_path (str): Path to the journal file that holds the
+        K-id cache, usually the search journal itself.
+        float_rate (float): Maximum number of requests per second sent to CNPq.
+        n_threads_count (int): Number of browser threads, used as the allowed burst.
+        n_preview_workers (int): Size of the pool that fetches preview pages.
 
     Returns:
-        list: A sorted list of CAPES IDs to download.
+        dict: A dictionary with the keys 'rate_control' (RateControl shared by
+        all requests), 'executor' (ThreadPoolExecutor for preview pages),
+        'session' (requests.Session with a connection pool of the same size),
+        'lst_latency' (list of (name, number of hits, seconds) tuples),
+        'str_kid_cache_path', 'dict_kid_cache' (K-id to CNPQ ID mappings loaded
+        from the journal), 'dict_kid_stats' (cache hit and miss counters),
+        'lock' (guards the cache and its counters) and 'on_result' (None, or a
+        function called with the CAPES IDs and the hits of every name searched).
 
     Example:
-        >>> df_capes = pd.DataFrame({'ID_PESSOA': [123, 456, 789]})
-        >>> downloaded_files = ['/path/to/downloads/123.txt', '/path/to/downloads/789.txt']
-        >>> lst_to_download = get_lst_capes_to_download(df_capes, '/path/to/downloads')
-        >>> print(lst_to_download)
-        [(123,), (456,)]
+        >>> dict_search = get_dict_search('/path/to/downloads/search_journal.sqlite', 5.0, 3, 8)
     """
+    session = requests.Session()
+    session.headers['User-Agent'] = util.USER_AGENT
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=n_preview_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return {'rate_control': rate.RateControl(float_rate, n_threads_count),
+            'executor': ThreadPoolExecutor(max_workers=n_preview_workers),
+            'session': session,
+            'lst_latency': [],
+            'str_kid_cache_path': str_kid_cache_path,
+            'dict_kid_cache': journal.get_dict_kid_cache(str_kid_cache_path),
+            'dict_kid_stats': {'hit': 0, 'miss': 0},
+            'lock': Lock(),
+            'on_result': None}
 
-    lst_id_pessoa = list(df_capes['ID_PESSOA'])
-
-    lst_downloaded_files = get_lst_downloaded_files(str_download_folder_path)
-    lst_downloaded_files = [os.path.basename(x).split('.')[0] for x in lst_downloaded_files]
 
-    lst_diff = list(set(lst_id_pessoa) - set(lst_downloaded_files))
-    df_capes = df_capes[df_capes['ID_PESSOA'].isin(lst_diff)]
-
-    lst_return = df_capes.to_records(index=False).tolist()
-    lst_return.sort()
-
-    return lst_return
-
-
-def get_lst_downloaded_files(str_download_folder_path):
+def get_lst_capes_to_download(df_capes,
+                              str_journal_path):
     """
-    Retrieves a list of downloaded files with a .txt extension from the specified folder.
+    Retrieves a list of names to search, each with the CAPES IDs that share it,
+    based on the provided DataFrame and search journal.
+
+    This function takes a DataFrame containing CAPES data and the path to the
+    search journal.
+    It extracts the 'ID_PESSOA' column from the DataFrame and compares it with
+    the ID_PESSOA values already recorded in the journal.
+    The CAPES IDs not searched yet keep a single name, as returned by
+    get_df_capes_one_name, and are grouped by it, so a name that appears
+    under several ID_PESSOA values is searched only once and an ID_PESSOA
+    listed under several names is searched by only one of them.
+    It then returns the groups sorted in ascending order.
 
     Args:
-        str_download_folder_path (str): The path to the folder where downloaded files are stored.
+        df_capes (pandas.DataFrame): DataFrame containing CAPES data with
+        'ID_PESSOA' and 'NM_DOCENTE' columns.
+        str_journal_path (str): Path to the search journal file.
 
     Returns:
-        list: A list of file paths of the downloaded files with a .txt extension.
+        list: A sorted list of tuples (list of CAPES IDs, name) to search.
 
     Example:
-        >>> downloaded_files = get_lst_downloaded_files('/path/to/downloads')
-        >>> print(downloaded_files)
-        ['/path/to/downloads/file1.txt', '/path/to/downloads/file2.txt']
+        >>> df_capes = pd.DataFrame({'ID_PESSOA': ['123', '456', '789', '999'],
+        ...                          'NM_DOCENTE': ['john doe', 'jane smith', 'john  doe', 'ann lee']})
+        >>> # journal already holds results for 999
+        >>> lst_to_download = get_lst_capes_to_download(df_capes, '/path/to/search_journal.sqlite')
+        >>> print(lst_to_download)
+        [(['456'], 'jane smith'), (['123', '789'], 'john doe')]
     """
 
-    return glob.glob('{}/*.txt'.format(str_download_folder_path))
+    set_searched = journal.get_set_id_pessoa_searched(str_journal_path)
+
+    df_capes = get_df_capes_one_name(df_capes[~df_capes['ID_PESSOA'].isin(set_searched)])
 
+    sr_groups = df_capes.groupby('NM_DOCENTE')['ID_PESSOA'].unique()
 
-def get_lst_idcnpq_by_name(browser, wait_browser, str_name):
+    lst_return = [(sorted(lst_id), str_name) for str_name, lst_id in sr_groups.items()]
+    lst_return.sort(key=lambda x: x[1])
+
+    return lst_return
+
+
+def get_lst_idcnpq_by_name(browser, wait_browser, str_name, dict_search, n_probe=None):
     """
     Retrieves a list of CNPQ IDs by searching for a given name on the CNPQ website.
 
     This function uses a Selenium WebDriver instance to search for a given name on the CNPQ website.
-    It extracts CNPQ IDs and whether the person is a 'Bolsista' from the search results.
+    It extracts CNPQ IDs, whether the person is a 'Bolsista' and the snippet
+    shown under the name (institution, degrees, area) from the search results.
+    The K-ids of the results page are then resolved to 16-digit IDs: K-ids
+    already in the cache are used directly and the others are fetched
+    concurrently by the shared preview pool, without leaving the results page.
+    The caller waits for the rate control before the search, and records the
+    outcome of the search and of the previews it waits for.
 
     Args:
         browser (selenium.webdriver): WebDriver instance for browser automation.
         wait_browser (selenium.webdriver.support.ui.WebDriverWait): WebDriverWait
         instance for waiting in the browser.
         str_name (str): The name to search for on the CNPQ website.
+        dict_search (dict): Resources shared by all threads, as returned by
+        get_dict_search.
+        n_probe (int or None): The probe token returned by the rate control
+        for the search, passed on to the previews.
 
     Returns:
-        list: A list of CNPQ IDs and their corresponding 'Bolsista' status.
+        list: A list of tuples with the CNPQ IDs, their corresponding 'Bolsista'
+        status and the text of their snippet.
 
     Example:
         >>> from selenium import webdriver
         >>> from selenium.webdriver.support.ui import WebDriverWait
         >>> browser = webdriver.Chrome()
         >>> wait_browser = WebDriverWait(browser, 10)
-        >>> lst_idcnpq = get_lst_idcnpq_by_name(browser, wait_browser, 'John Doe')
+        >>> lst_idcnpq = get_lst_idcnpq_by_name(browser, wait_browser, 'John Doe',
+        ...                                     get_dict_search('search_journal.sqlite', 5.0, 3, 8))
         >>> print(lst_idcnpq)
-        ['1234567890123456,Bolsista de Produtividade', '9876543210987654,']
+        [('1234567890123456', 'Bolsista de Produtividade', 'Doutorado em Fisica pela USP'),
+         ('9876543210987654', '', 'Graduacao em Direito pela UFMG')]
     """
 
-    str_url_search = 'http://buscatextual.cnpq.br/buscatextual/busca.do'
-    str_url_preview = 'http://buscatextual.cnpq.br/buscatextual/preview.do?metodo=apresentar&id={}'
+    str_url_search = util.URL_BASE + '/buscatextual/busca.do'
 
-    regex_id_k = r"<li>[\s\S]*?javascript:abreDetalhe\('(.*?)','.*?',.*?,\)\"[\s\S]+?\"><br>(?:<span.*?(Bolsista de Produtividade.*?)<\/span>)?[\s\S]*?<\/li>"
-    regex_idcnpq_first_page = r"abrirLink\('http:.*?(\d{16})'\)"
-    regex_idcnpq_det_page = r'">(\d{16})</span>'
-
-    lst_idcnpq = []
+    regex_id_k = r"<li>[\s\S]*?javascript:abreDetalhe\('(.*?)','.*?',.*?,\)\"[\s\S]+?\"><br>(?:<span.*?(Bolsista de Produtividade.*?)<\/span>)?([\s\S]*?)<\/li>"
 
     browser.get(str_url_search)
 
@@ -260,27 +336,85 @@ def get_lst_idcnpq_by_name(browser, wait_browser, str_name):
                                                    'paginacao')))
 
     obj_match = re.findall(regex_id_k, browser.page_source)
+
+    lst_idcnpq = []
     for match_id_k in obj_match:
-        str_k_cnpq = match_id_k[0]
-        str_bolsista = match_id_k[1]
-        browser.get(str_url_preview.format(str_k_cnpq))
+        with dict_search['lock']:
+            str_idcnpq = dict_search['dict_kid_cache'].get(match_id_k[0])
+            dict_search['dict_kid_stats']['hit' if str_idcnpq else 'miss'] += 1
+
+        if not str_idcnpq:
+            str_idcnpq = dict_search['executor'].submit(get_idcnpq_by_id_k,
+                                                        dict_search,
+                                                        match_id_k[0], n_probe)
+        lst_idcnpq.append(str_idcnpq)
+
+    return [(x if isinstance(x, str) else x.result(), match_id_k[1],
+             get_snippet_text(match_id_k[2]))
+            for x, match_id_k in zip(lst_idcnpq, obj_match)]
+
+
+def get_idcnpq_by_id_k(dict_search, str_k_cnpq, n_probe_search=None):
+    """
+    Resolves the K-id of a search result to its 16-digit CNPQ ID.
+
+    Args:
+        dict_search (dict): Resources shared by all threads, as returned by
+        get_dict_search.
+        str_k_cnpq (str): The K-id found in the abreDetalhe link of the search results.
+        n_probe_search (int or None): The probe token of the search that found
+        the K-id, whose thread records the outcome.
+
+    Returns:
+        str: The 16-digit CNPQ ID.
+
+    The preview page is fetched first. When it does not show the ID, the full
+    CV page of the same K-id is fetched directly, which is the page the
+    'm-logo' link of the preview opens. The ID found is stored in the K-id
+    cache, both in memory and in the journal. The outcome is recorded here
+    only when the rate control makes this thread the probe of a half open
+    circuit, since the thread of the search records the others.
+
+    Raises:
+        IndexError: If neither page contains a 16-digit ID.
+
+    Example:
+        >>> get_idcnpq_by_id_k(get_dict_search('search_journal.sqlite', 5.0, 3, 8),
+        ...                    'K4723925J2')
+        '1234567890123456'
+    """
+    rate_control = dict_search['rate_control']
+    session = dict_search['session']
 
-        obj_match_idcnpq = re.findall(regex_idcnpq_first_page,
-                                      browser.page_source)
+    n_probe = n_probe_search
+    try:
+        n_probe = rate_control.acquire(n_probe)
+        response = session.get(URL_PREVIEW.format(str_k_cnpq), timeout=TIMEOUT_REQUEST)
+        response.raise_for_status()
+
+        obj_match_idcnpq = re.findall(util.REGEX_ID_LATTES_PREVIEW, response.text)
 
         if not obj_match_idcnpq:
-            browser.find_element(By.CLASS_NAME, 'm-logo').click()
-            wait_browser.until(ec.number_of_windows_to_be(2))
-            browser.switch_to.window(browser.window_handles[1])
+            n_probe = rate_control.acquire(n_probe)
+            response = session.get(URL_DETAIL.format(str_k_cnpq), timeout=TIMEOUT_REQUEST)
+            response.raise_for_status()
+
+            obj_match_idcnpq = re.findall(util.REGEX_ID_LATTES_DETAIL, response.text)
+
+        str_idcnpq = str(obj_match_idcnpq[0])
+    except Exception as excpt:
+        if n_probe not in (None, n_probe_search):
+            rate_control.record_failure(excpt, n_probe)
+        raise
+
+    if n_probe not in (None, n_probe_search):
+        rate_control.record_success(n_probe)
 
-            obj_match_idcnpq = re.findall(regex_idcnpq_det_page,
-                                          browser.page_source)
-            browser.close()
-            browser.switch_to.window(browser.window_handles[0])
+    journal.write_kid_cache(dict_search['str_kid_cache_path'], str_k_cnpq, str_idcnpq)
+    with dict_search['lock']:
+        dict_search['dict_kid_cache'][str_k_cnpq] = str_idcnpq
 
-        lst_idcnpq.append('{},{}'.format(str(obj_match_idcnpq[0]),
-                                         str_bolsista))
-    return lst_idcnpq
+    return str_idcnpq
 
 
 def get_df_capes(str_path_file_capes):
@@ -315,51 +449,312 @@ def get_df_capes(str_path_file_capes):
     return df_capes.loc[~df_capes.duplicated(),]
 
 
-def get_df_capes_lattes(str_download_folder_path):
+def get_df_capes_one_name(df_capes):
+    """
+    Keeps a single name, with its spaces normalized, for each ID_PESSOA.
+
+    The same ID_PESSOA may be listed under several names in the CAPES file,
+    e.g. with and without a last name. Searching it once per name would store
+    the same hits more than once, so only the first name listed is kept.
+
+    Args:
+        df_capes (pandas.DataFrame): DataFrame with 'ID_PESSOA' and
+        'NM_DOCENTE' columns, as returned by get_df_capes.
+
+    Returns:
+        pandas.DataFrame: One row per ID_PESSOA.
+
+    Example:
+        >>> df_capes = pd.DataFrame({'ID_PESSOA': ['1', '1', '2'],
+        ...                          'NM_DOCENTE': ['JOAO SILVA', 'JOAO SILVA SANTOS', 'ANA  LIMA']})
+        >>> get_df_capes_one_name(df_capes)
+          ID_PESSOA   NM_DOCENTE
+        0         1   JOAO SILVA
+        2         2    ANA LIMA
     """
-    Reads CAPES Lattes files from the specified folder and returns a DataFrame.
+    df_capes = df_capes.assign(NM_DOCENTE=df_capes['NM_DOCENTE'].astype(str).str.split()
+                               .str.join(' '))
+
+    return df_capes.drop_duplicates(subset='ID_PESSOA')
+
 
-    This function reads CAPES Lattes files from the specified folder and processes their content.
-    It extracts data such as 'ID_CNPQ', 'Bolsista', and 'ID_PESSOA' from each
-    file and creates a DataFrame.
+def get_n_names_merged(df_capes, lst_id_names):
+    """
+    Counts the searches saved by searching each ID_PESSOA by a single name.
+
+    Args:
+        df_capes (pandas.DataFrame): DataFrame with every name of each
+        ID_PESSOA, as returned by get_df_capes.
+        lst_id_names (list): The names to search, as returned by
+        get_lst_capes_to_download.
+
+    Returns:
+        int: The number of other names of the ID_PESSOA to search.
+
+    Example:
+        >>> get_n_names_merged(df_capes, [(['1'], 'JOAO SILVA')])
+        1
+    """
+    set_id = {x for lst_id, _ in lst_id_names for x in lst_id}
+    df_capes = df_capes[df_capes['ID_PESSOA'].isin(set_id)]
+    sr_name = df_capes['NM_DOCENTE'].astype(str).str.split().str.join(' ')
+
+    return len(set(zip(df_capes['ID_PESSOA'], sr_name))) - len(set_id)
+
+
+def get_df_capes_lattes(str_journal_path):
+    """
+    Reads the search results from the journal and returns a DataFrame.
+
+    This function queries the search journal for every stored result.
+    It extracts data such as 'ID_CNPQ', 'Bolsista', 'ID_PESSOA' and the
+    'Snippet' of the search hit and creates a DataFrame.
     Additionally, it identifies homonymous entries based on 'ID_PESSOA'.
 
     Args:
-        str_download_folder_path (str): Path to the folder containing CAPES Lattes files.
+        str_journal_path (str): Path to the search journal file.
 
     Returns:
-        pandas.DataFrame: A DataFrame containing extracted data from CAPES Lattes files.
+        pandas.DataFrame: A DataFrame containing the search results.
 
     Example:
-        >>> df_capes_lattes = get_df_capes_lattes('/path/to/downloads')
+        >>> df_capes_lattes = get_df_capes_lattes('/path/to/downloads/search_journal.sqlite')
         >>> print(df_capes_lattes.head())
-           ID_CNPQ  Bolsista ID_PESSOA  Homonimo
-        0  123456789     True    123456      False
+           ID_CNPQ  Bolsista ID_PESSOA  Homonimo                        Snippet
+        0  123456789     True    123456      False  Doutorado em Fisica pela USP
         1  987654321    False    789012      False
     """
-    lst_capes_lattes = get_lst_downloaded_files(str_download_folder_path)
-
-    lst_result = []
-    for file_path in lst_capes_lattes:
-        id_file = os.path.basename(file_path).split('.')[0]
-        if os.path.getsize(file_path):
-            with open(file_path, 'r') as file:
-                lst_content_file = [line.strip().split(',') + [id_file] for line in file]
-        else:
-            print('empty file: {}'.format(file_path))
-            lst_content_file = [['', '', id_file]]
-
-        lst_result.extend(lst_content_file)
+    lst_result = journal.get_lst_search_result(str_journal_path)
 
-    df_result = pd.DataFrame(lst_result)
-    df_result.columns = ['ID_CNPQ', 'Bolsista', 'ID_PESSOA']
+    df_result = pd.DataFrame(lst_result,
+                             columns=['ID_CNPQ', 'Bolsista', 'ID_PESSOA', 'Homonimo',
+                                      'Snippet'])
 
-    df_result['Homonimo'] = df_result['ID_PESSOA'].duplicated(keep=False)
+    df_result['Homonimo'] = df_result['Homonimo'].astype(bool)
     df_result['ID_CNPQ'] = df_result['ID_CNPQ'].astype(str)
 
     return df_result
 
 
+def get_df_capes_context(str_path_file_capes):
+    """
+    Reads the CAPES columns used to tell homonyms apart.
+
+    Args:
+        str_path_file_capes (str): The path to the CAPES Excel file.
+
+    Returns:
+        pandas.DataFrame: 'ID_PESSOA' and the columns of LST_COLS_CONTEXT present
+        in the file, as strings, with empty strings for missing values.
+
+    A CAPES ID_PESSOA may have one row per program, so the result may have
+    several rows per ID_PESSOA.
+
+    Example:
+        >>> get_df_capes_context('/path/to/capes_data.xlsx').head(1)
+          ID_PESSOA           NM_IES_TITULACAO AN_TITULACAO  ...
+        0    123456  UNIVERSIDADE DE SAO PAULO         2005  ...
+    """
+    df_context = pd.read_excel(str_path_file_capes,
+                               usecols=lambda x: x in ['ID_PESSOA'] + LST_COLS_CONTEXT,
+                               dtype=str)
+
+    return df_context.fillna('').drop_duplicates()
+
+
+def get_dict_context(df_context):
+    """
+    Splits the CAPES context of every ID_PESSOA into token sets.
+
+    Args:
+        df_context (pandas.DataFrame): The CAPES context, as returned by
+        get_df_capes_context.
+
+    Returns:
+        dict: A dictionary mapping each ID_PESSOA to one list per CAPES row,
+        holding the tokens of each context column, as expected by
+        get_homonym_score.
+
+    Example:
+        >>> get_dict_context(get_df_capes_context('/path/to/capes_data.xlsx'))['123456']
+        [[{'universidade', 'sao', 'paulo'}, {'2005'}]]
+    """
+    lst_cols = [x for x in LST_COLS_CONTEXT if x in df_context.columns]
+
+    dict_context = {}
+    for tpl_row in df_context.itertuples(index=False):
+        dict_row = tpl_row._asdict()
+        dict_context.setdefault(str(dict_row['ID_PESSOA']), []).append(
+            [get_set_tokens(dict_row[x]) for x in lst_cols])
+
+    return dict_context
+
+
+def get_homonym_score(set_snippet, lst_context):
+    """
+    Scores how well the snippet of a search hit matches a CAPES record.
+
+    Args:
+        set_snippet (set): The tokens of the snippet, as returned by get_set_tokens.
+        lst_context (list): One list of token sets per CAPES row of the
+        ID_PESSOA, one set per context column.
+
+    Returns:
+        float: For each CAPES row, the fraction of the tokens of each non-empty
+        column found in the snippet, averaged over the columns; the best row
+        is returned. 0.0 when there is nothing to compare.
+
+    Example:
+        >>> get_homonym_score({'doutorado', 'fisica', 'universidade', 'sao', 'paulo', '2005'},
+        ...                   [[{'universidade', 'sao', 'paulo'}, {'2005'}, {'ufmg'}]])
+        0.6666666666666666
+    """
+    float_score = 0.0
+
+    for lst_set_cols in lst_context:
+        lst_fractions = [len(x & set_snippet) / len(x) for x in lst_set_cols if x]
+        if lst_fractions:
+            float_score = max(float_score, sum(lst_fractions) / len(lst_fractions))
+
+    return float_score
+
+
+def get_lst_idcnpq_plausible(lst_id, lst_idcnpq, dict_context, float_min_score):
+    """
+    Selects the hits of a name worth downloading, as set_plausible_homonyms does.
+
+    Args:
+        lst_id (list): The CAPES IDs that share the name.
+        lst_idcnpq (list): The (ID_CNPQ, Bolsista, Snippet) hits of the name.
+        dict_context (dict): The CAPES context, as returned by get_dict_context.
+        float_min_score (float): The minimum score of a homonym hit.
+
+    Returns:
+        list: The CNPQ IDs of the plausible hits.
+
+    Used to filter the hits of each name while the search is still running.
+
+    Example:
+        >>> get_lst_idcnpq_plausible(['123'], [('1234567890123456', '', 'Doutorado pela USP'),
+        ...                                    ('9876543210987654', '', 'Graduacao em Direito')],
+        ...                          {'123': [[{'usp'}]]}, 0.5)
+        ['1234567890123456']
+    """
+    if len(lst_idcnpq) <= 1:
+        return [x[0] for x in lst_idcnpq]
+
+    lst_scores = [max([get_homonym_score(get_set_tokens(x[2]), dict_context.get(str(y), []))
+                       for y in lst_id])
+                  for x in lst_idcnpq]
+
+    return [x[0] for x, float_score in zip(lst_idcnpq, lst_scores)
+            if not x[2] or float_score >= float_min_score or float_score == max(lst_scores)]
+
+
+def get_set_tokens(str_text):
+    """
+    Splits a text into a set of lowercase tokens without accents.
+
+    Args:
+        str_text (str): The text to be split.
+
+    Returns:
+        set: The tokens with three or more letters or digits, except stopwords.
+
+    Example:
+        >>> get_set_tokens('Doutorado em Física pela Universidade de São Paulo (2005)')
+        {'doutorado', 'fisica', 'universidade', 'sao', 'paulo', '2005'}
+    """
+    str_text = unicodedata.normalize('NFKD', str(str_text)).encode('ascii', 'ignore').decode()
+
+    return {x for x in re.findall(r'[a-z0-9]+', str_text.lower())
+            if len(x) >= 3 and x not in SET_STOPWORDS}
+
+
+def get_snippet_text(str_html):
+    """
+    Converts the HTML of a search hit snippet into plain text.
+
+    Args:
+        str_html (str): The HTML found after the name in the search result.
+
+    Returns:
+        str: The text, without tags and with single spaces.
+
+    Example:
+        >>> get_snippet_text('<br>Doutorado em F&iacute;sica pela <b>USP</b>')
+        'Doutorado em Física pela USP'
+    """
+    return ' '.join(html.unescape(re.sub(r'<[^>]+>', ' ', str_html)).split())
+
+
+def set_plausible_homonyms(df_capes_lattes, df_context, float_min_score):
+    """
+    Scores the search hits and flags the ones worth downloading.
+
+    Args:
+        df_capes_lattes (pandas.DataFrame): The search results, as returned by
+        get_df_capes_lattes.
+        df_context (pandas.DataFrame): The CAPES context, as returned by
+        get_df_capes_context.
+        float_min_score (float): The minimum score of a homonym hit.
+
+    Returns:
+        None
+
+    Adds the columns 'Score' (see get_homonym_score) and 'Plausivel'. Hits
+    that are not homonyms, hits without a snippet and, for each ID_PESSOA,
+    the hits with the best score are always plausible, so a name is never
+    left without candidates. Other homonym hits are plausible when their
+    score reaches float_min_score.
+
+    Example:
+        >>> set_plausible_homonyms(df_capes_lattes, df_context, 0.3)
+        >>> df_capes_lattes['Plausivel'].sum()
+        1802
+    """
+    dict_context = get_dict_context(df_context)
+
+    df_capes_lattes['Score'] = [get_homonym_score(get_set_tokens(str_snippet),
+                                                  dict_context.get(str(str_id_pessoa), []))
+                                for str_snippet, str_id_pessoa in
+                                zip(df_capes_lattes['Snippet'], df_capes_lattes['ID_PESSOA'])]
+
+    df_capes_lattes['Plausivel'] = (~df_capes_lattes['Homonimo'] |
+                                    (df_capes_lattes['Snippet'] == '') |
+                                    (df_capes_lattes['Score'] >= float_min_score) |
+                                    (df_capes_lattes['Score'] ==
+                                     df_capes_lattes.groupby('ID_PESSOA')['Score'].transform('max')))
+
+
+def show_homonym_pruning(df_capes_lattes, float_min_score):
+    """
+    Displays how many homonym hits were pruned from the download list.
+
+    Args:
+        df_capes_lattes (pandas.DataFrame): The search results with the
+        'Plausivel' column, as set by set_plausible_homonyms.
+        float_min_score (float): The minimum score used.
+
+    Returns:
+        None
+
+    Example:
+        >>> show_homonym_pruning(df_capes_lattes, 0.3)
+        homonyms (min score 0.30): 3120 hits for 410 ID_PESSOA, 1318 pruned - IDs to download: 2004 of 3322
+    """
+    df_homonym = df_capes_lattes[df_capes_lattes['Homonimo']]
+
+    set_ids = set(df_capes_lattes['ID_CNPQ']) - {''}
+    set_ids_plausible = set(df_capes_lattes.loc[df_capes_lattes['Plausivel'], 'ID_CNPQ']) - {''}
+
+    print('homonyms (min score {:.2f}): {} hits for {} ID_PESSOA, {} pruned - '
+          'IDs to download: {} of {}'.format(float_min_score, len(df_homonym),
+                                             df_homonym['ID_PESSOA'].nunique(),
+                                             (~df_homonym['Plausivel']).sum(),
+                                             len(set_ids_plausible), len(set_ids)))
+
+
 def show_download_progress(lst_id_names):
     """
     Displays the progress of CNPQ ID download.
@@ -368,13 +763,14 @@ def show_download_progress(lst_id_names):
     based on the remaining number of names to search.
 
     Args:
-        lst_id_names (list): A list of tuples containing CNPQ ID and name pairs.
+        lst_id_names (list): A list of tuples containing a list of CAPES IDs
+        and the name they share.
 
     Returns:
         None
 
     Example:
-        >>> show_download_progress([('123', 'John Doe'), ('456', 'Jane Smith')])
+        >>> show_download_progress([(['123'], 'john doe'), (['456'], 'jane smith')])
     """
 
     n_start_size = len(lst_id_names)
@@ -403,93 +799,249 @@ def show_download_progress(lst_id_names):
 
 
 def start_threads_download_idcnpq(n_threads_count, lst_id_names,
-                                  str_download_folder_path):
+                                  str_journal_path, dict_search, n_names_merged=0):
     """
     Starts multiple threads for downloading CNPQ IDs by names.
 
     This function starts multiple threads for downloading CNPQ IDs by names
     from the CNPQ website
-    and saves them to text files in the specified folder. It also starts a
-    thread to show download progress.
+    and saves them to the search journal. It also starts a
+    thread to show download progress. It returns when every thread has
+    finished, including the names still being searched when the list emptied.
 
     Args:
         n_threads_count (int): Number of threads to start for downloading.
-        lst_id_names (list): A list of tuples containing CNPQ ID and name pairs.
-        str_download_folder_path (str): Path to the folder where files will be downloaded.
+        lst_id_names (list): A list of tuples containing a list of CAPES IDs
+        and the name they share.
+        str_journal_path (str): Path to the search journal file.
+        dict_search (dict): Resources shared by all threads, as returned by
+        get_dict_search.
+        n_names_merged (int, optional): Other names of the ID_PESSOA to search,
+        as returned by get_n_names_merged, counted in the searches saved.
+        Defaults to 0.
 
     Returns:
         None
 
     Example:
         >>> start_threads_download_idcnpq(3,
-        [('123', 'John Doe'), ('456', 'Jane Smith')], '/path/to/downloads')
+        [(['123', '789'], 'john doe'), (['456'], 'jane smith')], '/path/to/downloads/search_journal.sqlite',
+        get_dict_search('/path/to/downloads/search_journal.sqlite', 5.0, 3, 8))
     """
 
-    print('{} names to search'.format(len(lst_id_names)))
+    n_id_pessoa = sum(len(x[0]) for x in lst_id_names)
+    print('{} names to search for {} ID_PESSOA ({} searches saved, {} by ID_PESSOA '
+          'listed under several names)'.format(len(lst_id_names), n_id_pessoa,
+                                               n_id_pessoa - len(lst_id_names) + n_names_merged,
+                                               n_names_merged))
 
+    lst_threads = []
     for i in range(0, n_threads_count):
         t_down = Thread(target=download_idcnpq_by_lst_id_names,
                         args=(i,
-                              str_download_folder_path,
-                              lst_id_names))
+                              str_journal_path,
+                              lst_id_names,
+                              dict_search))
         t_down.start()
-        time.sleep(1)
+        lst_threads.append(t_down)
 
     t_progress = Thread(target=show_download_progress, args=(lst_id_names,))
     t_progress.start()
     t_progress.join()
 
+    for t_down in lst_threads:
+        t_down.join()
+
 
-def main():
+def show_kid_cache_stats(dict_kid_stats):
     """
-    Main function to orchestrate the entire process of downloading CNPQ IDs and
-    processing CAPES data.
+    Displays the hit rate of the K-id cache.
 
-    This function serves as the entry point for the entire process. It handles
-    command-line arguments,
-    initializes necessary variables, downloads CNPQ IDs, processes CAPES data,
-    and saves the results to files.
+    Args:
+        dict_kid_stats (dict): The 'hit' and 'miss' counters of the cache.
 
     Returns:
         None
+
+    Example:
+        >>> show_kid_cache_stats({'hit': 30, 'miss': 10})
+        K-id cache: 30 hits, 10 misses, hit rate: 75.0%
     """
-    args = get_args()
-    str_path_file_capes = args.input_file
-    str_download_folder_path = util.format_path(args.output_folder)
+    n_total = dict_kid_stats['hit'] + dict_kid_stats['miss']
+    float_rate = 100 * dict_kid_stats['hit'] / n_total if n_total else 0
 
-    str_download_folder_path = str_download_folder_path.rstrip('/')
+    print('K-id cache: {} hits, {} misses, hit rate: {:.1f}%'.format(dict_kid_stats['hit'],
+                                                                    dict_kid_stats['miss'],
+                                                                    float_rate))
 
+
+def show_search_latency(lst_latency):
+    """
+    Displays a summary of the time spent searching each name.
+
+    Args:
+        lst_latency (list): A list of (name, number of hits, seconds) tuples.
+
+    Returns:
+        None
+
+    Example:
+        >>> show_search_latency([('john doe', 2, 3.1), ('jane smith', 1, 1.7)])
+        names: 2 - latency mean: 2.4s, p50: 3.1s, p95: 3.1s, max: 3.1s - slowest: john doe (2 hits, 3.1s)
+    """
+    if not lst_latency:
+        return
+
+    lst_seconds = sorted(x[2] for x in lst_latency)
+    n_size = len(lst_seconds)
+    str_name, n_hits, float_seconds = max(lst_latency, key=lambda x: x[2])
+
+    print('names: {} - latency mean: {:.1f}s, p50: {:.1f}s, p95: {:.1f}s, max: {:.1f}s'
+          ' - slowest: {} ({} hits, {:.1f}s)'.format(n_size,
+                                                     sum(lst_seconds) / n_size,
+                                                     lst_seconds[int(n_size * 0.50)],
+                                                     lst_seconds[min(n_size - 1, int(n_size * 0.95))],
+                                                     lst_seconds[-1],
+                                                     str_name, n_hits, float_seconds))
+
+
+def search_capes_file(str_path_file_capes, str_download_folder_path, str_kid_cache_path,
+                      float_rate, n_preview_workers, float_min_score, on_result=None,
+                      tpl_shard=None):
+    """
+    Searches every CAPES name on the CNPQ website and saves the results.
+
+    Args:
+        str_path_file_capes (str): The path to the CAPES Excel file.
+        str_download_folder_path (str): The folder of the search journal and
+        of the resulting CSV files.
+        str_kid_cache_path (str or None): The journal holding the K-id cache,
+        or None to use the search journal.
+        float_rate (float): Maximum number of requests per second sent to CNPq.
+        n_preview_workers (int): Size of the pool that fetches preview pages.
+        float_min_score (float): The minimum snippet score of a homonym hit to
+        be downloaded.
+        on_result (function, optional): Called with the CAPES IDs and the hits
+        of every name searched, see get_dict_search.
+        tpl_shard (tuple, optional): The shard (i, N) of the names to search,
+        see utils_shard. Every CAPES ID that shares a name falls in the same
+        shard, so each name is searched by a single shard.
+
+    Returns:
+        None
+
+    Names already in the journal are not searched again. The search is
+    repeated three times to deal with connection problems, then
+    search_latency.csv, missing_lattes.csv, capes-x-lattes.csv,
+    homonyms_pruned.csv and idlattes_to_download.csv are written.
+
+    Example:
+        >>> search_capes_file('../data/capes-2020.xlsx', '../data/capes_x_lattes',
+        ...                   None, 5.0, 8, 0.0)
+    """
     if not os.path.exists(str_download_folder_path):
         os.makedirs(str_download_folder_path)
 
+    str_journal_path = journal.get_journal_path(str_download_folder_path)
+    if not os.path.exists(str_journal_path):
+        n_imported = journal.import_legacy_txt_files(str_journal_path,
+                                                     str_download_folder_path)
+        if n_imported:
+            print('{} legacy txt files imported into the journal'.format(n_imported))
+
     df_capes = get_df_capes(str_path_file_capes)
 
+    if tpl_shard:
+        # each ID_PESSOA is sharded by the name it is searched by
+        sr_name = get_df_capes_one_name(df_capes).set_index('ID_PESSOA')['NM_DOCENTE']
+        df_capes = df_capes[[shard.is_in_shard(sr_name[x], tpl_shard)
+                             for x in df_capes['ID_PESSOA']]]
+
     n_attempts = 3
     n_threads_count = 3
+    dict_search = get_dict_search(str_kid_cache_path or str_journal_path, float_rate,
+                                  n_threads_count, n_preview_workers)
+    dict_search['on_result'] = on_result
     n_count = 0
     while n_count < n_attempts:
         n_count += 1
         print('attempt:{}'.format(n_count))
 
         lst_id_names = get_lst_capes_to_download(df_capes,
-                                                 str_download_folder_path)
+                                                 str_journal_path)
 
         start_threads_download_idcnpq(n_threads_count, lst_id_names,
-                                      str_download_folder_path)
+                                      str_journal_path, dict_search,
+                                      get_n_names_merged(df_capes, lst_id_names))
+
 
+    dict_search['executor'].shutdown()
+    show_search_latency(dict_search['lst_latency'])
+    show_kid_cache_stats(dict_search['dict_kid_stats'])
+    pd.DataFrame(dict_search['lst_latency'],
+                 columns=['NM_DOCENTE', 'N_HITS', 'SECONDS']).to_csv(
+                     f"{str_download_folder_path}/search_latency.csv", index=False)
 
     lst_id_names = get_lst_capes_to_download(df_capes,
-                                             str_download_folder_path)
+                                             str_journal_path)
 
-    df_missing = df_capes[df_capes['ID_PESSOA'].isin([x[0] for x in lst_id_names])]
+    df_missing = df_capes[df_capes['ID_PESSOA'].isin([x for lst_id, _ in lst_id_names
+                                                      for x in lst_id])]
     df_missing.to_csv(f"{str_download_folder_path}/missing_lattes.csv", index=False)
 
-    df_capes_lattes = get_df_capes_lattes(str_download_folder_path)
+    df_capes_lattes = get_df_capes_lattes(str_journal_path)
+    set_plausible_homonyms(df_capes_lattes, get_df_capes_context(str_path_file_capes),
+                           float_min_score)
+    show_homonym_pruning(df_capes_lattes, float_min_score)
     df_capes_lattes.to_csv(f"{str_download_folder_path}/capes-x-lattes.csv",
                            index=False)
+    df_capes_lattes[~df_capes_lattes['Plausivel']].to_csv(
+        f"{str_download_folder_path}/homonyms_pruned.csv", index=False)
+
+    df_capes_lattes.loc[df_capes_lattes['Plausivel'],
+                        'ID_CNPQ'].to_csv(f"{str_download_folder_path}/idlattes_to_download.csv",
+                                          index=False, header=False)
+
+
+def main(args=None):
+    """
+    Main function to orchestrate the entire process of downloading CNPQ IDs and
+    processing CAPES data.
+
+    This function serves as the entry point for the entire process. It handles
+    command-line arguments and calls search_capes_file, which downloads CNPQ
+    IDs, processes CAPES data, and saves the results to files. With --shard,
+    only the names of the shard are searched and the results go to the
+    'shard_<i>_of_<N>' subfolder of the output folder. With --profile,
+    the main thread and the search and preview threads are profiled; see
+    utils_profile.
+
+    Args:
+        args (argparse.Namespace, optional): The arguments, as parsed by get_args
+            or by the matching subcommand of lattes_cli. Parsed from the
+            command line when omitted.
+
+    Returns:
+        None
+    """
+    if args is None:
+        args = get_args()
+
+    str_download_folder_path = util.format_path(args.output_folder)
+
+    str_download_folder_path = shard.get_shard_folder_path(str_download_folder_path,
+                                                           args.shard)
+
+    str_download_folder_path = str_download_folder_path.rstrip('/')
+
+    dict_profile = profile.start_profile(args.profile, 'search')
+
+    with profile.profile_step(dict_profile, 'search'):
+        search_capes_file(args.input_file, str_download_folder_path, args.kid_cache,
+                          args.rate, args.preview_workers, args.min_score,
+                          tpl_shard=args.shard)
 
-    df_capes_lattes['ID_CNPQ'].to_csv(f"{str_download_folder_path}/idlattes_to_download.csv",
-                                      index=False, header=False)
+    profile.stop_profile(dict_profile)
 
 if __name__ == "__main__":
     main()
@@ -7,19 +7,51 @@ Created on Sun Aug 21 06:26:54 2022
 """
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor, wait
+import csv
+import datetime
 import glob
 import json
 import os
+import re
 import time
 import zipfile
-from threading import Thread
+import queue
+from threading import BoundedSemaphore, Lock, Thread
+from requests.adapters import HTTPAdapter
 import requests
-from dbc_api_python3 import deathbycaptcha
 import config_dbc_credentials as cfg
+import utils_args as cli_args
+import utils_cv_store as store
+import utils_download_manifest as manifest
+import utils_download_metrics as metrics
 import utils_lattes_cnpq as util
+import utils_profile as profile
+import utils_rate_control as rate
+import utils_search_journal as journal
+import utils_shard as shard
 
 
-def download_xml(str_id_lattes, str_captcha_valido, str_download_folder_path):
+URL_PREVIEW = util.URL_BASE + '/buscatextual/preview.do?metodo=apresentar&id={}'
+URL_DETAIL = util.URL_BASE + '/buscatextual/visualizacv.do?id={}'
+TIMEOUT_REQUEST = (10, 120)
+
+# reCAPTCHA tokens are valid for 120 seconds; drop them a little earlier
+TOKEN_TTL = 100
+
+# consecutive failed solves after which the captcha workers give up
+MAX_CAPTCHA_FAILURES = 20
+
+CHUNK_SIZE = 64 * 1024
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_SPARE = 'spare'
+STATUS_NO_TOKEN = 'no_token'
+
+
+def download_xml(str_id_lattes, str_captcha_valido, str_download_folder_path,
+                 dict_download, dict_event):
     """
     Download XML file for a given ID.
 
@@ -27,21 +59,45 @@ def download_xml(str_id_lattes, str_captcha_valido, str_download_folder_path):
         str_id_lattes (str): The CNPq ID for which the XML file needs to be downloaded.
         str_captcha_valido (str): The solved CAPTCHA string.
         str_download_folder_path (str): The path of the download folder.
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+        dict_event (dict): The metrics event of the download, filled with the
+            GET and POST latencies ('get_s', 'post_s'), the bytes downloaded,
+            the validation result and the error class, if any.
+
+    Returns:
+        str: STATUS_OK if a valid zip file was saved, STATUS_SPARE if the request
+        failed before the CAPTCHA was sent, so the token is still unused, and
+        STATUS_ERROR otherwise.
 
     This function constructs HTTP requests to download the XML file associated with the
-    provided CNPq ID. It uses a session to maintain the connection and sets appropriate
-    headers for the requests. Upon successful download, the file is saved in the specified
-    download folder. If the downloaded file is not a valid zip file, it is removed.
+    provided CNPq ID. It uses the pooled session shared by all downloads, which keeps
+    the connections alive, and sets appropriate
+    headers for the requests. The response is streamed in chunks to a temporary
+    '<id>.zip.part' file, so memory use does not depend on the size of the CV.
+    Only after its size and CRCs are verified is it atomically renamed to
+    '<id>.zip'; a crash part-way leaves at most a '.part' file, which is never
+    taken as downloaded. If the downloaded file is not a valid zip file, it is removed.
+    When a CV store is configured, the verified file goes into the store instead
+    of being renamed.
+
+    Every request waits for the rate control, and timeouts, HTTP 429/5xx
+    responses and invalid zip files are reported to it as failures.
+    The outcome is recorded in the download manifest. An HTML page instead of
+    a zip file is recorded as a 'captcha' error, since that is how CNPq
+    answers an incorrect CAPTCHA.
 
     """
+    rate_control = dict_download['rate_control']
+    str_manifest_path = dict_download['str_manifest_path']
+    session = dict_download['session']
 
-    dict_headers = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.72 Safari/537.36',
-                    'Host': 'buscatextual.cnpq.br',
-                    'Origin': 'http://buscatextual.cnpq.br',
-                    'Referer': f"""http://buscatextual.cnpq.br/buscatextual/download.do?metodo=apresentar&idcnpq={str_id_lattes}"""
+    dict_headers = {'Host': util.URL_BASE.split('://')[-1],
+                    'Origin': util.URL_BASE,
+                    'Referer': f"""{util.URL_BASE}/buscatextual/download.do?metodo=apresentar&idcnpq={str_id_lattes}"""
                     }
 
-    str_url_apresentacao = f"""http://buscatextual.cnpq.br/buscatextual/download.do?metodo=apresentar&idcnpq={str_captcha_valido}"""
+    str_url_apresentacao = f"""{util.URL_BASE}/buscatextual/download.do?metodo=apresentar&idcnpq={str_captcha_valido}"""
 
     payload = {'metodo': 'executarDownload',
                'tokenCaptchar': str_captcha_valido,
@@ -49,62 +105,156 @@ def download_xml(str_id_lattes, str_captcha_valido, str_download_folder_path):
                'g-recaptcha-response': str_captcha_valido
               }
 
-    session = requests.Session()
+    str_file_name = '{}/{}.zip'.format(str_download_folder_path, str_id_lattes)
+    str_file_name_part = '{}.part'.format(str_file_name)
 
-    response = session.get(str_url_apresentacao, headers=dict_headers)
+    str_status = STATUS_SPARE
+    n_probe = None
+    try:
+        n_probe = rate_control.acquire()
+        time_start = time.monotonic()
+        response = session.get(str_url_apresentacao, headers=dict_headers,
+                               timeout=TIMEOUT_REQUEST)
+        dict_event['get_s'] = time.monotonic() - time_start
+        response.raise_for_status()
+
+        n_probe = rate_control.acquire(n_probe)
+        str_status = STATUS_ERROR
+        time_start = time.monotonic()
+        with session.post(util.URL_BASE + '/buscatextual/download.do',
+                          data=payload,
+                          headers=dict_headers,
+                          timeout=TIMEOUT_REQUEST,
+                          stream=True) as response:
+            response.raise_for_status()
+            n_bytes = write_response_to_file(response, str_file_name_part)
+            # Content-Length is the size of the body as sent, before any
+            # Content-Encoding is decoded, so it is compared with the raw bytes
+            n_received = response.raw.tell()
+            n_expected_size = int(response.headers.get('Content-Length') or n_received)
+            str_content_type = response.headers.get('Content-Type', '')
+        dict_event['post_s'] = time.monotonic() - time_start
+        dict_event['bytes'] = n_bytes
+    except Exception as excpt:
+        if os.path.exists(str_file_name_part):
+            os.remove(str_file_name_part)
+        str_error_class, float_delay = rate_control.record_failure(excpt, n_probe)
+        dict_event['error'] = str_error_class
+        dict_event['backoff_s'] = float_delay
+        manifest.record_failure(str_manifest_path, str_id_lattes, str_error_class,
+                                str_status == STATUS_ERROR)
+        print('Erro no download de {} ({}): {}'.format(str_id_lattes, str_error_class, excpt))
+        return str_status
+
+    if n_received != n_expected_size or not is_valid_zip(str_file_name_part):
+        print('Erro no arquivo baixado: {}'.format(str_file_name))
+        os.remove(str_file_name_part)
+        rate_control.record_failure(zipfile.BadZipFile(str_file_name), n_probe)
+        dict_event['validation'] = (manifest.ERROR_CAPTCHA if 'html' in str_content_type
+                                    else manifest.ERROR_INVALID_ZIP)
+        manifest.record_failure(str_manifest_path, str_id_lattes,
+                                dict_event['validation'], True)
+        return STATUS_ERROR
 
-    response = session.post('http://buscatextual.cnpq.br/buscatextual/download.do',
-                            data=payload,
-                            headers=dict_headers)
+    dict_event['validation'] = STATUS_OK
 
-    str_file_name = '{}/{}.zip'.format(str_download_folder_path, str_id_lattes)
-    with open(str_file_name, mode='wb') as file:
-        file.write(response.content)
+    if dict_download['str_store_path']:
+        store.put_cv_zip(dict_download['str_store_path'], str_id_lattes, str_file_name_part)
+        os.remove(str_file_name_part)
+    else:
+        os.replace(str_file_name_part, str_file_name)
+    rate_control.record_success(n_probe)
+    manifest.record_success(str_manifest_path, str_id_lattes, n_bytes)
 
-    if not zipfile.is_zipfile(str_file_name):
-        print('Erro no arquivo baixado: {}'.format(str_file_name))
-        os.remove(str_file_name)
+    return STATUS_OK
 
 
-def download_xml_lst_ids(str_thread_index, str_download_folder_path, lst_ids, dbc_client):
+def download_xml_with_token(str_id_lattes, str_download_folder_path, dict_download):
     """
-    Download XML files for a list of IDs.
+    Download XML file for a given ID using a token from the captcha queue.
 
     Args:
-        str_thread_index (str): Identifier for the current thread.
+        str_id_lattes (str): The CNPq ID for which the XML file needs to be downloaded.
         str_download_folder_path (str): The path of the download folder.
-        lst_ids (list): A list of IDs for which XML files need to be downloaded.
-        dbc_client: An instance of the DeathByCaptcha client.
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
 
-    This function iterates over the list of IDs, attempts to solve the CAPTCHA for each ID,
-    and if successful, initiates a thread to download the XML file associated with the ID.
-    It handles exceptions and retries in case of errors.
+    Returns:
+        str: The status returned by download_xml, or STATUS_NO_TOKEN if the
+        captcha workers gave up before a token was available.
 
-    Note:
-        This function uses multithreading to download XML files concurrently.
+    Waits for a solved CAPTCHA token and downloads the file. When the download
+    fails before the token is sent to CNPq, the token is put back in the queue
+    for the next download, and after a failed request the worker waits the
+    backoff delay of its error class. The time waiting for the token, the time it took to
+    solve, its age when used and the latencies of download_xml are recorded
+    in the download metrics.
 
     """
-    n_error_count = 0
+    time_start = time.monotonic()
+    dict_event = {'id': str_id_lattes}
 
-    while lst_ids:
-        try:
-            str_id_lattes = lst_ids.pop(0)
-
-            str_captcha_valido = solve_captcha(str_id_lattes, dbc_client)
-            if str_captcha_valido:
-                trd = Thread(target=download_xml, args=(str_id_lattes,
-                                                        str_captcha_valido,
-                                                        str_download_folder_path))
-                trd.start()
-                time.sleep(1)
-        except KeyboardInterrupt:
-            return
-        except Exception as excpt:
-            n_error_count += 1
-            print('')
-            print('Error count thread {}: {}'.format(str_thread_index, str(n_error_count)))
-            print(excpt)
-            time.sleep(30)
+    tpl_token = get_captcha_token(dict_download)
+    dict_event['token_wait_s'] = time.monotonic() - time_start
+
+    if not tpl_token:
+        manifest.record_failure(dict_download['str_manifest_path'], str_id_lattes,
+                                manifest.ERROR_NO_TOKEN, False)
+        str_status = STATUS_NO_TOKEN
+    else:
+        dict_event['captcha_s'] = tpl_token[2]
+        dict_event['token_age_s'] = time.monotonic() - tpl_token[1]
+        str_status = download_xml(str_id_lattes, tpl_token[0], str_download_folder_path,
+                                  dict_download, dict_event)
+
+        if str_status == STATUS_SPARE:
+            put_captcha_token(dict_download, tpl_token)
+
+    dict_event['status'] = str_status
+    dict_event['total_s'] = time.monotonic() - time_start
+    dict_download['metrics'].record_download(dict_event)
+
+    # the worker waits the backoff of the error class before its next download
+    time.sleep(dict_event.get('backoff_s', 0))
+
+    return str_status
+
+
+def finish_downloads(dict_download, lst_threads, dbc_client):
+    """
+    Wait for every submitted download, stop the captcha workers and show the results.
+
+    Args:
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+        lst_threads (list): The captcha threads, as returned by start_captcha_threads.
+        dbc_client: An instance of the DeathByCaptcha client.
+
+    Prints the download and token counters and the summary of the download
+    metrics, then closes the metrics log.
+
+    """
+    wait(dict_download['lst_futures'])
+    dict_download['executor'].shutdown()
+
+    with dict_download['lock']:
+        dict_download['b_stop'] = True
+    for trd in lst_threads:
+        trd.join()
+
+    lst_status = [STATUS_ERROR if x.exception() else x.result()
+                  for x in dict_download['lst_futures']]
+    print('downloads: {} ok, {} failed, {} without token - '
+          'tokens: {} expired, {} reused'.format(lst_status.count(STATUS_OK),
+                                                 lst_status.count(STATUS_ERROR) +
+                                                 lst_status.count(STATUS_SPARE),
+                                                 lst_status.count(STATUS_NO_TOKEN),
+                                                 dict_download['dict_token_stats']['expired'],
+                                                 dict_download['dict_token_stats']['reused']))
+
+    record_balance(dict_download, dbc_client, 'end')
+    metrics.show_summary(dict_download['metrics'].get_summary(STATUS_OK))
+    dict_download['metrics'].close()
 
 
 def get_args():
@@ -119,19 +269,258 @@ def get_args():
         - input_file (str): The name of the file to be processed. It should
         contain a list of 16-digit IDs.
         - output_path (str): The path where the zip files will be saved.
+    And accepts the options:
+        - --rate (float): The maximum number of requests per second sent to CNPq.
+        - --download-workers (int): The number of concurrent downloads.
+        - --captcha-workers (int): The number of CAPTCHAs solved concurrently.
+        - --store (str): A SQLite CV store to be used instead of one zip file per ID.
+        - --max-attempts (int): The number of CAPTCHAs spent on an ID before it
+          is no longer retried.
+        - --refresh (str): The lattes_dados_gerais.csv of the last parse. IDs
+          already downloaded are queued again only if their CV was updated
+          since then.
+        - --kid-cache (str): The search journal whose K-ids are used to check
+          the update dates on the preview page.
+        - --refresh-workers (int): The number of update dates checked concurrently.
 
     Returns the parsed arguments as a namespace object.
     """
 
     parser = argparse.ArgumentParser(description='Arquivo de IDs para processar.')
-    parser.add_argument('input_file', metavar='lista_ids', type=str,
-                        help='nome do arquivo a ser processado. Deve conter uma'
-                        'lista de IDs de 16 digitos')
-    parser.add_argument('output_path', metavar='output_path', type=str,
-                        help='caminho onde serao gravados os arquivos zip')
+    cli_args.add_args_download(parser)
     return parser.parse_args()
 
 
+def get_captcha_token(dict_download):
+    """
+    Take a solved CAPTCHA token from the queue.
+
+    Args:
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+
+    Returns:
+        tuple or None: The token, the monotonic time it was solved and the
+        seconds it took to solve, or None if the captcha workers gave up and
+        the queue is empty.
+
+    Blocks until a token is available. Tokens older than TOKEN_TTL are discarded.
+
+    """
+    while True:
+        try:
+            tpl_token = dict_download['queue_tokens'].get(timeout=5)
+        except queue.Empty:
+            if dict_download['b_stop']:
+                return None
+            continue
+
+        if time.monotonic() - tpl_token[1] > TOKEN_TTL:
+            with dict_download['lock']:
+                dict_download['dict_token_stats']['expired'] += 1
+            continue
+
+        with dict_download['lock']:
+            dict_download['n_demand'] -= 1
+
+        return tpl_token
+
+
+def get_dict_download(float_rate, n_download_workers, n_ids, str_store_path,
+                      str_manifest_path, str_metrics_path):
+    """
+    Create the resources shared by every download.
+
+    Args:
+        float_rate (float): Maximum number of requests per second sent to CNPq.
+        n_download_workers (int): Maximum number of concurrent downloads.
+        n_ids (int): Number of IDs to download, i.e. the CAPTCHA tokens needed.
+        str_store_path (str or None): The CV store to write to, or None to
+            keep one zip file per ID.
+        str_manifest_path (str): The download manifest.
+        str_metrics_path (str): The JSONL file of the download metrics.
+
+    Returns:
+        dict: A dictionary with the keys 'rate_control' (RateControl shared by
+        all requests), 'session' (requests.Session with keep-alive connections
+        pooled for all workers), 'executor' (ThreadPoolExecutor running the
+        downloads), 'semaphore' (bounds the downloads submitted and not yet
+        finished), 'lst_futures' (the futures of every submitted download),
+        'queue_tokens' (solved CAPTCHA tokens waiting for a download),
+        'n_demand' (IDs still waiting for a token), 'n_solving' (CAPTCHAs being
+        solved), 'n_buffer' (maximum tokens solved ahead of the downloads),
+        'dict_token_stats' (expired and reused token counters), 'b_stop' (set
+        when the captcha workers give up), 'lock' (guards the counters),
+        'str_store_path', 'str_manifest_path' and 'metrics' (DownloadMetrics
+        of the run).
+
+    Example:
+        >>> dict_download = get_dict_download(2.0, 4, 1000, None,
+        ...                                   '../data/xml_lattes/download_manifest.sqlite',
+        ...                                   '../data/xml_lattes/download_metrics.jsonl')
+    """
+    return {'rate_control': rate.RateControl(float_rate, n_download_workers),
+            'session': get_session(n_download_workers),
+            'executor': ThreadPoolExecutor(max_workers=n_download_workers),
+            'semaphore': BoundedSemaphore(2 * n_download_workers),
+            'lst_futures': [],
+            'queue_tokens': queue.Queue(),
+            'n_demand': n_ids,
+            'n_solving': 0,
+            'n_buffer': 2 * n_download_workers,
+            'dict_token_stats': {'expired': 0, 'reused': 0},
+            'b_stop': False,
+            'lock': Lock(),
+            'str_store_path': str_store_path,
+            'str_manifest_path': str_manifest_path,
+            'metrics': metrics.DownloadMetrics(str_metrics_path)}
+
+
+def get_date_last_update(session, rate_control, str_id_lattes, str_k_id):
+    """
+    Get the last update date of a CV from the preview page, which needs no CAPTCHA.
+
+    Args:
+        session (requests.Session): The session used for the requests.
+        rate_control (RateControl): The rate control shared by the requests.
+        str_id_lattes (str): The CNPq ID of the CV.
+        str_k_id (str or None): The K-id of the CV, if known.
+
+    Returns:
+        datetime.date or None: The date shown as 'Última atualização do
+        currículo', or None if the K-id is not known, the page could not be
+        read, has no date or is not the page of str_id_lattes.
+
+    The preview and CV pages are opened by K-id only, so without it the date
+    is unknown and no request is sent. When the preview does not show the
+    CNPq ID, the CV page of the K-id is read instead, as get_idcnpq_by_id_k
+    of download_id_lattes does. The CNPq ID shown must be str_id_lattes, so
+    a K-id cached for another CV never gives its date.
+
+    Example:
+        >>> get_date_last_update(get_session(1), rate.RateControl(2.0, 1),
+        ...                      '1234567890123456', 'K4723925J2')
+        datetime.date(2024, 3, 12)
+    """
+    if not str_k_id:
+        return None
+
+    n_probe = None
+    for str_url, str_regex_id in [(URL_PREVIEW, util.REGEX_ID_LATTES_PREVIEW),
+                                  (URL_DETAIL, util.REGEX_ID_LATTES_DETAIL)]:
+        try:
+            n_probe = rate_control.acquire(n_probe)
+            response = session.get(str_url.format(str_k_id), timeout=TIMEOUT_REQUEST)
+            response.raise_for_status()
+        except Exception as excpt:
+            str_error_class, float_delay = rate_control.record_failure(excpt, n_probe)
+            print('Erro na data de atualizacao de {} ({}): {}'.format(str_id_lattes,
+                                                                      str_error_class, excpt))
+            time.sleep(float_delay)
+            return None
+
+        rate_control.record_success(n_probe)
+        n_probe = None
+
+        lst_ids_page = re.findall(str_regex_id, response.text)
+        if lst_ids_page:
+            break
+
+    if not lst_ids_page:
+        return None
+
+    if lst_ids_page[0] != str_id_lattes:
+        print('Pagina de {} nao pertence a {}: {}'.format(str_k_id, str_id_lattes,
+                                                          lst_ids_page[0]))
+        return None
+
+    obj_match = re.findall(util.REGEX_DATE_LAST_UPDATE, response.text, re.IGNORECASE)
+    if not obj_match:
+        return None
+
+    return datetime.datetime.strptime(obj_match[0], '%d/%m/%Y').date()
+
+
+def get_dict_date_stored(str_dados_gerais_path):
+    """
+    Get the update date of every CV parsed, as stored in lattes_dados_gerais.csv.
+
+    Args:
+        str_dados_gerais_path (str): The path of the lattes_dados_gerais.csv file.
+
+    Returns:
+        dict: A dictionary mapping CNPq IDs to the DATA-ATUALIZACAO of their
+        CV (datetime.date). CVs without a valid date are left out.
+
+    Example:
+        >>> get_dict_date_stored('../data/lattes_dados_gerais.csv')
+        {'1234567890123456': datetime.date(2023, 11, 2)}
+    """
+    dict_date_stored = {}
+
+    with open(str_dados_gerais_path, newline='') as file:
+        for dict_row in csv.DictReader(file):
+            str_date = (dict_row.get('DATA-ATUALIZACAO') or '').split('.')[0].zfill(8)
+            try:
+                dict_date_stored[dict_row['FILE-NAME']] = \
+                    datetime.datetime.strptime(str_date, '%d%m%Y').date()
+            except ValueError:
+                continue
+
+    return dict_date_stored
+
+
+def get_lst_ids_changed(lst_ids, str_dados_gerais_path, str_journal_path, float_rate,
+                        n_workers):
+    """
+    Get the IDs whose CV was updated since the last parse.
+
+    Args:
+        lst_ids (list): The CNPq IDs already downloaded.
+        str_dados_gerais_path (str): The lattes_dados_gerais.csv of the last parse.
+        str_journal_path (str or None): The search journal holding the K-ids.
+        float_rate (float): Maximum number of requests per second sent to CNPq.
+        n_workers (int): Number of dates checked concurrently.
+
+    Returns:
+        list: The IDs whose update date on CNPq is later than the stored one.
+
+    Only IDs with a stored date are checked, on the preview page of their
+    K-id in the journal. The pages read do not need a CAPTCHA, so only the
+    CVs that really changed cost a CAPTCHA and a full download. IDs without
+    a K-id, or whose date could not be read, are kept as they are.
+
+    Example:
+        >>> get_lst_ids_changed(['1234567890123456'], '../data/lattes_dados_gerais.csv',
+        ...                     '../data/capes_x_lattes/search_journal.sqlite', 2.0, 8)
+        ['1234567890123456']
+    """
+    dict_date_stored = get_dict_date_stored(str_dados_gerais_path)
+    dict_idcnpq_kid = journal.get_dict_idcnpq_kid(str_journal_path) if str_journal_path else {}
+
+    lst_ids_check = [x for x in lst_ids if x in dict_date_stored]
+
+    session = get_session(n_workers)
+    rate_control = rate.RateControl(float_rate, n_workers)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        lst_dates = list(executor.map(lambda x: get_date_last_update(session, rate_control, x,
+                                                                     dict_idcnpq_kid.get(x)),
+                                      lst_ids_check))
+
+    lst_ids_changed = [x for x, date_remote in zip(lst_ids_check, lst_dates)
+                       if date_remote and date_remote > dict_date_stored[x]]
+
+    n_no_kid = sum(1 for x in lst_ids_check if not dict_idcnpq_kid.get(x))
+    print('refresh: {} checked, {} changed, {} unchanged, {} unknown ({} without K-id), '
+          '{} never parsed'.format(len(lst_ids_check), len(lst_ids_changed),
+                                   sum(1 for x in lst_dates if x) - len(lst_ids_changed),
+                                   lst_dates.count(None), n_no_kid,
+                                   len(lst_ids) - len(lst_ids_check)))
+
+    return lst_ids_changed
+
+
 def get_lst_downloaded_files(str_download_folder_path):
     """
     Get a list of downloaded files.
@@ -154,36 +543,334 @@ def get_lst_downloaded_files(str_download_folder_path):
     return glob.glob('{}/*.zip'.format(str_download_folder_path))
 
 
-def get_lst_ids_to_download(str_list_ids_path, str_download_folder_path):
+def get_lst_ids_to_download(str_list_ids_path, str_download_folder_path, str_store_path,
+                            str_manifest_path, n_max_attempts, tpl_shard=None):
     """
     Get a list of IDs to download.
 
     Args:
         str_list_ids_path (str): The path of the file containing the list of IDs.
         str_download_folder_path (str): The path of the download folder.
+        str_store_path (str or None): The CV store, or None to use the download folder.
+        str_manifest_path (str): The download manifest.
+        n_max_attempts (int): The retry budget of each ID.
+        tpl_shard (tuple, optional): The shard (i, N) of the list to download,
+            see utils_shard. The other IDs are not added to the manifest.
 
     Returns:
         list: A list of IDs that are not yet downloaded.
 
-    This function reads the list of IDs from the specified file, compares them with
-    the list of already downloaded files in the download folder, and returns the IDs
-    that are yet to be downloaded.
+    This function reads the list of IDs from the specified file, adds the new
+    ones to the download manifest and returns the IDs of the list that are yet
+    to be downloaded and have not used up their retry budget. The manifest is a
+    query, so the download folder is not listed. Only when the manifest does
+    not exist yet are the files already in the download folder, or the IDs of
+    the CV store, recorded as downloaded.
 
     Example:
         If str_list_ids_path points to a file containing IDs ['ID1', 'ID2', 'ID3'],
-        and str_download_folder_path contains downloaded files 'ID1.zip' and 'ID3.zip',
-        the function will return ['ID2'].
+        the manifest records 'ID1' as ok and 'ID3' failed three times,
+        the function called with n_max_attempts=3 will return ['ID2'].
+    """
+    lst_ids = shard.get_lst_ids_shard(open(str_list_ids_path).read().splitlines(),
+                                      tpl_shard)
+
+    init_manifest(str_manifest_path, str_download_folder_path, str_store_path)
+
+    manifest.add_lst_ids(str_manifest_path, lst_ids)
+
+    set_ids = set(lst_ids)
+
+    return [x for x in manifest.get_lst_ids_to_download(str_manifest_path, n_max_attempts)
+            if x in set_ids]
+
+
+def get_session(n_pool_size):
     """
-    lst_ids = open(str_list_ids_path).read().splitlines()
+    Create a requests session with pooled keep-alive connections.
 
-    lst_downloaded_files = get_lst_downloaded_files(str_download_folder_path)
-    lst_downloaded_files = [os.path.basename(x).split('.')[0] for x in lst_downloaded_files]
+    Args:
+        n_pool_size (int): Maximum number of connections kept, one per worker.
 
-    lst_return = list(set(lst_ids) - set(lst_downloaded_files))
+    Returns:
+        requests.Session: The session, with the browser User-Agent.
 
-    lst_return.sort()
+    """
+    session = requests.Session()
+    session.headers['User-Agent'] = util.USER_AGENT
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=n_pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
 
-    return lst_return
+    return session
+
+
+def init_manifest(str_manifest_path, str_download_folder_path, str_store_path):
+    """
+    Create the download manifest from the CVs already downloaded, if it does not exist.
+
+    Args:
+        str_manifest_path (str): The download manifest.
+        str_download_folder_path (str): The path of the download folder.
+        str_store_path (str or None): The CV store, or None to use the download folder.
+
+    The IDs of the zip files in the download folder, or of the CV store, are
+    recorded as downloaded.
+
+    """
+    if os.path.exists(str_manifest_path):
+        return
+
+    if str_store_path:
+        lst_downloaded_files = store.get_lst_ids_stored(str_store_path)
+    else:
+        lst_downloaded_files = get_lst_downloaded_files(str_download_folder_path)
+        lst_downloaded_files = [os.path.basename(x).split('.')[0]
+                                for x in lst_downloaded_files]
+    manifest.mark_lst_ids_ok(str_manifest_path, lst_downloaded_files)
+
+
+def is_valid_zip(str_file_name):
+    """
+    Check that a downloaded file is a complete Lattes zip file.
+
+    Args:
+        str_file_name (str): The path of the file to be checked.
+
+    Returns:
+        bool: True if the file is a zip archive holding 'curriculo.xml' and the
+        CRC of every member matches its content, False otherwise.
+
+    The members are read in chunks by zipfile, so memory use stays constant.
+
+    """
+    try:
+        with zipfile.ZipFile(str_file_name) as lattes_zip:
+            return ('curriculo.xml' in lattes_zip.namelist() and
+                    lattes_zip.testzip() is None)
+    except (zipfile.BadZipFile, OSError, EOFError):
+        return False
+
+
+def add_download_demand(dict_download, n_ids):
+    """
+    Tell the captcha workers that more IDs are waiting for a token.
+
+    Args:
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+        n_ids (int): The number of IDs added.
+
+    Used when the IDs to download are not all known beforehand, e.g. when
+    they arrive from a running search.
+
+    """
+    with dict_download['lock']:
+        dict_download['n_demand'] += n_ids
+
+
+def put_captcha_token(dict_download, tpl_token):
+    """
+    Put an unused CAPTCHA token back in the queue if it has not expired.
+
+    Args:
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+        tpl_token (tuple): The token, the monotonic time it was solved and the
+            seconds it took to solve.
+
+    """
+    if time.monotonic() - tpl_token[1] > TOKEN_TTL:
+        return
+
+    with dict_download['lock']:
+        dict_download['dict_token_stats']['reused'] += 1
+
+    dict_download['queue_tokens'].put(tpl_token)
+
+
+def record_balance(dict_download, dbc_client, str_moment):
+    """
+    Read the DeathByCaptcha balance and record it in the download metrics.
+
+    Args:
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+        dbc_client: An instance of the DeathByCaptcha client.
+        str_moment (str): 'start' or 'end'.
+
+    """
+    float_balance = get_balance(dbc_client)
+    if float_balance is not None:
+        dict_download['metrics'].record_balance(str_moment, float_balance)
+
+
+def start_captcha_threads(n_captcha_workers, str_idcnpq, dbc_client, dict_download):
+    """
+    Start the threads that solve CAPTCHAs for the downloads.
+
+    Args:
+        n_captcha_workers (int): The number of CAPTCHAs solved concurrently.
+        str_idcnpq (str): A CNPq ID whose download page is sent to the solver.
+        dbc_client: An instance of the DeathByCaptcha client.
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+
+    Returns:
+        list: The started threads, to be passed to finish_downloads.
+
+    """
+    lst_threads = []
+    for i in range(0, n_captcha_workers):
+        trd = Thread(target=solve_captcha_lst_ids, args=(i,
+                                                         str_idcnpq,
+                                                         dbc_client,
+                                                         dict_download))
+        trd.start()
+        lst_threads.append(trd)
+
+    return lst_threads
+
+
+def solve_captcha_lst_ids(str_thread_index, str_idcnpq, dbc_client, dict_download):
+    """
+    Solve CAPTCHAs and feed the tokens to the download workers.
+
+    Args:
+        str_thread_index (str): Identifier for the current thread.
+        str_idcnpq (str): A CNPq ID whose download page is sent to the solver.
+            reCAPTCHA tokens are bound to the site, not to the ID, so any ID
+            of the list can be used.
+        dbc_client: An instance of the DeathByCaptcha client.
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+
+    This function keeps solving CAPTCHAs until dict_download['b_stop'] is set,
+    as long as there are IDs waiting for a token, holding at most dict_download['n_buffer'] tokens ahead of the
+    downloads so that they are used before they expire, and none while the
+    circuit breaker pauses the downloads. It handles exceptions
+    and retries in case of errors, backing off exponentially according to the
+    class of the error. After MAX_CAPTCHA_FAILURES consecutive failures it
+    stops every captcha worker. Every attempt is recorded in the download
+    metrics with its duration and result.
+
+    """
+    n_error_count = 0
+    n_consecutive_errors = 0
+
+    while True:
+        with dict_download['lock']:
+            if dict_download['b_stop']:
+                return
+
+            # no token is bought while the circuit breaker pauses the downloads,
+            # as it would expire before being used
+            b_solve = (dict_download['queue_tokens'].qsize() + dict_download['n_solving'] <
+                       min(dict_download['n_demand'], dict_download['n_buffer']) and
+                       not dict_download['rate_control'].breaker.is_open())
+            if b_solve:
+                dict_download['n_solving'] += 1
+
+        if not b_solve:
+            time.sleep(1)
+            continue
+
+        str_captcha_valido = None
+        time_start = time.monotonic()
+        try:
+            str_captcha_valido, str_result = solve_captcha(str_idcnpq, dbc_client)
+            dict_download['metrics'].record_captcha(str_thread_index,
+                                                    time.monotonic() - time_start,
+                                                    str_result)
+        except KeyboardInterrupt:
+            dict_download['b_stop'] = True
+            return
+        except Exception as excpt:
+            dict_download['metrics'].record_captcha(str_thread_index,
+                                                    time.monotonic() - time_start,
+                                                    metrics.CAPTCHA_ERROR)
+            n_error_count += 1
+            str_error_class = rate.classify_error(excpt)
+            float_delay = rate.get_backoff_delay(str_error_class, n_consecutive_errors)
+            print('')
+            print('Error count thread {}: {} ({}, backoff {:.0f}s)'.format(str_thread_index,
+                                                                       str(n_error_count),
+                                                                       str_error_class,
+                                                                       float_delay))
+            print(excpt)
+            time.sleep(float_delay)
+        finally:
+            with dict_download['lock']:
+                dict_download['n_solving'] -= 1
+
+        if str_captcha_valido:
+            n_consecutive_errors = 0
+            dict_download['queue_tokens'].put((str_captcha_valido, time.monotonic(),
+                                               time.monotonic() - time_start))
+            continue
+
+        n_consecutive_errors += 1
+        if n_consecutive_errors >= MAX_CAPTCHA_FAILURES:
+            print('captcha thread {}: {} consecutive failures, stopping'.format(str_thread_index,
+                                                                               n_consecutive_errors))
+            dict_download['b_stop'] = True
+            return
+
+
+def write_response_to_file(response, str_file_name):
+    """
+    Stream the body of an HTTP response to a file.
+
+    Args:
+        response (requests.Response): A response opened with stream=True.
+        str_file_name (str): The path of the file to be written.
+
+    Returns:
+        int: The number of bytes written, after any Content-Encoding of the
+        response is decoded. response.raw.tell() gives the bytes received.
+
+    The body is written in CHUNK_SIZE chunks and flushed to disk before the
+    function returns, so the file can be safely renamed afterwards.
+
+    """
+    n_bytes = 0
+    with open(str_file_name, mode='wb') as file:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            file.write(chunk)
+            n_bytes += len(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+
+    return n_bytes
+
+
+def submit_download(dict_download, str_id_lattes, str_download_folder_path):
+    """
+    Submit the download of an XML file to the bounded executor.
+
+    Args:
+        dict_download (dict): Resources shared by all downloads, as returned by
+            get_dict_download.
+        str_id_lattes (str): The CNPq ID to be downloaded.
+        str_download_folder_path (str): The path of the download folder.
+
+    Blocks while twice the number of workers are already submitted and not
+    finished, so downloads never pile up when CNPq slows down. The download
+    itself waits for a token from the captcha workers.
+
+    Returns:
+        concurrent.futures.Future: The future of download_xml_with_token.
+
+    """
+    dict_download['semaphore'].acquire()
+
+    future = dict_download['executor'].submit(download_xml_with_token, str_id_lattes,
+                                              str_download_folder_path,
+                                              dict_download)
+    future.add_done_callback(lambda _: dict_download['semaphore'].release())
+    dict_download['lst_futures'].append(future)
+
+    return future
 
 
 def solve_captcha(str_idcnpq, dbc_client):
@@ -195,7 +882,9 @@ def solve_captcha(str_idcnpq, dbc_client):
         dbc_client: An instance of the DeathByCaptcha client.
 
     Returns:
-        str or None: The solved CAPTCHA text if successful, None otherwise.
+        tuple: The solved CAPTCHA text if successful, None otherwise, and the
+        result of the attempt, one of the CAPTCHA_* constants of
+        utils_download_metrics.
 
     This function attempts to solve the CAPTCHA required for downloading a file
     associated with the provided CNPq ID. It constructs the CAPTCHA solving request
@@ -207,7 +896,7 @@ def solve_captcha(str_idcnpq, dbc_client):
     message is printed along with the current balance.
     """
     try:
-        str_pageurl = f"""http://buscatextual.cnpq.br/buscatextual/download.do?metodo=apresentar&idcnpq={str_idcnpq}"""
+        str_pageurl = f"""{util.URL_BASE}/buscatextual/download.do?metodo=apresentar&idcnpq={str_idcnpq}"""
 
         captcha_dict = {
             'proxytype': 'HTTP',
@@ -220,49 +909,163 @@ def solve_captcha(str_idcnpq, dbc_client):
         captcha = dbc_client.decode(type=4, token_params=json_captcha)
         if captcha:
             if captcha['is_correct']:
-                return captcha['text']
+                return captcha['text'], metrics.CAPTCHA_OK
 
             dbc_client.report(captcha["captcha"])
             print('CAPTCHA was incorrectly solved\n')
+            return None, metrics.CAPTCHA_INCORRECT
 
-        return None
-    except deathbycaptcha.AccessDeniedException:
+        return None, metrics.CAPTCHA_EMPTY
+    except get_tpl_dbc_access_denied():
         print("error: Access to DBC API denied," +
               "check your credentials and/or balance\n")
         balance = dbc_client.get_balance()
         print(balance)
+        return None, metrics.CAPTCHA_ACCESS_DENIED
+
+
+def get_dbc_client():
+    """
+    Create the DeathByCaptcha client.
+
+    Returns:
+        The DeathByCaptcha socket client, or, when the environment variable
+        LATTES_FAKE_CAPTCHA is set, the fake client of mock_cnpq, which asks
+        the mock server at LATTES_BASE_URL for tokens, so no credit is spent.
+
+    """
+    if os.environ.get('LATTES_FAKE_CAPTCHA'):
+        import mock_cnpq
+        return mock_cnpq.FakeCaptchaClient(util.URL_BASE)
+
+    from dbc_api_python3 import deathbycaptcha
+    return deathbycaptcha.SocketClient(cfg.username, cfg.password, cfg.authtoken)
 
 
-def main():
+def get_tpl_dbc_access_denied():
+    """
+    Get the exception raised when access to the DeathByCaptcha API is denied.
+
+    Returns:
+        tuple: deathbycaptcha.AccessDeniedException, or no exception when
+        LATTES_FAKE_CAPTCHA is set, as the fake client does not raise it.
+
+    The DeathByCaptcha package is imported here and in get_dbc_client only,
+    so the offline runs against mock_cnpq do not need it.
+
+    """
+    if os.environ.get('LATTES_FAKE_CAPTCHA'):
+        return ()
+
+    from dbc_api_python3 import deathbycaptcha
+    return (deathbycaptcha.AccessDeniedException,)
+
+
+def get_balance(dbc_client):
+    """
+    Get the DeathByCaptcha balance.
+
+    Args:
+        dbc_client: An instance of the DeathByCaptcha client.
+
+    Returns:
+        float or None: The balance in US cents, or None if it could not be read.
+
+    """
+    try:
+        return float(dbc_client.get_balance())
+    except Exception as excpt:
+        print('error reading DBC balance: {}'.format(excpt))
+        return None
+
+
+def main(args=None):
     """
     Main function to orchestrate the download process.
 
     This function serves as the entry point for the download process.
     It retrieves command-line arguments, initializes necessary resources,
-    creates download threads, and starts the download process.
+    queues again the CVs updated since the last parse when --refresh is given,
+    starts the captcha threads, which feed solved tokens to the download
+    executor, and submits every ID to it.
+    It returns only after every download submitted has finished or failed,
+    printing the summary of the download metrics, which are also appended to
+    'download_metrics.jsonl' in the output folder.
+    With --shard, only the IDs of the shard are downloaded, to the
+    'shard_<i>_of_<N>' subfolder of the output folder and to a store of its
+    own; see utils_shard.get_shard_file_path. With --profile, the main
+    thread, the captcha threads and the download workers are profiled; see
+    utils_profile.
+
+    Args:
+        args (argparse.Namespace, optional): The arguments, as parsed by get_args
+            or by the matching subcommand of lattes_cli. Parsed from the
+            command line when omitted.
 
     """
-    args = get_args()
+    if args is None:
+        args = get_args()
+
     str_list_ids_path = args.input_file
-    str_download_folder_path = util.format_path(args.output_path)
+    str_download_folder_path = shard.get_shard_folder_path(util.format_path(args.output_path),
+                                                           args.shard)
+    str_store_path = shard.get_shard_file_path(args.store, args.shard)
 
     if not os.path.exists(str_download_folder_path):
         os.makedirs(str_download_folder_path)
 
-    n_threads_count = 2
+    dict_profile = profile.start_profile(args.profile, 'download')
 
-    dbc_client = deathbycaptcha.SocketClient(cfg.username, cfg.password, cfg.authtoken)
+    dbc_client = get_dbc_client()
 
-    lst_ids = get_lst_ids_to_download(str_list_ids_path, str_download_folder_path)
+    with profile.profile_step(dict_profile, 'load'):
+        if str_store_path and not os.path.exists(str_store_path):
+            n_imported = store.import_zip_folder(str_store_path, str_download_folder_path)
+            if n_imported:
+                print('{} zip files imported into the store'.format(n_imported))
 
-    if lst_ids:
-        for i in range(0, n_threads_count):
-            trd = Thread(target=download_xml_lst_ids, args=(i,
-                                                            str_download_folder_path,
-                                                            lst_ids,
-                                                            dbc_client))
-            trd.start()
-            time.sleep(1)
+        str_manifest_path = manifest.get_manifest_path(str_download_folder_path)
+
+        lst_ids = get_lst_ids_to_download(str_list_ids_path, str_download_folder_path,
+                                          str_store_path, str_manifest_path, args.max_attempts,
+                                          args.shard)
+
+    if args.refresh:
+        with profile.profile_step(dict_profile, 'refresh'):
+            set_ids = set(open(str_list_ids_path).read().splitlines())
+            lst_ids_downloaded = [x for x in manifest.get_lst_ids_ok(str_manifest_path)
+                                  if x in set_ids]
+            manifest.requeue_lst_ids(str_manifest_path,
+                                     get_lst_ids_changed(lst_ids_downloaded, args.refresh,
+                                                         args.kid_cache, args.rate,
+                                                         args.refresh_workers))
+            lst_ids = get_lst_ids_to_download(str_list_ids_path, str_download_folder_path,
+                                              str_store_path, str_manifest_path, args.max_attempts,
+                                              args.shard)
+
+    with profile.profile_step(dict_profile, 'download'):
+        if lst_ids:
+            dict_download = get_dict_download(args.rate, args.download_workers, len(lst_ids),
+                                              str_store_path, str_manifest_path,
+                                              metrics.get_metrics_path(str_download_folder_path))
+
+            record_balance(dict_download, dbc_client, 'start')
+
+            lst_threads = start_captcha_threads(args.captcha_workers, lst_ids[0], dbc_client,
+                                                dict_download)
+
+            for str_id_lattes in lst_ids:
+                if dict_download['b_stop']:
+                    break
+                submit_download(dict_download, str_id_lattes, str_download_folder_path)
+
+            finish_downloads(dict_download, lst_threads, dbc_client)
+
+    for str_status, str_error, n_count in manifest.get_lst_summary(str_manifest_path,
+                                                                   args.max_attempts):
+        print('manifest: {} {} {}'.format(n_count, str_status, str_error or ''))
+
+    profile.stop_profile(dict_profile)
 
 if __name__ == "__main__":
     main()
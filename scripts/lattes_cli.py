@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 15:40:26 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import itertools
+import os
+import re
+import utils_args as cli_args
+import utils_cv_store as store
+import utils_download_manifest as manifest
+import utils_lattes_cnpq as util
+import utils_search_journal as journal
+
+# the stage modules import selenium, pandas, requests, duckdb and the
+# DeathByCaptcha client at module level, so they are imported only by their
+# subcommands
+
+REGEX_DATE_UPDATED = rb'DATA-ATUALIZACAO="(\d{8})"'
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments, with
+        the handler of the subcommand in func.
+
+    The subcommands search, download, parse, merge and reduce take the same
+    arguments as the scripts download_id_lattes, download_xml_lattes,
+    parse_xml_lattes, merge_capes_x_lattes and reduce_shards, and index and
+    query the same as the subcommands of query_lattes. The subcommands
+    status and inspect read the search journal, the download manifest and the
+    CV store of a data folder laid out as in run_pipeline: the journal in its
+    'capes_x_lattes' subfolder and the zip files and the manifest in
+    'xml_lattes'.
+
+    Example:
+        $ python lattes_cli.py status ./data --max-attempts 3
+    """
+    parser = argparse.ArgumentParser(description='Integrador Lattes-Capes.')
+    subparsers = parser.add_subparsers(dest='command', metavar='comando', required=True)
+
+    parser_search = subparsers.add_parser('search', help='passo 2: busca os IDs Lattes '
+                                          'dos docentes da Capes')
+    cli_args.add_args_search(parser_search)
+    parser_search.set_defaults(func=run_search)
+
+    parser_download = subparsers.add_parser('download', help='passo 3: baixa os '
+                                            'curriculos Lattes (XML)')
+    cli_args.add_args_download(parser_download)
+    parser_download.set_defaults(func=run_download)
+
+    parser_parse = subparsers.add_parser('parse', help='passo 4: interpreta os '
+                                         'curriculos Lattes (XML)')
+    cli_args.add_args_parse(parser_parse)
+    parser_parse.set_defaults(func=run_parse)
+
+    parser_merge = subparsers.add_parser('merge', help='passo 5: combina os dados '
+                                         'Capes-Lattes')
+    cli_args.add_args_merge(parser_merge)
+    parser_merge.set_defaults(func=run_merge)
+
+    parser_reduce = subparsers.add_parser('reduce', help='combina os resultados das '
+                                          'execucoes com --shard')
+    cli_args.add_args_reduce(parser_reduce)
+    parser_reduce.set_defaults(func=run_reduce)
+
+    parser_index = subparsers.add_parser('index', help='carrega os arquivos CSV do '
+                                         'parse e do merge num arquivo DuckDB')
+    cli_args.add_args_index(parser_index)
+    parser_index.set_defaults(func=run_index)
+
+    parser_query = subparsers.add_parser('query', help='consulta SQL ao arquivo DuckDB '
+                                         'criado pelo index')
+    cli_args.add_args_query(parser_query)
+    parser_query.set_defaults(func=run_query)
+
+    parser_status = subparsers.add_parser('status', help='resume o andamento da '
+                                          'busca e dos downloads')
+    add_args_data_folder(parser_status)
+    parser_status.add_argument('--max-attempts', type=int, default=3,
+                               help='numero maximo de captchas gastos com um mesmo ID')
+    parser_status.set_defaults(func=run_status)
+
+    parser_inspect = subparsers.add_parser('inspect', help='mostra tudo o que se sabe '
+                                           'de um ID_PESSOA ou ID Lattes')
+    add_args_data_folder(parser_inspect)
+    parser_inspect.add_argument('id', metavar='id', type=str,
+                                help='ID_PESSOA da Capes ou ID Lattes de 16 digitos')
+    parser_inspect.set_defaults(func=run_inspect)
+
+    return parser.parse_args()
+
+
+def add_args_data_folder(parser):
+    """
+    Add the data folder and CV store arguments of status and inspect to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the subcommand.
+
+    Returns:
+        None
+    """
+    parser.add_argument('data_folder', metavar='data_path', type=str,
+                        help='pasta com as subpastas capes_x_lattes e xml_lattes')
+    parser.add_argument('--store', type=str, default=None,
+                        help='arquivo SQLite com os curriculos baixados')
+
+
+def get_dict_paths(str_data_folder):
+    """
+    Get the paths of the search journal, the download manifest and the
+    download folder of a data folder.
+
+    Args:
+        str_data_folder (str): The data folder, as given on the command line.
+
+    Returns:
+        dict: The paths, by the keys 'journal', 'manifest', 'xml_folder' and
+        'ids_file'. Files that do not exist are not created.
+
+    Example:
+        >>> get_dict_paths('./data')['manifest']
+        './data/xml_lattes/download_manifest.sqlite'
+    """
+    str_data_path = util.format_path(str_data_folder)
+    str_search_folder_path = f"{str_data_path}capes_x_lattes"
+    str_xml_folder_path = f"{str_data_path}xml_lattes/"
+
+    return {'journal': journal.get_journal_path(str_search_folder_path),
+            'ids_file': os.path.join(str_search_folder_path, 'idlattes_to_download.csv'),
+            'manifest': manifest.get_manifest_path(str_xml_folder_path),
+            'xml_folder': str_xml_folder_path}
+
+
+def run_download(args):
+    """
+    Run the download_xml_lattes script with the parsed arguments.
+    """
+    import download_xml_lattes
+    download_xml_lattes.main(args)
+
+
+def run_index(args):
+    """
+    Run the index subcommand of the query_lattes script with the parsed arguments.
+    """
+    import query_lattes
+    query_lattes.main_index(args)
+
+
+def run_inspect(args):
+    """
+    Show the search results, manifest row and stored CV of an ID.
+
+    Args:
+        args (argparse.Namespace): The arguments of the inspect subcommand.
+
+    Returns:
+        None
+
+    The ID may be a CAPES ID_PESSOA, which shows its search hits and the
+    download state of each one, or a CNPq ID.
+
+    Example:
+        $ python lattes_cli.py inspect ./data 1234567890123456
+        search: ID_PESSOA 123 -> 1234567890123456 em 2026-10-19T10:02:11
+        ...
+    """
+    dict_paths = get_dict_paths(args.data_folder)
+
+    set_idcnpq = set()
+    if re.fullmatch(r'\d{16}', args.id):
+        set_idcnpq.add(args.id)
+
+    if os.path.exists(dict_paths['journal']):
+        dict_idcnpq_kid = journal.get_dict_idcnpq_kid(dict_paths['journal'])
+        for str_id_pessoa, str_idcnpq, str_bolsista, str_dt_search, str_snippet in \
+                journal.get_lst_search_result_by_id(dict_paths['journal'], args.id):
+            print('search: ID_PESSOA {} -> {} em {} {} {}'.format(
+                str_id_pessoa, str_idcnpq or 'nao encontrado', str_dt_search,
+                dict_idcnpq_kid.get(str_idcnpq, ''), str_bolsista))
+            if str_snippet:
+                print('    {}'.format(str_snippet))
+            if str_idcnpq:
+                set_idcnpq.add(str_idcnpq)
+
+    for str_idcnpq in sorted(set_idcnpq):
+        dict_row = None
+        if os.path.exists(dict_paths['manifest']):
+            dict_row = manifest.get_dict_id_lattes(dict_paths['manifest'], str_idcnpq)
+        print('manifest: {} {}'.format(str_idcnpq, dict_row or 'fora do manifesto'))
+
+        str_zip_path = f"{dict_paths['xml_folder']}{str_idcnpq}.zip"
+        if os.path.exists(str_zip_path):
+            print('zip: {} {} bytes'.format(str_zip_path, os.path.getsize(str_zip_path)))
+
+        if args.store and os.path.exists(args.store):
+            bytes_xml = store.get_cv_xml(args.store, str_idcnpq)
+            if bytes_xml:
+                match = re.search(REGEX_DATE_UPDATED, bytes_xml)
+                print('store: {} bytes, atualizado em {}'.format(
+                    len(bytes_xml), match.group(1).decode() if match else '?'))
+
+
+def run_merge(args):
+    """
+    Run the merge_capes_x_lattes script with the parsed arguments.
+    """
+    import merge_capes_x_lattes
+    merge_capes_x_lattes.main(args)
+
+
+def run_parse(args):
+    """
+    Run the parse_xml_lattes script with the parsed arguments.
+    """
+    import parse_xml_lattes
+    parse_xml_lattes.main(args)
+
+
+def run_query(args):
+    """
+    Run the query subcommand of the query_lattes script with the parsed arguments.
+    """
+    import query_lattes
+    query_lattes.main_query(args)
+
+
+def run_reduce(args):
+    """
+    Run the reduce_shards script with the parsed arguments.
+    """
+    import reduce_shards
+    reduce_shards.main(args)
+
+
+def run_search(args):
+    """
+    Run the download_id_lattes script with the parsed arguments.
+    """
+    import download_id_lattes
+    download_id_lattes.main(args)
+
+
+def run_status(args):
+    """
+    Show how far the search and the downloads of a data folder went.
+
+    Args:
+        args (argparse.Namespace): The arguments of the status subcommand.
+
+    Returns:
+        None
+
+    Only SQLite and the standard library are used, so it answers in a
+    fraction of a second, even while the stages are running.
+
+    Example:
+        $ python lattes_cli.py status ./data
+        search: 24510 ID_PESSOA buscados, 22874 com resultado, 25102 IDs Lattes
+        download: 25102 IDs na lista, 24890 baixados, 188 restantes, 24 esgotados
+        manifest: 24890 ok
+        tentativas ok: 24612 com 1, 262 com 2, 16 com 3
+        ...
+    """
+    dict_paths = get_dict_paths(args.data_folder)
+
+    if os.path.exists(dict_paths['journal']):
+        print('search: {} ID_PESSOA buscados, {} com resultado, {} IDs Lattes'.format(
+            *journal.get_search_summary(dict_paths['journal'])))
+    else:
+        print('search: journal nao encontrado em {}'.format(dict_paths['journal']))
+
+    if not os.path.exists(dict_paths['manifest']):
+        print('download: manifesto nao encontrado em {}'.format(dict_paths['manifest']))
+        return
+
+    set_ids_ok = set(manifest.get_lst_ids_ok(dict_paths['manifest']))
+
+    if os.path.exists(dict_paths['ids_file']):
+        with open(dict_paths['ids_file'], encoding='utf-8') as file_ids:
+            set_ids = {x.strip() for x in file_ids if x.strip()}
+        n_exhausted = len(set_ids & set(manifest.get_lst_ids_exhausted(dict_paths['manifest'],
+                                                                       args.max_attempts)))
+        print('download: {} IDs na lista, {} baixados, {} restantes, {} esgotados'.format(
+            len(set_ids), len(set_ids & set_ids_ok),
+            len(set_ids - set_ids_ok) - n_exhausted, n_exhausted))
+
+    for str_status, str_error, n_count in manifest.get_lst_summary(dict_paths['manifest'],
+                                                                   args.max_attempts):
+        print('manifest: {} {} {}'.format(n_count, str_status, str_error or ''))
+
+    # one attempt per CAPTCHA solved, so this shows how many CAPTCHAs the IDs took
+    for str_status, iter_rows in itertools.groupby(
+            manifest.get_lst_attempts_histogram(dict_paths['manifest']), key=lambda x: x[0]):
+        print('tentativas {}: {}'.format(str_status, ', '.join(
+            '{} com {}'.format(n_ids, n_attempts) for _, n_attempts, n_ids in iter_rows)))
+
+    if args.store and os.path.exists(args.store):
+        print('store: {} curriculos'.format(len(store.get_lst_ids_stored(args.store))))
+
+
+def main():
+    """
+    Run the subcommand given on the command line.
+
+    Only the subcommand that runs a stage imports its heavy dependencies, so
+    --help, argument errors, status and inspect start in a fraction of a second.
+
+    """
+    args = get_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,12 @@ Created on Sun Oct 16 20:38:14 2022
 """
 
 import argparse
+import os
 import pandas as pd
 from fuzzywuzzy import fuzz
+import utils_args as cli_args
 import utils_lattes_cnpq as util
+import utils_profile as profile
 
 
 def get_args():
@@ -42,16 +45,7 @@ def get_args():
     """
     parser = argparse.ArgumentParser(description='Pasta com arquivos XML para '
                                      'processar.')
-    parser.add_argument('capes_file', metavar='input_capes', type=str,
-                        help='caminho do arquivo CAPES ser combinado. Deve apontar '
-                        'para um arquivo Excel baixado do site da Capes. O '
-                        'arquivo deve conter as variaves ID_PESSOA, NM_DOCENTE, '
-                        'NM_IES_TITULACAO e AN_TITULACAO')
-
-    parser.add_argument('lattes_file', metavar='input_lattes', type=str,
-                        help='caminho do arquivo CAPES ser combinado. Deve apontar '
-                        'para um arquivo csv (desambiguate) gerado pelo script '
-                        'parse_xml_lattes')
+    cli_args.add_args_merge(parser)
 
     return parser.parse_args()
 
@@ -214,13 +208,16 @@ def get_lst_key_merge():
            ]
 
 
-def merge_capes_lattes(str_capes_file_name, str_lattes_file_name):
+def merge_capes_lattes(str_capes_file_name, str_lattes_file_name, dict_profile=None):
     """
     Merge CAPES and Lattes DataFrames based on various key configurations.
 
     Args:
         str_capes_file_name (str): Path to the CAPES Excel file.
         str_lattes_file_name (str): Path to the Lattes CSV file.
+        dict_profile (dict, optional): The profile of the run, as returned by
+            utils_profile.start_profile. The load and each merge pass are then
+            recorded as profile steps.
 
     Returns:
         list: A list containing the merged DataFrame and the updated CAPES DataFrame.
@@ -244,61 +241,62 @@ def merge_capes_lattes(str_capes_file_name, str_lattes_file_name):
         Additionally, it requires the pandas library and the fuzzywuzzy module to be imported.
     """
     lst_key_merge = get_lst_key_merge()
-    df_capes = get_df_capes(str_capes_file_name)
-    df_lattes = get_df_lattes(str_lattes_file_name)
+    with profile.profile_step(dict_profile, 'load'):
+        df_capes = get_df_capes(str_capes_file_name)
+        df_lattes = get_df_lattes(str_lattes_file_name)
 
     df_match = None
     str_progress = 'i:{}, count:{}, low_match:{}, key: {}'
     i = 0
 
     for key_merge in lst_key_merge:
-        df_merge = df_capes.merge(df_lattes,
-                                  left_on=key_merge[0],
-                                  right_on=key_merge[1])
-
-        if 'NM_DOCENTE' in key_merge[0]:
-            df_merge['match_nome'] = 100
-        else:
-            df_merge['match_nome'] = [fuzz.token_sort_ratio(x, y) for (x, y) in
-                                      zip(df_merge['NM_DOCENTE'],
-                                          df_merge['NOME-COMPLETO'])]
-            df_merge = df_merge[df_merge.match_nome >= 75]
-
-        if 'NM_IES_TITULACAO' in key_merge[0]:
-            df_merge['match_instit'] = 100
-        else:
-            df_merge['match_instit'] = [fuzz.token_sort_ratio(x, y) for (x, y) in
-                                        zip(df_merge['NM_IES_TITULACAO'],
-                                            df_merge['NOME-INSTITUICAO'])]
-
-        df_merge['match_ano'] = [abs(int(x)-int(y)) for (x, y) in
-                                 zip(df_merge['AN_TITULACAO'], df_merge['AnoTitulacao'])]
-
-        df_merge['match'] = [((x / 100) * (y / 100)) * 100 for (x, y) in
-                             zip(df_merge['match_nome'],
-                                 df_merge['match_instit'])]
-
-        if i < 1:
-            df_merge = df_merge.drop_duplicates(['id_capes'], keep='last')
-        else:
-            df_merge = df_merge.sort_values(by=['id_capes', 'match_nome',
-                                                'match_ano', 'match_instit'],
-                                            ascending=[True, True, False, True])
-            df_merge = df_merge.drop_duplicates(['id_capes'], keep='last')
-
-
-        df_merge['key_match'] = ' - '.join(key_merge[0])
-        df_merge['index_match'] = i
-
-        df_match = pd.concat([df_match, df_merge],
-                             ignore_index=True, sort=False)
-
-        df_capes = remove_rows_by_key(df_match, df_capes, 'id_capes')
-        df_lattes = remove_rows_by_key(df_match, df_lattes, 'FILE-NAME')
-
-        print(str_progress.format(str(i), len(df_merge),
-                                  len(df_merge[df_merge.match < 50]),
-                                  '+'.join(key_merge[0])))
+        with profile.profile_step(dict_profile, 'merge {} {}'.format(i, '+'.join(key_merge[0]))):
+            df_merge = df_capes.merge(df_lattes,
+                                      left_on=key_merge[0],
+                                      right_on=key_merge[1])
+
+            if 'NM_DOCENTE' in key_merge[0]:
+                df_merge['match_nome'] = 100
+            else:
+                df_merge['match_nome'] = [fuzz.token_sort_ratio(x, y) for (x, y) in
+                                          zip(df_merge['NM_DOCENTE'],
+                                              df_merge['NOME-COMPLETO'])]
+                df_merge = df_merge[df_merge.match_nome >= 75]
+
+            if 'NM_IES_TITULACAO' in key_merge[0]:
+                df_merge['match_instit'] = 100
+            else:
+                df_merge['match_instit'] = [fuzz.token_sort_ratio(x, y) for (x, y) in
+                                            zip(df_merge['NM_IES_TITULACAO'],
+                                                df_merge['NOME-INSTITUICAO'])]
+
+            df_merge['match_ano'] = [abs(int(x)-int(y)) for (x, y) in
+                                     zip(df_merge['AN_TITULACAO'], df_merge['AnoTitulacao'])]
+
+            df_merge['match'] = [((x / 100) * (y / 100)) * 100 for (x, y) in
+                                 zip(df_merge['match_nome'],
+                                     df_merge['match_instit'])]
+
+            if i < 1:
+                df_merge = df_merge.drop_duplicates(['id_capes'], keep='last')
+            else:
+                df_merge = df_merge.sort_values(by=['id_capes', 'match_nome',
+                                                    'match_ano', 'match_instit'],
+                                                ascending=[True, True, False, True])
+                df_merge = df_merge.drop_duplicates(['id_capes'], keep='last')
+
+            df_merge['key_match'] = ' - '.join(key_merge[0])
+            df_merge['index_match'] = i
+
+            df_match = pd.concat([df_match, df_merge],
+                                 ignore_index=True, sort=False)
+
+            df_capes = remove_rows_by_key(df_match, df_capes, 'id_capes')
+            df_lattes = remove_rows_by_key(df_match, df_lattes, 'FILE-NAME')
+
+            print(str_progress.format(str(i), len(df_merge),
+                                      len(df_merge[df_merge.match < 50]),
+                                      '+'.join(key_merge[0])))
         i += 1
 
     df_match['duplicado'] = df_match.duplicated(['id_capes'], keep=False)
@@ -338,13 +336,18 @@ def remove_rows_by_key(df_base, df_to_clean, str_key):
 
     return df_to_clean[~df_to_clean[str_key].isin(df_unique[str_key])]
 
-def main():
+def main(args=None):
     """
     Perform the main processing tasks.
 
     This function serves as the entry point for the main processing tasks. It parses command-line
     arguments, performs CAPES and Lattes data merging, and writes the merged and cleaned data to
-    CSV files.
+    CSV files in the folder of the Lattes file.
+
+    Args:
+        args (argparse.Namespace, optional): The arguments, as parsed by get_args
+            or by the matching subcommand of lattes_cli. Parsed from the
+            command line when omitted.
 
     Example:
         To run the main function, you can call it directly:
@@ -358,20 +361,26 @@ def main():
         format_path() function to format file paths, and merge_capes_lattes() function to merge
         CAPES and Lattes data.
     """
-    args = get_args()
+    if args is None:
+        args = get_args()
+
     str_capes_file_name = args.capes_file
     str_lattes_file_name = args.lattes_file
+    str_output_path = os.path.dirname(os.path.abspath(str_lattes_file_name))
+
+    dict_profile = profile.start_profile(args.profile, 'merge')
 
-    str_capes_file_name = '../data/capes-2020.xlsx'
-    str_lattes_file_name = '../data/id_lattes_to_disambiguate.csv'
+    df_match, df_capes = merge_capes_lattes(str_capes_file_name, str_lattes_file_name,
+                                            dict_profile)
 
-    df_match, df_capes = merge_capes_lattes(str_capes_file_name, str_lattes_file_name)
+    with profile.profile_step(dict_profile, 'csv'):
+        df_match.to_csv(os.path.join(str_output_path, 'match_capes_x_lattes.csv'),
+                        index=False)
 
-    df_match.to_csv(f"../data/match_capes_x_lattes.csv",
-                    index=False)
+        df_capes.to_csv(os.path.join(str_output_path, 'capes_not_found_in_lattes.csv'),
+                        index=False)
 
-    df_capes.to_csv(f"../data/capes_not_found_in_lattes.csv",
-                    index=False)
+    profile.stop_profile(dict_profile)
 
 if __name__ == "__main__":
     main()
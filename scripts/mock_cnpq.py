@@ -0,0 +1,810 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 09:31:12 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import functools
+import hashlib
+import html
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+import zipfile
+
+# production items are drawn from a shared pool, so coauthored items repeat across CVs
+N_POOL_ITEMS = 50000
+
+LST_FIRST_NAMES = ['ANA', 'ANDRE', 'BEATRIZ', 'CARLOS', 'CLAUDIA', 'DANIEL', 'EDUARDO',
+                   'FERNANDA', 'GABRIEL', 'HELENA', 'JOAO', 'JULIANA', 'LUCAS', 'MARIA',
+                   'PAULO', 'RAFAEL', 'SANDRA', 'TIAGO', 'VANESSA', 'WAGNER']
+LST_SURNAMES = ['ALMEIDA', 'BARBOSA', 'CARVALHO', 'COSTA', 'FERREIRA', 'GOMES', 'LIMA',
+                'MARTINS', 'OLIVEIRA', 'PEREIRA', 'RIBEIRO', 'RODRIGUES', 'SANTOS', 'SILVA',
+                'SOUZA']
+LST_INSTITUTIONS = ['Universidade de Sao Paulo', 'Universidade Federal do Rio de Janeiro',
+                    'Universidade Estadual de Campinas', 'Universidade Federal de Minas Gerais',
+                    'Universidade Federal do Rio Grande do Sul', 'Universidade de Brasilia']
+LST_AREAS = ['Fisica', 'Quimica', 'Economia', 'Educacao', 'Medicina', 'Engenharia Civil',
+             'Ciencia da Computacao', 'Historia']
+
+# the paths of the endpoints, used as keys of the server counters
+LST_ENDPOINTS = ['busca.do', 'preview.do', 'visualizacv.do', 'download.do GET',
+                 'download.do POST']
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+
+    It accepts the options of add_args_mock plus --host and --port, the
+    address the server listens on.
+    """
+    parser = argparse.ArgumentParser(description='Servidor local que imita o '
+                                     'buscatextual do CNPq.')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='endereco do servidor')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='porta do servidor')
+    add_args_mock(parser)
+
+    return parser.parse_args()
+
+
+def add_args_mock(parser):
+    """
+    Add the behaviour options of the mock server to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of this script or of the benchmark.
+
+    Returns:
+        None
+    """
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='latencia mediana de cada resposta, em segundos')
+    parser.add_argument('--latency-sigma', type=float, default=0.5,
+                        help='dispersao (lognormal) da latencia; valores maiores '
+                        'aumentam a cauda')
+    parser.add_argument('--error-rate', type=float, default=0.02,
+                        help='fracao das requisicoes respondidas com HTTP 500 ou 429')
+    parser.add_argument('--cv-kb', type=float, default=200.0,
+                        help='tamanho mediano do curriculo.xml, em KB')
+    parser.add_argument('--cv-kb-sigma', type=float, default=1.0,
+                        help='dispersao (lognormal) do tamanho dos curriculos')
+    parser.add_argument('--cv-kb-max', type=float, default=20000.0,
+                        help='tamanho maximo do curriculo.xml, em KB')
+    parser.add_argument('--homonym-rate', type=float, default=0.2,
+                        help='fracao dos nomes com mais de um resultado na busca')
+    parser.add_argument('--not-found-rate', type=float, default=0.05,
+                        help='fracao dos nomes sem resultado na busca')
+    parser.add_argument('--preview-no-id-rate', type=float, default=0.0,
+                        help='fracao das paginas de preview sem o ID Lattes, lido entao '
+                        'na pagina do curriculo')
+    parser.add_argument('--captcha-latency', type=float, default=1.0,
+                        help='tempo mediano de resolucao de um captcha, em segundos')
+    parser.add_argument('--captcha-incorrect-rate', type=float, default=0.05,
+                        help='fracao dos captchas que o servico nao resolve')
+    parser.add_argument('--captcha-reject-rate', type=float, default=0.05,
+                        help='fracao dos tokens resolvidos recusados no download')
+    parser.add_argument('--token-ttl', type=float, default=120.0,
+                        help='validade de um token, em segundos')
+    parser.add_argument('--balance', type=float, default=1000.0,
+                        help='saldo inicial do servico de captcha, em centavos de dolar')
+    parser.add_argument('--captcha-cost', type=float, default=0.289,
+                        help='custo de cada captcha, em centavos de dolar')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='semente da injecao de erros e das latencias')
+
+
+def get_dict_mock(args):
+    """
+    Create the state shared by the request handlers of the mock server.
+
+    Args:
+        args (argparse.Namespace): The options added by add_args_mock.
+
+    Returns:
+        dict: The options, the random generator of latencies and errors,
+        the tokens issued by the fake captcha service with their issue time,
+        the balance, the per-endpoint counters and the lock that guards them.
+
+    The names, IDs and CVs do not depend on the seed: they are derived from
+    hashes, so every run of the server answers the same search the same way.
+
+    Example:
+        >>> dict_mock = get_dict_mock(get_args())
+    """
+    return {'args': args,
+            'random': random.Random(args.seed),
+            'dict_tokens': {},
+            'float_balance': args.balance,
+            'dict_stats': {x: {'requests': 0, 'errors': 0, 'bytes': 0, 'lst_seconds': []}
+                           for x in LST_ENDPOINTS},
+            'dict_captcha': {'decoded': 0, 'incorrect': 0, 'reported': 0, 'rejected': 0,
+                             'expired': 0},
+            'lock': threading.Lock()}
+
+
+def get_int_hash(str_key):
+    """
+    Get a stable integer from a string, the same in every process.
+
+    Example:
+        >>> get_int_hash('K4723925J2') % 10
+        3
+    """
+    return int(hashlib.md5(str_key.encode('utf-8')).hexdigest(), 16)
+
+
+def get_id_lattes(str_k_id):
+    """
+    Get the 16-digit CNPq ID of a K-id.
+
+    Args:
+        str_k_id (str): A K-id returned by the search.
+
+    Returns:
+        str: The CNPq ID, derived from the K-id alone, so the preview and
+        detail pages need no state.
+
+    Example:
+        >>> len(get_id_lattes('K4723925J2'))
+        16
+    """
+    return str(get_int_hash(str_k_id) % 10 ** 16).zfill(16)
+
+
+def get_lst_hits(dict_mock, str_name):
+    """
+    Get the search hits of a name.
+
+    Args:
+        dict_mock (dict): The server state, as returned by get_dict_mock.
+        str_name (str): The name searched.
+
+    Returns:
+        list: A list of tuples (K-id, Bolsista, snippet), empty for names
+        not found. A name always returns the same hits.
+
+    Example:
+        >>> get_lst_hits(dict_mock, 'MARIA SILVA')
+        [('K4580376E6', '', 'Doutorado em Historia pela Universidade Federal do Rio Grande do Sul')]
+    """
+    args = dict_mock['args']
+    rnd = random.Random(get_int_hash(str_name.upper()))
+
+    if rnd.random() < args.not_found_rate:
+        return []
+
+    n_hits = rnd.randint(2, 4) if rnd.random() < args.homonym_rate else 1
+
+    lst_hits = []
+    for _ in range(n_hits):
+        str_k_id = 'K{:07d}{}{}'.format(rnd.randrange(10 ** 7), rnd.choice('ABCDEFGHIJ'),
+                                        rnd.randrange(10))
+        str_bolsista = 'Bolsista de Produtividade em Pesquisa do CNPq - Nivel 2' \
+            if rnd.random() < 0.15 else ''
+        str_snippet = 'Doutorado em {} pela {}'.format(rnd.choice(LST_AREAS),
+                                                       rnd.choice(LST_INSTITUTIONS))
+        lst_hits.append((str_k_id, str_bolsista, str_snippet))
+
+    return lst_hits
+
+
+def get_date_updated(str_id_lattes):
+    """
+    Get the date of the last update of a CV.
+
+    Returns:
+        tuple: The day, month and year, as strings.
+
+    Example:
+        >>> get_date_updated('1234567890123456')
+        ('09', '10', '2019')
+    """
+    n_hash = get_int_hash(str_id_lattes)
+
+    return (str(n_hash % 28 + 1).zfill(2), str(n_hash // 28 % 12 + 1).zfill(2),
+            str(2014 + n_hash // 336 % 12))
+
+
+def get_n_cv_bytes(dict_mock, str_id_lattes):
+    """
+    Get the target size of the curriculo.xml of an ID, in bytes.
+    """
+    args = dict_mock['args']
+    rnd = random.Random(get_int_hash('size' + str_id_lattes))
+    float_kb = min(args.cv_kb_max, args.cv_kb * rnd.lognormvariate(0, args.cv_kb_sigma))
+
+    return int(float_kb * 1024)
+
+
+def get_str_item(n_item, str_id_lattes):
+    """
+    Get the XML of a production item of the shared pool.
+
+    Args:
+        n_item (int): The index of the item in the pool.
+        str_id_lattes (str): The CNPq ID of the CV that lists it.
+
+    Returns:
+        str: The XML element of the item, with the same children and
+        attributes as in a real CV.
+    """
+    rnd = random.Random(n_item)
+    str_title = 'Estudo {} sobre {} e {}'.format(n_item, rnd.choice(LST_AREAS).lower(),
+                                                 rnd.choice(LST_AREAS).lower())
+    str_year = str(rnd.randint(1995, 2026))
+    str_doi = '10.{}/mock.{}'.format(rnd.randint(1000, 9999), n_item) \
+        if rnd.random() < 0.6 else ''
+    str_issn = '{:04d}{:04d}'.format(rnd.randrange(10000), rnd.randrange(10000))
+    str_authors = ''.join('<AUTORES NOME-COMPLETO-DO-AUTOR="{0} {1}" '
+                          'NOME-PARA-CITACAO="{1}, {0}" ORDEM-DE-AUTORIA="{2}" '
+                          'NRO-ID-CNPQ="{3}"/>'.format(rnd.choice(LST_FIRST_NAMES),
+                                                       rnd.choice(LST_SURNAMES), n_order,
+                                                       str_id_lattes if n_order == 1 else '')
+                          for n_order in range(1, rnd.randint(2, 5)))
+    str_keywords = ('<PALAVRAS-CHAVE PALAVRA-CHAVE-1="mock" PALAVRA-CHAVE-2="lattes" '
+                    'PALAVRA-CHAVE-3="" PALAVRA-CHAVE-4="" PALAVRA-CHAVE-5="" '
+                    'PALAVRA-CHAVE-6=""/>'
+                    '<SETORES-DE-ATIVIDADE SETOR-DE-ATIVIDADE-1="" SETOR-DE-ATIVIDADE-2="" '
+                    'SETOR-DE-ATIVIDADE-3=""/>')
+
+    n_type = n_item % 20
+    if n_type < 12:
+        return ('<ARTIGO-PUBLICADO SEQUENCIA-PRODUCAO="{0}">'
+                '<DADOS-BASICOS-DO-ARTIGO NATUREZA="COMPLETO" TITULO-DO-ARTIGO="{1}" '
+                'ANO-DO-ARTIGO="{2}" PAIS-DE-PUBLICACAO="Brasil" IDIOMA="Portugues" '
+                'MEIO-DE-DIVULGACAO="IMPRESSO" DOI="{3}" TITULO-DO-ARTIGO-INGLES=""/>'
+                '<DETALHAMENTO-DO-ARTIGO TITULO-DO-PERIODICO-OU-REVISTA="Revista {4}" '
+                'ISSN="{5}" VOLUME="{6}" PAGINA-INICIAL="1" PAGINA-FINAL="20"/>'
+                '{7}{8}</ARTIGO-PUBLICADO>').format(n_item, str_title, str_year, str_doi,
+                                                    rnd.choice(LST_AREAS), str_issn,
+                                                    rnd.randint(1, 60), str_authors,
+                                                    str_keywords)
+    if n_type < 14:
+        return ('<LIVRO-PUBLICADO-OU-ORGANIZADO SEQUENCIA-PRODUCAO="{0}">'
+                '<DADOS-BASICOS-DO-LIVRO TIPO="LIVRO_PUBLICADO" NATUREZA="INTEGRAL" '
+                'TITULO-DO-LIVRO="{1}" ANO="{2}" PAIS-DE-PUBLICACAO="Brasil" DOI="{3}" '
+                'TITULO-DO-LIVRO-INGLES=""/>'
+                '<DETALHAMENTO-DO-LIVRO ISBN="978{4}" NOME-DA-EDITORA="Editora Mock"/>'
+                '{5}{6}</LIVRO-PUBLICADO-OU-ORGANIZADO>').format(n_item, str_title, str_year,
+                                                                 str_doi, str_issn,
+                                                                 str_authors, str_keywords)
+    if n_type < 16:
+        return ('<CAPITULO-DE-LIVRO-PUBLICADO SEQUENCIA-PRODUCAO="{0}">'
+                '<DADOS-BASICOS-DO-CAPITULO TIPO="Capitulo de livro publicado" '
+                'TITULO-DO-CAPITULO-DO-LIVRO="{1}" ANO="{2}" PAIS-DE-PUBLICACAO="Brasil" '
+                'DOI="{3}" TITULO-DO-CAPITULO-DO-LIVRO-INGLES=""/>'
+                '<DETALHAMENTO-DO-CAPITULO TITULO-DO-LIVRO="Coletanea {0}" ISBN="978{4}"/>'
+                '{5}{6}</CAPITULO-DE-LIVRO-PUBLICADO>').format(n_item, str_title, str_year,
+                                                               str_doi, str_issn,
+                                                               str_authors, str_keywords)
+    if n_type < 17:
+        return ('<TEXTO-EM-JORNAL-OU-REVISTA SEQUENCIA-PRODUCAO="{0}">'
+                '<DADOS-BASICOS-DO-TEXTO NATUREZA="JORNAL_DE_NOTICIAS" TITULO-DO-TEXTO="{1}" '
+                'ANO-DO-TEXTO="{2}" PAIS-DE-PUBLICACAO="Brasil" TITULO-DO-TEXTO-INGLES=""/>'
+                '<DETALHAMENTO-DO-TEXTO TITULO-DO-JORNAL-OU-REVISTA="Jornal Mock" '
+                'ISSN="{3}"/>{4}{5}</TEXTO-EM-JORNAL-OU-REVISTA>').format(n_item, str_title,
+                                                                         str_year, str_issn,
+                                                                         str_authors,
+                                                                         str_keywords)
+    if n_type < 19:
+        return ('<PARTICIPACAO-EM-CONGRESSO SEQUENCIA-PRODUCAO="{0}">'
+                '<DADOS-BASICOS-DA-PARTICIPACAO-EM-CONGRESSO NATUREZA="OUTRA" TITULO="{1}" '
+                'ANO="{2}" PAIS="Brasil" TITULO-INGLES=""/>'
+                '<DETALHAMENTO-DA-PARTICIPACAO-EM-CONGRESSO NOME-DO-EVENTO="Congresso {0}"/>'
+                '{3}</PARTICIPACAO-EM-CONGRESSO>').format(n_item, str_title, str_year,
+                                                         str_authors)
+
+    return ('<ORGANIZACAO-DE-EVENTO SEQUENCIA-PRODUCAO="{0}">'
+            '<DADOS-BASICOS-DA-ORGANIZACAO-DE-EVENTO TIPO="CONGRESSO" TITULO="{1}" '
+            'ANO="{2}" PAIS="Brasil" TITULO-INGLES=""/>'
+            '<DETALHAMENTO-DA-ORGANIZACAO-DE-EVENTO INSTITUICAO-PROMOTORA="Mock"/>'
+            '{3}</ORGANIZACAO-DE-EVENTO>').format(n_item, str_title, str_year, str_authors)
+
+
+@functools.lru_cache(maxsize=256)
+def get_cv_xml(str_id_lattes, n_bytes):
+    """
+    Generate the curriculo.xml of an ID.
+
+    Args:
+        str_id_lattes (str): The CNPq ID.
+        n_bytes (int): The approximate size of the XML, in bytes.
+
+    Returns:
+        bytes: The XML, encoded in ISO-8859-1 as the real files, with the
+        sections read by parse_xml_lattes. The same ID and size always give
+        the same CV.
+
+    Example:
+        >>> get_cv_xml('1234567890123456', 50000)[:44]
+        b'<?xml version="1.0" encoding="ISO-8859-1" ?>'
+    """
+    rnd = random.Random(get_int_hash('cv' + str_id_lattes))
+    str_day, str_month, str_year = get_date_updated(str_id_lattes)
+    str_name = '{} {} {}'.format(rnd.choice(LST_FIRST_NAMES), rnd.choice(LST_SURNAMES),
+                                 rnd.choice(LST_SURNAMES))
+
+    dict_sections = {'ARTIGO-PUBLICADO': [], 'LIVRO-PUBLICADO-OU-ORGANIZADO': [],
+                     'CAPITULO-DE-LIVRO-PUBLICADO': [], 'TEXTO-EM-JORNAL-OU-REVISTA': [],
+                     'PARTICIPACAO-EM-CONGRESSO': [], 'ORGANIZACAO-DE-EVENTO': []}
+    n_size = 3000
+    while n_size < n_bytes:
+        str_item = get_str_item(rnd.randrange(N_POOL_ITEMS), str_id_lattes)
+        dict_sections[str_item[1:str_item.index(' ')]].append(str_item)
+        n_size += len(str_item)
+
+    str_xml = ('<?xml version="1.0" encoding="ISO-8859-1" ?>'
+               '<CURRICULO-VITAE SISTEMA-ORIGEM-XML="LATTES_OFFLINE" '
+               'NUMERO-IDENTIFICADOR="{id}" DATA-ATUALIZACAO="{d}{m}{y}" HORA-ATUALIZACAO="101010">'
+               '<DADOS-GERAIS NOME-COMPLETO="{name}" NOME-EM-CITACOES-BIBLIOGRAFICAS="{name}" '
+               'NACIONALIDADE="B" PAIS-DE-NASCIMENTO="Brasil" UF-NASCIMENTO="SP">'
+               '<RESUMO-CV TEXTO-RESUMO-CV-RH="Pesquisador em {area}, curr&#237;culo gerado '
+               'pelo servidor de teste." TEXTO-RESUMO-CV-RH-EN=""/>'
+               '<FORMACAO-ACADEMICA-TITULACAO>'
+               '<GRADUACAO NOME-INSTITUICAO="{inst}" ANO-DE-CONCLUSAO="{y_grad}"/>'
+               '<DOUTORADO NOME-INSTITUICAO="{inst}" NOME-CURSO="{area}" '
+               'ANO-DE-OBTENCAO-DO-TITULO="{y_phd}" TITULO-DA-DISSERTACAO-TESE="Tese {id}">'
+               '<PALAVRAS-CHAVE PALAVRA-CHAVE-1="{area}"/></DOUTORADO>'
+               '</FORMACAO-ACADEMICA-TITULACAO>'
+               '<AREAS-DE-ATUACAO><AREA-DE-ATUACAO NOME-GRANDE-AREA-DO-CONHECIMENTO="MOCK" '
+               'NOME-DA-AREA-DO-CONHECIMENTO="{area}"/></AREAS-DE-ATUACAO>'
+               '<PREMIOS-TITULOS><PREMIO-TITULO NOME-DO-PREMIO-OU-TITULO="Premio Mock" '
+               'ANO-DA-PREMIACAO="{y_phd}"/></PREMIOS-TITULOS>'
+               '</DADOS-GERAIS>'
+               '<PRODUCAO-BIBLIOGRAFICA>'
+               '<ARTIGOS-PUBLICADOS>{artigos}</ARTIGOS-PUBLICADOS>'
+               '<LIVROS-E-CAPITULOS>'
+               '<LIVROS-PUBLICADOS-OU-ORGANIZADOS>{livros}</LIVROS-PUBLICADOS-OU-ORGANIZADOS>'
+               '<CAPITULOS-DE-LIVROS-PUBLICADOS>{capitulos}</CAPITULOS-DE-LIVROS-PUBLICADOS>'
+               '</LIVROS-E-CAPITULOS>'
+               '<TEXTOS-EM-JORNAIS-OU-REVISTAS>{textos}</TEXTOS-EM-JORNAIS-OU-REVISTAS>'
+               '</PRODUCAO-BIBLIOGRAFICA>'
+               '<PRODUCAO-TECNICA><DEMAIS-TIPOS-DE-PRODUCAO-TECNICA>{eventos}'
+               '</DEMAIS-TIPOS-DE-PRODUCAO-TECNICA></PRODUCAO-TECNICA>'
+               '<DADOS-COMPLEMENTARES><PARTICIPACAO-EM-EVENTOS-CONGRESSOS>{congressos}'
+               '</PARTICIPACAO-EM-EVENTOS-CONGRESSOS></DADOS-COMPLEMENTARES>'
+               '</CURRICULO-VITAE>').format(
+                   id=str_id_lattes, d=str_day, m=str_month, y=str_year, name=str_name,
+                   area=rnd.choice(LST_AREAS), inst=rnd.choice(LST_INSTITUTIONS),
+                   y_grad=rnd.randint(1975, 2010), y_phd=rnd.randint(1985, 2020),
+                   artigos=''.join(dict_sections['ARTIGO-PUBLICADO']),
+                   livros=''.join(dict_sections['LIVRO-PUBLICADO-OU-ORGANIZADO']),
+                   capitulos=''.join(dict_sections['CAPITULO-DE-LIVRO-PUBLICADO']),
+                   textos=''.join(dict_sections['TEXTO-EM-JORNAL-OU-REVISTA']),
+                   eventos=''.join(dict_sections['ORGANIZACAO-DE-EVENTO']),
+                   congressos=''.join(dict_sections['PARTICIPACAO-EM-CONGRESSO']))
+
+    return str_xml.encode('iso-8859-1')
+
+
+@functools.lru_cache(maxsize=256)
+def get_cv_zip(str_id_lattes, n_bytes):
+    """
+    Generate the zip file of an ID, holding its curriculo.xml.
+
+    Example:
+        >>> zipfile.ZipFile(io.BytesIO(get_cv_zip('1234567890123456', 50000))).namelist()
+        ['curriculo.xml']
+    """
+    bytes_io = io.BytesIO()
+    with zipfile.ZipFile(bytes_io, 'w', zipfile.ZIP_DEFLATED) as cv_zip:
+        cv_zip.writestr('curriculo.xml', get_cv_xml(str_id_lattes, n_bytes))
+
+    return bytes_io.getvalue()
+
+
+def get_html_page(str_body):
+    """
+    Wrap the body of a page in the HTML of the buscatextual pages.
+    """
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+            '<title>Buscatextual (mock)</title></head><body>{}</body></html>'
+            .format(str_body)).encode('utf-8')
+
+
+def get_html_search(dict_mock, str_name):
+    """
+    Get the search form, or the results page of a name.
+
+    Args:
+        dict_mock (dict): The server state, as returned by get_dict_mock.
+        str_name (str or None): The name searched, None for the empty form.
+
+    Returns:
+        bytes: The page. Both have the field textoBusca and the button
+        botaoBuscaFiltros used by download_id_lattes; the results page also has
+        the pagination block it waits for and one <li> per hit, in the layout
+        of the real site.
+    """
+    str_form = ('<form method="get" action="busca.do">'
+                '<input type="hidden" name="metodo" value="buscar">'
+                '<input type="text" id="textoBusca" name="textoBusca" value="{}">'
+                '<button type="submit" id="botaoBuscaFiltros">Buscar</button></form>'
+                .format(html.escape(str_name or '')))
+
+    if str_name is None:
+        return get_html_page(str_form)
+
+    str_items = ''.join('<li><b><a href="javascript:abreDetalhe(\'{0}\',\'{1}\',{2},)">{3}'
+                        '</a></b><img class="ico-cv" src="images/curriculo.png"><br>'
+                        '{4}{5}</li>'.format(str_k_id,
+                                             str_name.replace(' ', '_').replace("'", ''),
+                                             get_int_hash(str_k_id) % 10 ** 7,
+                                             html.escape(str_name),
+                                             '<span class="bolsista">{}</span><br>'.format(
+                                                 str_bolsista) if str_bolsista else '',
+                                             html.escape(str_snippet))
+                        for str_k_id, str_bolsista, str_snippet in get_lst_hits(dict_mock,
+                                                                                str_name))
+
+    return get_html_page('{}<div class="resultado"><ol>{}</ol></div>'
+                         '<div class="paginacao"><a href="#">1</a></div>'
+                         .format(str_form, str_items))
+
+
+def get_html_cv_page(dict_mock, str_k_id, b_preview):
+    """
+    Get the preview page or the full CV page of a K-id.
+
+    Args:
+        dict_mock (dict): The server state, as returned by get_dict_mock.
+        str_k_id (str): The K-id of the search result.
+        b_preview (bool): True for preview.do, False for visualizacv.do.
+
+    Returns:
+        bytes: The page, with the CNPq ID where download_id_lattes looks for
+        it and the date of the last update of the CV. The preview of the
+        K-ids of is_preview_without_id has no CNPq ID.
+    """
+    str_id_lattes = get_id_lattes(str_k_id)
+    str_date = 'Última atualização do currículo em {}/{}/{}'.format(
+        *get_date_updated(str_id_lattes))
+
+    if b_preview and is_preview_without_id(dict_mock, str_k_id):
+        return get_html_page('<div class="preview"><span class="atualizacao">{}</span></div>'
+                             .format(str_date))
+
+    if b_preview:
+        return get_html_page('<div class="preview"><a class="m-logo" href="javascript:'
+                             'abrirLink(\'http://lattes.cnpq.br/{}\')">CV</a>'
+                             '<span class="atualizacao">{}</span></div>'
+                             .format(str_id_lattes, str_date))
+
+    return get_html_page('<ul class="informacoes-autor"><li>Endereço para acessar este CV: '
+                         '<span style="font-weight: bold; color: #326C99;">{}</span></li>'
+                         '<li>{}</li></ul>'.format(str_id_lattes, str_date))
+
+
+def decode_captcha(dict_mock):
+    """
+    Solve a CAPTCHA, as the fake captcha service.
+
+    Args:
+        dict_mock (dict): The server state, as returned by get_dict_mock.
+
+    Returns:
+        dict: The answer of DeathByCaptcha's decode: 'captcha' (its number),
+        'text' (the token) and 'is_correct'.
+
+    Sleeps for the solve time, then charges the CAPTCHA. Unsolved CAPTCHAs
+    come back with is_correct False. A fraction of the solved tokens is not
+    registered, so the download page refuses them as the real site refuses
+    bad tokens.
+    """
+    args = dict_mock['args']
+
+    with dict_mock['lock']:
+        float_seconds = dict_mock['random'].lognormvariate(0, 0.5) * args.captcha_latency
+        float_draw = dict_mock['random'].random()
+    time.sleep(float_seconds)
+
+    str_token = uuid.uuid4().hex
+    with dict_mock['lock']:
+        dict_mock['dict_captcha']['decoded'] += 1
+        n_captcha = dict_mock['dict_captcha']['decoded']
+        dict_mock['float_balance'] -= args.captcha_cost
+
+        if float_draw < args.captcha_incorrect_rate:
+            dict_mock['dict_captcha']['incorrect'] += 1
+            return {'captcha': n_captcha, 'text': '', 'is_correct': False}
+
+        if float_draw >= args.captcha_incorrect_rate + args.captcha_reject_rate:
+            dict_mock['dict_tokens'][str_token] = time.monotonic()
+
+    return {'captcha': n_captcha, 'text': str_token, 'is_correct': True}
+
+
+def is_preview_without_id(dict_mock, str_k_id):
+    """
+    Tell whether the preview page of a K-id does not show the CNPq ID, as
+    happens with some CVs on CNPq. A K-id always gets the same answer.
+
+    Example:
+        >>> is_preview_without_id(dict_mock, 'K4723925J2')
+        False
+    """
+    rnd = random.Random(get_int_hash('preview' + str_k_id))
+
+    return rnd.random() < dict_mock['args'].preview_no_id_rate
+
+
+def use_token(dict_mock, str_token):
+    """
+    Check and consume a token sent to the download page.
+
+    Returns:
+        bool: True if the token was issued, not used yet and not expired.
+    """
+    with dict_mock['lock']:
+        float_issued = dict_mock['dict_tokens'].pop(str_token, None)
+        if float_issued is None:
+            dict_mock['dict_captcha']['rejected'] += 1
+            return False
+        if time.monotonic() - float_issued > dict_mock['args'].token_ttl:
+            dict_mock['dict_captcha']['expired'] += 1
+            return False
+
+    return True
+
+
+def get_dict_stats(dict_mock):
+    """
+    Get the counters of the server.
+
+    Args:
+        dict_mock (dict): The server state, as returned by get_dict_mock.
+
+    Returns:
+        dict: Per endpoint, the number of requests, of injected errors and
+        of bytes sent, and the p50/p95/p99/max handling times in seconds;
+        the CAPTCHA counters; and the balance left.
+    """
+    with dict_mock['lock']:
+        dict_endpoints = {}
+        for str_endpoint, dict_endpoint in dict_mock['dict_stats'].items():
+            lst_seconds = sorted(dict_endpoint['lst_seconds'])
+            n_size = len(lst_seconds)
+            dict_endpoints[str_endpoint] = {
+                'requests': dict_endpoint['requests'],
+                'errors': dict_endpoint['errors'],
+                'bytes': dict_endpoint['bytes'],
+                'latency': {str_key: round(lst_seconds[min(n_size - 1, int(n_size * float_q))], 4)
+                            for str_key, float_q in [('p50', 0.5), ('p95', 0.95),
+                                                     ('p99', 0.99), ('max', 1.0)]}
+                           if n_size else {}}
+
+        return {'endpoints': dict_endpoints,
+                'captcha': dict(dict_mock['dict_captcha']),
+                'balance': round(dict_mock['float_balance'], 3)}
+
+
+class MockCnpqHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the mock server; the state is in self.server.dict_mock.
+
+    Serves busca.do, preview.do, visualizacv.do and download.do under
+    /buscatextual/, the fake captcha service under /captcha/ and the counters
+    under /mock/stats. Every buscatextual request waits the configured
+    latency and may fail with HTTP 500 or 429.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        """
+        Keep the request log out of the benchmark output.
+        """
+
+    def send_content(self, n_status, str_content_type, bytes_content):
+        """
+        Send a complete response, with its length so the connection is kept alive.
+        """
+        self.send_response(n_status)
+        self.send_header('Content-Type', str_content_type)
+        self.send_header('Content-Length', str(len(bytes_content)))
+        self.end_headers()
+        self.wfile.write(bytes_content)
+
+    def handle_cnpq(self, str_endpoint, func_content):
+        """
+        Answer a buscatextual request, injecting latency and errors.
+
+        Args:
+            str_endpoint (str): The key of the endpoint counters.
+            func_content (function): Returns the status, content type and body.
+        """
+        dict_mock = self.server.dict_mock
+        args = dict_mock['args']
+        time_start = time.monotonic()
+
+        with dict_mock['lock']:
+            float_seconds = dict_mock['random'].lognormvariate(0, args.latency_sigma) * args.latency
+            float_draw = dict_mock['random'].random()
+        time.sleep(float_seconds)
+
+        if float_draw < args.error_rate:
+            n_status, str_content_type = (429 if float_draw < args.error_rate / 2 else 500), 'text/html'
+            bytes_content = get_html_page('Erro {}'.format(n_status))
+        else:
+            n_status, str_content_type, bytes_content = func_content()
+
+        self.send_content(n_status, str_content_type, bytes_content)
+
+        with dict_mock['lock']:
+            dict_endpoint = dict_mock['dict_stats'][str_endpoint]
+            dict_endpoint['requests'] += 1
+            dict_endpoint['errors'] += int(float_draw < args.error_rate)
+            dict_endpoint['bytes'] += len(bytes_content)
+            dict_endpoint['lst_seconds'].append(time.monotonic() - time_start)
+
+    def do_GET(self):
+        """
+        Answer the GET requests.
+        """
+        dict_mock = self.server.dict_mock
+        url = urllib.parse.urlsplit(self.path)
+        dict_query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+        if url.path == '/buscatextual/busca.do':
+            self.handle_cnpq('busca.do', lambda: (200, 'text/html; charset=utf-8',
+                                                  get_html_search(dict_mock,
+                                                                  dict_query.get('textoBusca'))))
+        elif url.path in ('/buscatextual/preview.do', '/buscatextual/visualizacv.do'):
+            b_preview = url.path.endswith('preview.do')
+            self.handle_cnpq('preview.do' if b_preview else 'visualizacv.do',
+                             lambda: (200, 'text/html; charset=utf-8',
+                                      get_html_cv_page(dict_mock, dict_query.get('id', ''),
+                                                       b_preview)))
+        elif url.path == '/buscatextual/download.do':
+            self.handle_cnpq('download.do GET', lambda: (200, 'text/html; charset=utf-8',
+                                                         get_html_page('Download do CV')))
+        elif url.path == '/captcha/balance':
+            with dict_mock['lock']:
+                float_balance = dict_mock['float_balance']
+            self.send_content(200, 'application/json', json.dumps(float_balance).encode())
+        elif url.path == '/mock/stats':
+            self.send_content(200, 'application/json',
+                              json.dumps(get_dict_stats(dict_mock)).encode())
+        else:
+            self.send_content(404, 'text/html', get_html_page('Nao encontrado'))
+
+    def do_POST(self):
+        """
+        Answer the POST requests: the CV download and the fake captcha service.
+        """
+        dict_mock = self.server.dict_mock
+        bytes_body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        str_path = urllib.parse.urlsplit(self.path).path
+
+        if str_path == '/buscatextual/download.do':
+            dict_form = {k: v[0] for k, v in
+                         urllib.parse.parse_qs(bytes_body.decode('utf-8')).items()}
+
+            def get_download():
+                str_id_lattes = dict_form.get('idcnpq', '')
+                if not use_token(dict_mock, dict_form.get('tokenCaptchar', '')):
+                    return 200, 'text/html; charset=utf-8', get_html_page('Captcha invalido')
+                return 200, 'application/zip', get_cv_zip(str_id_lattes,
+                                                          get_n_cv_bytes(dict_mock,
+                                                                         str_id_lattes))
+
+            self.handle_cnpq('download.do POST', get_download)
+        elif str_path == '/captcha/decode':
+            self.send_content(200, 'application/json',
+                              json.dumps(decode_captcha(dict_mock)).encode())
+        elif str_path == '/captcha/report':
+            with dict_mock['lock']:
+                dict_mock['dict_captcha']['reported'] += 1
+            self.send_content(200, 'application/json', b'true')
+        else:
+            self.send_content(404, 'text/html', get_html_page('Nao encontrado'))
+
+
+def get_server(dict_mock, str_host, n_port):
+    """
+    Create the mock server; port 0 picks a free port.
+
+    Returns:
+        ThreadingHTTPServer: The server, not started yet. Its URL is
+        'http://{}:{}'.format(*server.server_address).
+
+    Example:
+        >>> server = get_server(get_dict_mock(args), '127.0.0.1', 0)
+        >>> Thread(target=server.serve_forever, daemon=True).start()
+    """
+    server = ThreadingHTTPServer((str_host, n_port), MockCnpqHandler)
+    server.daemon_threads = True
+    server.dict_mock = dict_mock
+
+    return server
+
+
+class FakeCaptchaClient:
+    """
+    Stand-in for the DeathByCaptcha client, backed by the mock server.
+
+    Args:
+        str_url_base (str): The URL of the mock server.
+
+    Has the decode, report and get_balance methods used by
+    download_xml_lattes.solve_captcha and get_balance. The tokens it returns
+    are accepted once by the download page of the same server.
+
+    Example:
+        >>> dbc_client = FakeCaptchaClient('http://127.0.0.1:8080')
+        >>> dbc_client.decode(type=4, token_params='{}')['is_correct']
+        True
+    """
+
+    def __init__(self, str_url_base):
+        self.str_url_base = str_url_base.rstrip('/')
+
+    def request(self, str_path, bytes_data=None):
+        """
+        Call the fake captcha service and decode its JSON answer.
+        """
+        with urllib.request.urlopen(self.str_url_base + str_path, data=bytes_data,
+                                    timeout=600) as response:
+            return json.loads(response.read())
+
+    def decode(self, type=None, token_params=None, **kwargs):
+        """
+        Solve a CAPTCHA; returns a dict with 'captcha', 'text' and 'is_correct'.
+        """
+        return self.request('/captcha/decode', (token_params or '{}').encode('utf-8'))
+
+    def report(self, n_captcha):
+        """
+        Report an incorrectly solved CAPTCHA.
+        """
+        return self.request('/captcha/report', str(n_captcha).encode('utf-8'))
+
+    def get_balance(self):
+        """
+        Get the balance left, in US cents.
+        """
+        return self.request('/captcha/balance')
+
+
+def main():
+    """
+    Run the mock server until interrupted.
+
+    Point the scripts to it with the environment variable LATTES_BASE_URL
+    and set LATTES_FAKE_CAPTCHA to use its captcha service instead of
+    DeathByCaptcha.
+
+    Example:
+        $ python mock_cnpq.py --port 8080 --error-rate 0.05
+        $ LATTES_BASE_URL=http://127.0.0.1:8080 LATTES_FAKE_CAPTCHA=1 \\
+            python download_xml_lattes.py ids.csv /tmp/xml_lattes
+    """
+    args = get_args()
+    server = get_server(get_dict_mock(args), args.host, args.port)
+    print('mock CNPq em http://{}:{}'.format(*server.server_address))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(get_dict_stats(server.dict_mock), indent=2))
+
+if __name__ == "__main__":
+    main()
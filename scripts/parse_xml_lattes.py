@@ -7,49 +7,165 @@ Created on Sun Aug 21 19:27:07 2022
 """
 
 import argparse
-import xml.etree.ElementTree as ET
+import collections
+from functools import partial
+import csv
 import glob
-import time
+import io
 import multiprocessing
 import zipfile
 import os
+import sys
 import pandas as pd
+import utils_args as cli_args
+import utils_cv_store as store
+import utils_fingerprint as fingerprint
 import utils_lattes_cnpq as util
+import utils_parse_parts as parts
+import utils_profile as profile
+import utils_schedule as schedule
+import utils_shard as shard
+import utils_xml as xml_backend
 
 COUNT_PARSE = multiprocessing.Value('i', 0)
 
-def convert_lst_prod_to_dataframe(lst_prod):
+# attributes of the authors, keywords and sectors of a production, left out
+# of lattes_producao, so they are not even sent back by the pool workers
+LST_PROD_ATTS_DROPPED = [
+    'NOME-PARA-CITACAO', 'ORDEM-DE-AUTORIA',
+    'NRO-ID-CNPQ',
+    'PALAVRA-CHAVE-1', 'PALAVRA-CHAVE-2', 'PALAVRA-CHAVE-3',
+    'PALAVRA-CHAVE-4', 'PALAVRA-CHAVE-5', 'PALAVRA-CHAVE-6',
+    'SETOR-DE-ATIVIDADE-1', 'SETOR-DE-ATIVIDADE-2', 'SETOR-DE-ATIVIDADE-3',
+    'NOME-COMPLETO-DO-AUTOR'
+]
+
+# children of a production node holding only attributes of LST_PROD_ATTS_DROPPED,
+# skipped without reading their attributes
+LST_PROD_TAGS_DROPPED = ['AUTORES', 'PALAVRAS-CHAVE', 'SETORES-DE-ATIVIDADE']
+
+# columns read by convert_dict_prod_to_dataframe and convert_df_producao_to_items,
+# added empty when no CV of a part of the parse has them
+LST_PROD_COLUMNS = [
+    'Identificador', 'tipo_prod', 'FINGERPRINT', 'ID_ITEM',
+    'TITULO', 'TITULO-DO-ARTIGO', 'TITULO-DO-LIVRO', 'TITULO-DO-CAPITULO-DO-LIVRO',
+    'TITULO-DO-TEXTO', 'TITULO-INGLES', 'TITULO-DO-ARTIGO-INGLES', 'TITULO-DO-LIVRO-INGLES',
+    'TITULO-DO-CAPITULO-DO-LIVRO-INGLES', 'TITULO-DO-TEXTO-INGLES', 'ISSN', 'ISBN',
+    'ANO', 'ANO-DO-TEXTO', 'ANO-DO-ARTIGO', 'PAIS', 'PAIS-DE-PUBLICACAO',
+    'TITULO-DO-JORNAL-OU-REVISTA', 'TITULO-DO-PERIODICO-OU-REVISTA', 'DOI'
+]
+
+# columns of id_lattes_to_disambiguate.csv, read by merge_capes_x_lattes
+LST_DISAMBIGUATE_COLUMNS = ['FILE-NAME', 'NOME-COMPLETO', 'ANO-DE-OBTENCAO-DO-TITULO',
+                            'NOME-INSTITUICAO']
+
+# elements of the DADOS-GERAIS of a CV after which --disambiguate-only stops
+# reading it, as the four columns are all known by then
+LST_DISAMBIGUATE_STOP_TAGS = ['FORMACAO-ACADEMICA-TITULACAO', 'DADOS-GERAIS']
+
+# CSV files written by save_lst_lattes
+LST_CSV_FILES = ['lattes_producao.csv', 'lattes_producao_item.csv', 'lattes_producao_cv.csv',
+                 'lattes_dados_gerais.csv', 'lattes_formacao.csv',
+                 'id_lattes_to_disambiguate.csv']
+
+def append_batch(dict_columns, n_rows, tpl_batch):
     """
-    Convert a list of dictionaries representing production information to a pandas DataFrame.
+    Append a batch of productions to the columns of lattes_producao.
 
     Args:
-        lst_prod (list): A list of dictionaries containing production information.
+        dict_columns (dict): The lists of values, by column, of the rows
+            appended so far. A list is shorter than n_rows when the last
+            batches lacked its column; the missing values are None.
+        n_rows (int): The number of rows appended so far.
+        tpl_batch (tuple): A batch returned by parse_files_get_batch.
+
+    Returns:
+        int: The number of rows after the batch.
+
+    The ID and the type of the batch are repeated as references to the same
+    string, so no dict is built per production in the parent.
+
+    Example:
+        >>> n_rows = append_batch(dict_columns, 0, lattes[2])
+    """
+    str_id, str_tipo_prod, tpl_columns, lst_values = tpl_batch
+    if not tpl_columns:
+        return n_rows
+
+    n_batch = len(lst_values[0])
+    lst_columns = [('Identificador', (str_id,) * n_batch)]
+    lst_columns.extend(zip(tpl_columns, lst_values))
+    lst_columns.append(('tipo_prod', (str_tipo_prod,) * n_batch))
+
+    for str_column, tpl_values in lst_columns:
+        lst_column = dict_columns.setdefault(str_column, [])
+        lst_column.extend([None] * (n_rows - len(lst_column)))
+        lst_column.extend(tpl_values)
+
+    return n_rows + n_batch
+
+
+def convert_df_producao_to_items(df_producao):
+    """
+    Get the table of distinct productions and the table linking them to the CVs.
+
+    Args:
+        df_producao (pandas.DataFrame): The productions, as returned by
+            convert_dict_prod_to_dataframe, with the ID_ITEM and FINGERPRINT
+            columns computed by parse_files_get_batch.
+
+    Returns:
+        tuple: The items, one row per ID_ITEM with its fingerprint and the
+        type, year, title, ISSN or ISBN and DOI of its first occurrence, and
+        the links, one row per distinct pair of FILE-NAME and ID_ITEM.
+
+    A coauthored article appears once in the CV of each coauthor, so counting
+    distinct productions, e.g. of a program, becomes a join of integers on
+    the links instead of a comparison of titles. The productions without DOI
+    and without title have no ID_ITEM and are left out of both tables.
+
+    Example:
+        >>> df_item, df_producao_cv = convert_df_producao_to_items(df_producao)
+        >>> df_producao_cv.merge(df_match, on='FILE-NAME')['ID_ITEM'].nunique()
+        18230
+    """
+    df_producao = df_producao[df_producao['ID_ITEM'] != '']
+
+    df_item = df_producao.drop_duplicates('ID_ITEM').reindex(
+        columns=['ID_ITEM', 'FINGERPRINT', 'tipo_prod', 'ANO', 'TITULO',
+                 'NUM-CLASSIFICACAO', 'DOI'], fill_value='')
+
+    df_producao_cv = df_producao.loc[:, ['Identificador', 'ID_ITEM']].drop_duplicates()
+    df_producao_cv.columns = ['FILE-NAME', 'ID_ITEM']
+
+    return df_item, df_producao_cv
+
+
+def convert_dict_prod_to_dataframe(dict_prod):
+    """
+    Convert the columns of production information to a pandas DataFrame.
+
+    Args:
+        dict_prod (dict): The lists of values, by column, built by append_batch.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the production information.
 
-    This function converts a list of dictionaries representing production
-    information into a pandas DataFrame.
+    This function converts the columns of production information into a
+    pandas DataFrame.
     It performs various data manipulation operations such as combining columns,
-    deleting unnecessary columns,
+    deleting redundant columns,
     filling missing values, and formatting column values. The resulting DataFrame is returned.
 
     Example:
-        If lst_prod is a list of dictionaries representing production information,
+        If dict_prod holds the columns of the production information,
         the function will return
         a pandas DataFrame containing the production information in tabular format.
     """
-    df_producao = pd.DataFrame(lst_prod)
-
-    columns_to_remove = [
-        'NOME-PARA-CITACAO', 'ORDEM-DE-AUTORIA',
-        'NRO-ID-CNPQ',
-        'PALAVRA-CHAVE-1', 'PALAVRA-CHAVE-2', 'PALAVRA-CHAVE-3',
-        'PALAVRA-CHAVE-4', 'PALAVRA-CHAVE-5', 'PALAVRA-CHAVE-6',
-        'SETOR-DE-ATIVIDADE-1', 'SETOR-DE-ATIVIDADE-2', 'SETOR-DE-ATIVIDADE-3',
-        'NOME-COMPLETO-DO-AUTOR'
-    ]
-    df_producao.drop(columns=columns_to_remove, inplace=True)
+    df_producao = pd.DataFrame(dict_prod)
+    for str_column in LST_PROD_COLUMNS:
+        if str_column not in df_producao.columns:
+            df_producao[str_column] = ''
 
     df_producao.fillna('', inplace=True)
 
@@ -95,32 +211,18 @@ def convert_lst_prod_to_dataframe(lst_prod):
     return df_producao
 
 
-def dictify_flat(str_id, node):
+def count_parse():
     """
-    Convert XML node and its children attributes to a dictionary.
-
-    Args:
-        str_id (str): The identifier associated with the XML node.
-        node (xml.etree.ElementTree.Element): The XML node to be converted.
+    Increment the shared count of parsed files, printing it every 100 files.
 
     Returns:
-        dict: A dictionary containing the attributes of the XML node and its children.
-
-    This function takes an XML node and its associated identifier as input and converts
-    the attributes of the node and its children into a dictionary. It adds the identifier
-    as a key-value pair with the key 'Identificador' in the dictionary.
-
-    Example:
-        If str_id is '123' and node has children with attributes {'name': 'John', 'age': '30'},
-        the function will return {'Identificador': '123', 'name': 'John', 'age': '30'}.
+        None
     """
-    dict_return = dict()
-    dict_return['Identificador'] = str_id
-    for node_child in node.findall("./*"):
-        for att in node_child.attrib:
-            dict_return[att] = node_child.attrib[att]
-
-    return dict_return
+    global COUNT_PARSE
+    with COUNT_PARSE.get_lock():
+        COUNT_PARSE.value += 1
+        if COUNT_PARSE.value % 100 == 0:
+            print(f"Parsing {COUNT_PARSE.value}th file")
 
 
 def dictify_xml_node_att(node):
@@ -149,16 +251,20 @@ def dictify_xml_node_att(node):
     return dict_return
 
 
-def extract_zip(str_folder_ori, str_folder_dest):
+def extract_zip(str_folder_ori, str_folder_dest, tpl_shard=None):
     """
     Extract XML files from ZIP archives in the source folder to the destination folder.
 
     This function searches for ZIP files in the source folder, extracts the 'curriculo.xml' file from each ZIP archive,
-    and saves it in the destination folder. It ensures that only files not already extracted are processed.
+    and saves it in the destination folder. It ensures that only files not already extracted are processed,
+    or whose zip file is newer than the extracted XML, as after a refresh download.
 
     Args:
         str_folder_ori (str): The path to the folder containing ZIP files.
         str_folder_dest (str): The path to the folder where XML files will be extracted.
+        tpl_shard (tuple, optional): The shard (i, N) of the files to extract,
+            see utils_shard. Each file is written straight to its final name,
+            so the shards can share the destination folder.
 
     Returns:
         None
@@ -168,21 +274,25 @@ def extract_zip(str_folder_ori, str_folder_dest):
     """
     lst_zip_files = sorted(glob.glob(f"{str_folder_ori}*.zip"))
     lst_zip_files = [os.path.basename(x).split('.')[0] for x in lst_zip_files]
+    lst_zip_files = shard.get_lst_ids_shard(lst_zip_files, tpl_shard)
 
     lst_unziped_files = sorted(glob.glob(f"{str_folder_dest}*.xml"))
     lst_unziped_files = [os.path.basename(x).split('.')[0] for x in lst_unziped_files]
     
-    lst_zip_files = list(set(lst_zip_files) - set(lst_unziped_files))
+    set_unziped_files = set(lst_unziped_files)
+    lst_zip_files = [x for x in lst_zip_files
+                     if x not in set_unziped_files or
+                     os.path.getmtime(f"{str_folder_ori}{x}.zip") >
+                     os.path.getmtime(f"{str_folder_dest}{x}.xml")]
 
     for file_name_zip in lst_zip_files:
         str_file_name = f"{str_folder_dest}{file_name_zip}.xml"
         file_name_zip = f"{str_folder_ori}{file_name_zip}.zip"
 
         if zipfile.is_zipfile(file_name_zip):
-            lattes_zip = zipfile.ZipFile(file_name_zip)
-            lattes_zip.extract('curriculo.xml', str_folder_dest)
-            lattes_zip.close()
-            os.rename(f"{str_folder_dest}curriculo.xml", str_file_name)
+            with zipfile.ZipFile(file_name_zip) as lattes_zip:
+                with open(str_file_name, mode='wb') as file_xml:
+                    file_xml.write(lattes_zip.read('curriculo.xml'))
         else:
             print('Erro no arquivo: {}'.format(file_name_zip))
             os.remove(file_name_zip)
@@ -203,6 +313,11 @@ def get_args():
 
     - output_folder (str): The path where CSV files will be saved.
 
+    And accepts the option:
+
+    - --store (str): A SQLite CV store to be parsed. The zip files of the input
+      folder are imported into it first.
+
     Returns the parsed arguments as an argparse.Namespace object.
 
     Example:
@@ -228,12 +343,7 @@ def get_args():
     """
     parser = argparse.ArgumentParser(description='Pasta com arquivos XML para '
                                      'processar.')
-    parser.add_argument('input_folder', metavar='content_folder', type=str,
-                        help='caminho dos arquivos a serem processados. Deve '
-                        'conter arquivos xml baixados do site do CNPq')
-
-    parser.add_argument('output_folder', metavar='output_path', type=str,
-                        help='caminho onde serao gravados os arquivos csv')
+    cli_args.add_args_parse(parser)
 
     return parser.parse_args()
 
@@ -288,25 +398,46 @@ def parse_files(str_file_name):
         the function will return a list with dictionaries representing different
         aspects of the researcher's CV.
     """
-    global COUNT_PARSE
-    with COUNT_PARSE.get_lock():
-        COUNT_PARSE.value += 1
-        if COUNT_PARSE.value % 100 == 0:
-            print(f"Parsing {COUNT_PARSE.value}th file")
+    count_parse()
 
-    dict_aux = dict()
     str_id = str_file_name[-20:-4]
-    dict_aux['FILE-NAME'] = str_id
     root = None
 
     try:
-        root = ET.parse(str_file_name).getroot()
+        root = xml_backend.parse_file(str_file_name)
     except KeyboardInterrupt:
         return []
     except Exception as excpt:
         print(excpt)
 
-    if not root:
+    return parse_root(str_id, root)
+
+
+def parse_root(str_id, root):
+    """
+    Extract the information of a parsed CV.
+
+    Args:
+        str_id (str): The CNPq ID of the CV.
+        root (xml.etree.ElementTree.Element or None): The root element of the
+        CV, of either XML backend (see utils_xml), or None if it could not be
+        parsed.
+
+    Returns:
+        list: A list containing the general attributes dictionary, the education
+        list and one batch per type of production (see parse_files_get_batch),
+        or only the dictionary with the 'FILE-NAME' when the CV is empty or
+        could not be parsed.
+
+    Example:
+        >>> parse_root('1234567890123456', xml_backend.parse_file('1234567890123456.xml'))
+        [{'FILE-NAME': '1234567890123456', ...}, [...], [...], ...]
+    """
+    dict_aux = dict()
+    dict_aux['FILE-NAME'] = str_id
+
+    # an element without children is false in both backends, but lxml warns
+    if root is None or not len(root):
         return [dict_aux]
 
     dict_aux.update(dictify_xml_node_att(root))
@@ -315,13 +446,164 @@ def parse_files(str_file_name):
 
     return [dict_aux,
             parse_files_get_formacao_doutorado(str_id, root),
-            parse_files_get_lst_node(str_id, root, 'artigo'),
-            parse_files_get_lst_node(str_id, root, 'livro'),
-            parse_files_get_lst_node(str_id, root, 'lvr_cap'),
-            parse_files_get_lst_node(str_id, root, 'jor_rev'),
-            parse_files_get_lst_node(str_id, root, 'evt_org'),
-            parse_files_get_lst_node(str_id, root, 'evt_part'),
-            parse_files_get_lst_node(str_id, root, 'premio')]
+            parse_files_get_batch(str_id, root, 'artigo'),
+            parse_files_get_batch(str_id, root, 'livro'),
+            parse_files_get_batch(str_id, root, 'lvr_cap'),
+            parse_files_get_batch(str_id, root, 'jor_rev'),
+            parse_files_get_batch(str_id, root, 'evt_org'),
+            parse_files_get_batch(str_id, root, 'evt_part'),
+            parse_files_get_batch(str_id, root, 'premio')]
+
+
+def parse_store_cv(str_store_path, str_id):
+    """
+    Parse a CV read from the CV store.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file.
+        str_id (str): The CNPq ID of the CV.
+
+    Returns:
+        list: The same list returned by parse_files.
+
+    The XML is parsed from memory, so nothing is extracted to disk.
+
+    Example:
+        >>> parse_store_cv('../data/cv_store.sqlite', '1234567890123456')
+        [{'FILE-NAME': '1234567890123456', ...}, [...], [...], ...]
+    """
+    count_parse()
+
+    root = None
+
+    try:
+        root = xml_backend.parse_bytes(store.get_cv_xml(str_store_path, str_id))
+    except KeyboardInterrupt:
+        return []
+    except Exception as excpt:
+        print(excpt)
+
+    return parse_root(str_id, root)
+
+
+def parse_zip_cv(str_zip_file_name):
+    """
+    Parse the CV of a downloaded zip file without extracting it.
+
+    Args:
+        str_zip_file_name (str): The path of a '<id>.zip' file downloaded from CNPq.
+
+    Returns:
+        list: The same list returned by parse_files.
+
+    Example:
+        >>> parse_zip_cv('../data/xml_lattes/1234567890123456.zip')
+        [{'FILE-NAME': '1234567890123456', ...}, [...], [...], ...]
+    """
+    count_parse()
+
+    str_id = os.path.basename(str_zip_file_name).split('.')[0]
+    root = None
+
+    try:
+        with zipfile.ZipFile(str_zip_file_name) as lattes_zip:
+            root = xml_backend.parse_bytes(lattes_zip.read('curriculo.xml'))
+    except KeyboardInterrupt:
+        return []
+    except Exception as excpt:
+        print(excpt)
+
+    return parse_root(str_id, root)
+
+
+def parse_disambiguate_root(str_id, root):
+    """
+    Extract the row of id_lattes_to_disambiguate.csv of a CV.
+
+    Args:
+        str_id (str): The CNPq ID of the CV.
+        root (Element or None): The root element of the CV, parsed at least
+        up to its FORMACAO-ACADEMICA-TITULACAO (see utils_xml.parse_head),
+        or None if it could not be parsed.
+
+    Returns:
+        tuple: The values of LST_DISAMBIGUATE_COLUMNS, '' when missing, the
+        same as the row merged by save_lst_lattes, or None when the CV is
+        empty or could not be parsed, as save_lst_lattes leaves it out.
+
+    Example:
+        >>> parse_disambiguate_root('1234567890123456', root)
+        ('1234567890123456', 'Maria da Silva', '2004', 'Universidade de Sao Paulo')
+    """
+    if root is None or not len(root):
+        return None
+
+    dict_aux = dictify_xml_node_att(root)
+    dict_aux.update(dictify_xml_node_att(root.find('./DADOS-GERAIS')))
+    dict_aux.update(dictify_xml_node_att(root.find('./DADOS-GERAIS/RESUMO-CV')))
+
+    dict_doutorado = dict()
+    node_formacao = root.find('./DADOS-GERAIS/FORMACAO-ACADEMICA-TITULACAO')
+    if node_formacao is not None and len(node_formacao):
+        dict_doutorado = dictify_xml_node_att(node_formacao.find('./DOUTORADO'))
+
+    return (str_id, dict_aux.get('NOME-COMPLETO', ''),
+            dict_doutorado.get('ANO-DE-OBTENCAO-DO-TITULO', ''),
+            dict_doutorado.get('NOME-INSTITUICAO', ''))
+
+
+def parse_disambiguate_store_cv(str_store_path, str_id):
+    """
+    Extract the row of id_lattes_to_disambiguate.csv of a CV of the CV store,
+    parsing the XML only up to the doctorate; see parse_disambiguate_root.
+    """
+    count_parse()
+
+    root = None
+
+    try:
+        root = xml_backend.parse_head(io.BytesIO(store.get_cv_xml(str_store_path, str_id)),
+                                      LST_DISAMBIGUATE_STOP_TAGS)
+    except KeyboardInterrupt:
+        return None
+    except Exception as excpt:
+        print(excpt)
+
+    return parse_disambiguate_root(str_id, root)
+
+
+def parse_disambiguate_zip_cv(str_zip_file_name):
+    """
+    Extract the row of id_lattes_to_disambiguate.csv of a downloaded zip file.
+
+    Args:
+        str_zip_file_name (str): The path of a '<id>.zip' file downloaded from CNPq.
+
+    Returns:
+        tuple: The row returned by parse_disambiguate_root, or None.
+
+    The curriculo.xml is decompressed and parsed only up to the doctorate,
+    the first few kilobytes of most CVs, and nothing is extracted to disk.
+
+    Example:
+        >>> parse_disambiguate_zip_cv('../data/xml_lattes/1234567890123456.zip')
+        ('1234567890123456', 'Maria da Silva', '2004', 'Universidade de Sao Paulo')
+    """
+    count_parse()
+
+    str_id = os.path.basename(str_zip_file_name).split('.')[0]
+    root = None
+
+    try:
+        with zipfile.ZipFile(str_zip_file_name) as lattes_zip:
+            with lattes_zip.open('curriculo.xml') as file_xml:
+                root = xml_backend.parse_head(file_xml, LST_DISAMBIGUATE_STOP_TAGS)
+    except KeyboardInterrupt:
+        return None
+    except Exception as excpt:
+        print(excpt)
+
+    return parse_disambiguate_root(str_id, root)
 
 
 def parse_files_get_area_atuacao(str_id, root):
@@ -354,6 +636,76 @@ def parse_files_get_area_atuacao(str_id, root):
     return lst_return
 
 
+def parse_files_get_batch(str_id, root, node_name):
+    """
+    Extract the productions of a type from a CV as a batch of columns.
+
+    Args:
+        str_id (str): The identifier associated with the XML data.
+        root (xml.etree.ElementTree.Element): The root element of the XML data.
+        node_name (str): The type of production, a key of get_lst_node_path.
+
+    Returns:
+        tuple: The batch (str_id, node_name, tpl_columns, lst_values), where
+        tpl_columns are the attributes found in the children of the nodes,
+        followed by FINGERPRINT and ID_ITEM (see utils_fingerprint), and
+        lst_values holds one tuple per column with its value in each node,
+        or None. Both are empty when the CV has no production of the type.
+
+    The ID and the type are stored once per batch and the attribute names
+    once per column, instead of in a dict per production. Repeated values,
+    such as 'COMPLETO' or 'Brasil', are the same string object, which pickle
+    writes once, and the children of LST_PROD_TAGS_DROPPED and the attributes
+    of LST_PROD_ATTS_DROPPED are skipped, so the batch is a fraction of the
+    size of the dicts when pickled back to the parent. When the children of a
+    node repeat an attribute, the last value is kept.
+
+    Example:
+        >>> parse_files_get_batch('1234567890123456', root, 'artigo')
+        ('1234567890123456', 'artigo', ('NATUREZA', 'TITULO-DO-ARTIGO', ..., 'ID_ITEM'),
+         [('COMPLETO', 'COMPLETO'), ('Estudo 1', 'Estudo 2'), ...])
+    """
+    set_dropped = set(LST_PROD_ATTS_DROPPED)
+    set_tags_dropped = set(LST_PROD_TAGS_DROPPED)
+    dict_columns = dict()
+    dict_values = dict()
+    lst_rows = []
+    for node in root.findall(get_lst_node_path(node_name)):
+        lst_row = [None] * len(dict_columns)
+        for node_child in node:
+            if node_child.tag in set_tags_dropped:
+                continue
+            for str_att, str_value in node_child.items():
+                if str_att in set_dropped:
+                    continue
+                str_value = dict_values.setdefault(str_value, str_value)
+                n_column = dict_columns.setdefault(str_att, len(dict_columns))
+                if n_column < len(lst_row):
+                    lst_row[n_column] = str_value
+                else:
+                    lst_row.append(str_value)
+        lst_rows.append(lst_row)
+
+    if not lst_rows:
+        return (str_id, node_name, (), [])
+
+    dict_fingerprint_columns = {x: dict_columns[x] for x in fingerprint.LST_ATTS
+                                if x in dict_columns}
+    lst_fingerprints = []
+    for lst_row in lst_rows:
+        lst_fingerprints.append(fingerprint.get_fingerprint(
+            {x: lst_row[n] for x, n in dict_fingerprint_columns.items() if n < len(lst_row)},
+            node_name))
+        lst_row.extend([None] * (len(dict_columns) - len(lst_row)))
+
+    # kept as text, as a column of ints with missing values would be
+    # converted to float by pandas, losing digits of the 63-bit IDs
+    lst_id_items = [str(fingerprint.get_id_item(x) or '') for x in lst_fingerprints]
+
+    return (str_id, node_name, tuple(dict_columns) + ('FINGERPRINT', 'ID_ITEM'),
+            list(zip(*lst_rows)) + [tuple(lst_fingerprints), tuple(lst_id_items)])
+
+
 def parse_files_get_formacao_doutorado(str_id, root):
     """
     Parse XML files to extract doctoral education information.
@@ -378,7 +730,7 @@ def parse_files_get_formacao_doutorado(str_id, root):
     lst_return = []
     node_formacao = root.find('./DADOS-GERAIS/FORMACAO-ACADEMICA-TITULACAO')
 
-    if node_formacao:
+    if node_formacao is not None and len(node_formacao):
         dict_aux = dict()
         dict_aux['Identificador'] = str_id
         dict_aux.update(dictify_xml_node_att(node_formacao.find('./DOUTORADO')))
@@ -388,109 +740,289 @@ def parse_files_get_formacao_doutorado(str_id, root):
     return lst_return
 
 
-def parse_files_get_lst_node(str_id, root, node_name):
+def save_chunk_parts(str_parts_path, n_chunk, lst_chunk_results):
     """
-    Parse XML files to extract information from a specified type of node.
+    Save the CVs of a chunk of the pool as compressed parts of the CSV files.
 
     Args:
-        str_id (str): The identifier associated with the XML data.
-        root (xml.etree.ElementTree.Element): The root element of the XML data.
-        node_name (str): The name of the node type to extract information from.
+        str_parts_path (str): The parts folder (see utils_parse_parts).
+        n_chunk (int): The number of the chunk, the number of the parts.
+        lst_chunk_results (list): The tuples of the chunk, as returned by
+            utils_schedule.run_chunk.
 
     Returns:
-        list: A list of dictionaries containing information extracted from the
-        specified type of node.
+        list: The tuples, with the number of the chunk instead of the result,
+        sent back to the parent.
 
-    This function parses XML data to extract information from nodes of a specified type.
-    It searches for nodes with the specified name and converts the attributes of those
-    nodes into dictionaries. The dictionaries are then added to a list, with an additional
-    key-value pair indicating the type of node.
+    Called in the pool worker once a chunk is parsed, so the CSV files are
+    written, compressed, while the other chunks are parsed, and the parent
+    receives only the numbers of the parts.
 
     Example:
-        If str_id is '123', node_name is 'PRODUCAO-TECNICA', and the XML data contains information
-        about technical production, the function will return a list with dictionaries representing
-        the technical production data, with each dictionary containing an additional key 'tipo_prod'
-        with the value 'PRODUCAO-TECNICA'.
+        >>> save_chunk_parts('../data/parse_parts', 12, lst_chunk_results)
+        [('1234567890123456.xml', 12, 4120, ...), ...]
     """
+    lst_lattes = [result if result is not None
+                  else [{'FILE-NAME': os.path.basename(item).split('.')[0]}]
+                  for item, result, _, _, _, _ in lst_chunk_results]
 
-    str_node_path = get_lst_node_path(node_name)
-    lst_return = []
-    for node in root.findall(str_node_path):
-        lst_return.append(dictify_flat(str_id, node))
+    save_lst_lattes(lst_lattes, os.path.join(str_parts_path, ''), n_part=n_chunk)
 
-    for dic in lst_return:
-        dic['tipo_prod'] = node_name
+    return [(x[0], n_chunk) + x[2:] for x in lst_chunk_results]
 
-    return lst_return
+
+def save_csv(df_data, str_output_path, str_file_name, n_part=None):
+    """
+    Save a DataFrame as one of the CSV files of the parse, or as a compressed
+    part of it when n_part is given (see utils_parse_parts).
+    """
+    if n_part is None:
+        df_data.to_csv(f"{str_output_path}{str_file_name}", index=False)
+    else:
+        df_data.to_csv(f"{str_output_path}{parts.get_part_file_name(str_file_name, n_part)}",
+                       index=False, compression=parts.DICT_COMPRESSION)
 
 
-def main():
+def save_disambiguate(lst_rows, str_output_path):
     """
-    Perform data processing tasks on XML files containing researcher information.
+    Save the rows of parse_disambiguate_root as id_lattes_to_disambiguate.csv.
 
-    This function orchestrates the entire process of parsing XML files,
-    extracting relevant information,
-    and performing data processing tasks. It consists of the following steps:
-    1. Unzips XML files located in the input folder.
-    2. Parses each XML file using multiprocessing to speed up the process.
-    3. Converts the parsed information into pandas DataFrames.
-    4. Merges DataFrames to create a unified dataset.
-    5. Selects relevant columns for further analysis.
+    Args:
+        lst_rows (list): The rows, one per CV, or None for the CVs left out.
+        str_output_path (str): The folder where the CSV file is saved, with
+        a trailing slash.
 
     Returns:
-        None
+        int: The number of rows written.
+
+    The file is written row by row, without a DataFrame, quoted as
+    pandas.DataFrame.to_csv quotes it, so it is the same file save_lst_lattes
+    writes for the same CVs.
 
     Example:
-        main()
+        >>> save_disambiguate(pool.map(parse_disambiguate_zip_cv, lst_files), '../data/')
+        25102
     """
-    args = get_args()
-    str_path_zip_files = util.format_path(args.input_folder)
-    str_path_xml_files = f"{os.path.dirname(str_path_zip_files)}_extracted/"
+    lst_rows = [x for x in lst_rows if x is not None]
+    with open(f"{str_output_path}id_lattes_to_disambiguate.csv", mode='w', newline='',
+              encoding='utf-8') as file_csv:
+        writer = csv.writer(file_csv, lineterminator='\n')
+        writer.writerow(LST_DISAMBIGUATE_COLUMNS)
+        writer.writerows(lst_rows)
 
-    if not os.path.exists(str_path_xml_files):
-        os.makedirs(str_path_xml_files)
+    return len(lst_rows)
 
-    extract_zip(str_path_zip_files, str_path_xml_files)
 
-    lst_files = sorted(glob.glob(f"{str_path_xml_files}/*.xml"))
+def save_lst_lattes(lst_lattes, str_output_path, dict_profile=None, n_part=None):
+    """
+    Convert the parsed CVs into DataFrames and save them as CSV files.
 
-    pool = multiprocessing.Pool()
-    time_start = time.time()
-    lst_lattes = pool.map(parse_files, lst_files)
-    print(str(time.time() - time_start))
+    Args:
+        lst_lattes (list): The lists returned by parse_files, one per CV.
+        str_output_path (str): The folder where the CSV files are saved, with
+        a trailing slash.
+        dict_profile (dict, optional): The profile of the run, as returned by
+        utils_profile.start_profile. The build of each DataFrame and the write
+        of each CSV file are then recorded as profile steps.
+        n_part (int, optional): The number of a part of the parse. When given,
+        each CSV file is saved as that part, compressed (see utils_parse_parts).
 
+    Returns:
+        None
+
+    Writes lattes_producao.csv, lattes_dados_gerais.csv, lattes_formacao.csv
+    and id_lattes_to_disambiguate.csv, the last one merging the general data
+    with the doctorate of each CV, and lattes_producao_item.csv and
+    lattes_producao_cv.csv, the distinct productions and the CVs listing
+    each one (see convert_df_producao_to_items).
+
+    Example:
+        >>> save_lst_lattes(pool.map(parse_files, lst_files), '../data/')
+    """
     lst_dados_gerais = []
     lst_formacao = []
-    lst_producao = []
+    dict_producao = dict()
+    n_producao = 0
     for lattes in lst_lattes:
         if len(lattes) > 1:
             lst_dados_gerais.append(lattes[0])
             lst_formacao.extend(lattes[1])
-            lst_producao.extend(sum(lattes[2:], []))
+            for tpl_batch in lattes[2:]:
+                n_producao = append_batch(dict_producao, n_producao, tpl_batch)
 
-    df_producao = convert_lst_prod_to_dataframe(lst_producao)
-    df_producao.to_csv(f"../data/lattes_producao.csv",
-                       index=False)
+    for lst_column in dict_producao.values():
+        lst_column.extend([None] * (n_producao - len(lst_column)))
 
-    df_dados_gerais = pd.DataFrame(lst_dados_gerais)
-    df_dados_gerais.to_csv(f"../data/lattes_dados_gerais.csv",
-                           index=False)
+    with profile.profile_step(dict_profile, 'dataframe producao'):
+        df_producao = convert_dict_prod_to_dataframe(dict_producao)
+    with profile.profile_step(dict_profile, 'items producao'):
+        df_item, df_producao_cv = convert_df_producao_to_items(df_producao)
+        df_producao = df_producao.drop(columns=['FINGERPRINT'])
+    with profile.profile_step(dict_profile, 'csv producao'):
+        save_csv(df_producao, str_output_path, 'lattes_producao.csv', n_part)
+        save_csv(df_item, str_output_path, 'lattes_producao_item.csv', n_part)
+        save_csv(df_producao_cv, str_output_path, 'lattes_producao_cv.csv', n_part)
 
-    df_formacao = pd.DataFrame(lst_formacao)
-    df_formacao.to_csv(f"../data/lattes_formacao.csv",
-                       index=False)
+    with profile.profile_step(dict_profile, 'dataframe dados gerais e formacao'):
+        # a part may have only empty CVs, or no doctorate
+        df_dados_gerais = pd.DataFrame(lst_dados_gerais or {'FILE-NAME': []})
+        df_formacao = pd.DataFrame(lst_formacao or {'Identificador': []})
 
-    df_disambiguate = df_dados_gerais.merge(df_formacao,
-                                            how='left',
-                                            left_on='FILE-NAME',
-                                            right_on='Identificador')
+        df_disambiguate = df_dados_gerais.merge(df_formacao,
+                                                how='left',
+                                                left_on='FILE-NAME',
+                                                right_on='Identificador')
 
-    df_disambiguate = df_disambiguate.loc[:, ['FILE-NAME', 'NOME-COMPLETO',
-                                              'ANO-DE-OBTENCAO-DO-TITULO',
-                                              'NOME-INSTITUICAO']]
+        df_disambiguate = df_disambiguate.reindex(columns=LST_DISAMBIGUATE_COLUMNS)
 
-    df_disambiguate.to_csv(f"../data/id_lattes_to_disambiguate.csv",
-                           index=False)
+    with profile.profile_step(dict_profile, 'csv dados gerais e formacao'):
+        save_csv(df_dados_gerais, str_output_path, 'lattes_dados_gerais.csv', n_part)
+        save_csv(df_formacao, str_output_path, 'lattes_formacao.csv', n_part)
+        save_csv(df_disambiguate, str_output_path, 'id_lattes_to_disambiguate.csv', n_part)
+
+
+def main(args=None):
+    """
+    Perform data processing tasks on XML files containing researcher information.
+
+    This function orchestrates the entire process of parsing XML files,
+    extracting relevant information,
+    and performing data processing tasks. It consists of the following steps:
+    1. Unzips XML files located in the input folder, or imports them into the
+       CV store when one is given.
+    2. Parses each XML file using multiprocessing to speed up the process,
+       the largest files first, each within about --timeout seconds (a
+       best effort, see utils_schedule.run_chunk), and reports how busy the processes were. The XML is
+       parsed by lxml when it is installed (see utils_xml and --xml-backend).
+    3. Converts the parsed information into pandas DataFrames.
+    4. Merges DataFrames to create a unified dataset.
+    5. Selects relevant columns for further analysis.
+
+    With --disambiguate-only, only id_lattes_to_disambiguate.csv is written:
+    each CV is read from its zip file, or from the store, only up to its
+    doctorate, and the pool workers return its four columns, so the merge
+    can start soon after the download (see parse_disambiguate_zip_cv).
+
+    With --csv-parts, steps 3 to 5 run in the pool workers, once per chunk
+    of CVs, and each chunk is written as gzip parts of the CSV files in the
+    'parse_parts' subfolder of the output folder, listed by a manifest (see
+    utils_parse_parts and save_chunk_parts). reduce_shards concatenates the
+    parts into the CSV files.
+
+    The CSV files are written to the output folder, formatted by
+    util.format_path. With --shard, only the CVs of the shard are parsed and
+    the CSV files go to its 'shard_<i>_of_<N>' subfolder; see reduce_shards.
+    With --profile, the parent process and each pool worker are profiled and
+    the memory of the load, the parse and each DataFrame and CSV step is
+    recorded; see utils_profile.
+
+    Args:
+        args (argparse.Namespace, optional): The arguments, as parsed by get_args
+            or by the matching subcommand of lattes_cli. Parsed from the
+            command line when omitted.
+
+    Returns:
+        None
+
+    Example:
+        main()
+    """
+    if args is None:
+        args = get_args()
+
+    str_path_zip_files = util.format_path(args.input_folder)
+
+    try:
+        print('XML backend: {}'.format(xml_backend.set_backend(args.xml_backend)))
+    except ValueError as error:
+        sys.exit(str(error))
+
+    dict_profile = profile.start_profile(args.profile, 'parse')
+
+    n_workers = os.cpu_count() or 1
+    pool = profile.get_pool(dict_profile, processes=n_workers)
+
+    if args.store:
+        with profile.profile_step(dict_profile, 'load'):
+            n_imported = store.import_zip_folder(args.store, str_path_zip_files)
+        print('{} zip files imported into the store'.format(n_imported))
+
+        lst_items = shard.get_lst_ids_shard(store.get_lst_ids_stored(args.store), args.shard)
+        dict_sizes = store.get_dict_sizes_stored(args.store)
+        lst_sizes = [dict_sizes.get(x, 0) for x in lst_items]
+        func_parse = partial(parse_store_cv, args.store)
+        if args.disambiguate_only:
+            func_parse = partial(parse_disambiguate_store_cv, args.store)
+    elif args.disambiguate_only:
+        lst_items = sorted(glob.glob(f"{str_path_zip_files}*.zip"))
+        lst_items = [x for x in lst_items
+                     if not args.shard or shard.is_in_shard(os.path.basename(x)[:-4], args.shard)]
+        lst_sizes = [os.path.getsize(x) for x in lst_items]
+        func_parse = parse_disambiguate_zip_cv
+    else:
+        str_path_xml_files = f"{os.path.dirname(str_path_zip_files)}_extracted/"
+
+        if not os.path.exists(str_path_xml_files):
+            os.makedirs(str_path_xml_files)
+
+        with profile.profile_step(dict_profile, 'load'):
+            extract_zip(str_path_zip_files, str_path_xml_files, args.shard)
+
+        lst_items = sorted(glob.glob(f"{str_path_xml_files}/*.xml"))
+        lst_items = [x for x in lst_items
+                     if not args.shard or shard.is_in_shard(os.path.basename(x)[:-4], args.shard)]
+        lst_sizes = [os.path.getsize(x) for x in lst_items]
+        func_parse = parse_files
+
+    str_output_path = util.format_path(args.output_folder)
+    if not os.path.exists(str_output_path):
+        os.makedirs(str_output_path)
+    str_output_path = shard.get_shard_folder_path(str_output_path, args.shard)
+
+    # the parts of a previous run would be taken by reduce_shards as the
+    # output of this one, unless only id_lattes_to_disambiguate.csv is written
+    str_parts_path = parts.get_parts_path(str_output_path)
+    if os.path.exists(str_parts_path) and not args.disambiguate_only:
+        parts.remove_parts(str_parts_path)
+
+    func_chunk = None
+    tpl_chunking = (schedule.N_CHUNKS_PER_WORKER, schedule.N_MAX_CHUNK_ITEMS)
+    if args.csv_parts:
+        os.makedirs(str_parts_path, exist_ok=True)
+        func_chunk = partial(save_chunk_parts, str_parts_path)
+        tpl_chunking = (parts.N_PARTS_PER_WORKER, parts.N_MAX_PART_CVS)
+
+    with profile.profile_step(dict_profile, 'parse'):
+        lst_results, time_start, time_end = schedule.run_tasks(
+            pool, func_parse, lst_items, lst_sizes, args.timeout, n_workers, func_chunk,
+            tpl_chunking)
+    schedule.print_report(lst_results, time_start, time_end, n_workers)
+
+    pool.close()
+    pool.join()
+
+    if args.disambiguate_only:
+        n_rows = save_disambiguate([x[1] for x in sorted(lst_results, key=lambda x: x[0])],
+                                   str_output_path)
+        print('{} curriculos em {}id_lattes_to_disambiguate.csv'.format(n_rows, str_output_path))
+        profile.stop_profile(dict_profile)
+        return
+
+    if args.csv_parts:
+        dict_n_cvs = collections.Counter(x[1] for x in lst_results)
+        n_bytes = parts.write_manifest(str_parts_path, LST_CSV_FILES, dict_n_cvs)
+        print('{} partes, {:.1f} MB em {}'.format(len(dict_n_cvs), n_bytes / 1e6, str_parts_path))
+        profile.stop_profile(dict_profile)
+        return
+
+    # in the order of the IDs, as the results arrive in the order they finish
+    lst_lattes = [result if result is not None
+                  else [{'FILE-NAME': os.path.basename(item).split('.')[0]}]
+                  for item, result, _, _, _, _ in sorted(lst_results, key=lambda x: x[0])]
+
+    save_lst_lattes(lst_lattes, str_output_path, dict_profile)
+
+    profile.stop_profile(dict_profile)
 
 if __name__ == "__main__":
     main()
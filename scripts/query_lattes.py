@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 27 10:18:52 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import os
+import sys
+import time
+import utils_args as cli_args
+import utils_lattes_cnpq as util
+
+# duckdb is needed only by this script, so it is not in requirements.txt
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+DB_FILE_NAME = 'lattes.duckdb'
+
+# table of the index: (CSV file, columns indexed, sort order of the rows)
+DICT_TABLES = {
+    'producao': ('lattes_producao.csv', ['FILE-NAME', 'tipo_prod', 'ANO', 'ID_ITEM'],
+                 ['tipo_prod', 'ANO', 'FILE-NAME']),
+    'dados_gerais': ('lattes_dados_gerais.csv', ['FILE-NAME'], ['FILE-NAME']),
+    'formacao': ('lattes_formacao.csv', ['FILE-NAME'], ['FILE-NAME']),
+    'disambiguate': ('id_lattes_to_disambiguate.csv', ['FILE-NAME'], ['FILE-NAME']),
+    'match': ('match_capes_x_lattes.csv', ['FILE-NAME', 'ID_PESSOA'], ['ID_PESSOA']),
+    'item': ('lattes_producao_item.csv', ['ID_ITEM', 'tipo_prod', 'ANO'], ['tipo_prod', 'ANO']),
+    'producao_cv': ('lattes_producao_cv.csv', ['FILE-NAME', 'ID_ITEM'], ['FILE-NAME']),
+}
+
+# the parse names the CV column Identificador in some files
+LST_KEY_ALIASES = ['Identificador']
+
+# columns loaded as numbers, by type
+DICT_INTEGER_COLUMNS = {'ANO': 'INTEGER', 'ID_ITEM': 'BIGINT'}
+
+# canned queries, by name, run by the query subcommand instead of SQL
+DICT_QUERIES = {
+    'tabelas': 'SELECT table_name AS tabela, estimated_size AS linhas '
+               'FROM duckdb_tables() ORDER BY ALL',
+    'producao_por_tipo': 'SELECT tipo_prod, SUM(N) AS N FROM n_producao '
+                         'GROUP BY ALL ORDER BY ALL',
+    'producao_por_ano': 'SELECT tipo_prod, ANO, SUM(N) AS N FROM n_producao '
+                        'GROUP BY ALL ORDER BY ALL',
+    'producao_por_docente': 'SELECT ID_PESSOA, tipo_prod, SUM(N) AS N '
+                            'FROM n_producao_capes GROUP BY ALL ORDER BY ALL',
+    'producao_por_programa': 'SELECT c.NM_PROGRAMA_IES, n.tipo_prod, n.ANO, SUM(n.N) AS N '
+                             'FROM n_producao_capes n JOIN capes c USING (ID_PESSOA) '
+                             'GROUP BY ALL ORDER BY ALL',
+    'itens_por_ano': 'SELECT tipo_prod, ANO, COUNT(*) AS N FROM item '
+                     'GROUP BY ALL ORDER BY ALL',
+    'itens_por_programa': 'SELECT c.NM_PROGRAMA_IES, i.tipo_prod, i.ANO, '
+                          'COUNT(DISTINCT l.ID_ITEM) AS N FROM producao_cv l '
+                          'JOIN match m USING ("FILE-NAME") JOIN capes c USING (ID_PESSOA) '
+                          'JOIN item i USING (ID_ITEM) GROUP BY ALL ORDER BY ALL',
+}
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments, with
+        the handler of the subcommand in func.
+
+    It expects one of the subcommands:
+        - index: loads the CSV files of a data folder into a DuckDB file
+          (see add_args_index).
+        - query: runs SQL, or a canned query, on the DuckDB file
+          (see add_args_query).
+    """
+    parser = argparse.ArgumentParser(description='Consulta SQL aos dados interpretados '
+                                     'do Lattes.')
+    subparsers = parser.add_subparsers(dest='command', metavar='comando', required=True)
+
+    parser_index = subparsers.add_parser('index', help='carrega os arquivos CSV num '
+                                         'arquivo DuckDB indexado')
+    cli_args.add_args_index(parser_index)
+    parser_index.set_defaults(func=main_index)
+
+    parser_query = subparsers.add_parser('query', help='consulta o arquivo DuckDB')
+    cli_args.add_args_query(parser_query)
+    parser_query.set_defaults(func=main_query)
+
+    return parser.parse_args()
+
+
+def check_duckdb():
+    """
+    Exit with a message if duckdb is not installed.
+    """
+    if duckdb is None:
+        sys.exit('o indice usa o duckdb, que nao esta instalado: pip install duckdb')
+
+
+def create_table_csv(con, str_table, str_csv_path):
+    """
+    Load a CSV file of the parse, or of the merge, into a table.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection to the index.
+        str_table (str): The table, a key of DICT_TABLES.
+        str_csv_path (str): The CSV file.
+
+    Returns:
+        int: The number of rows loaded.
+
+    Every column is loaded as text, as in the CSV files, so IDs keep their
+    leading zeros, except for the columns of DICT_INTEGER_COLUMNS. The CV
+    column is named FILE-NAME in every table. The rows are sorted by the
+    columns most filtered on, so the min-max statistics DuckDB keeps per
+    block of rows skip most of the blocks, and an ART index is created on
+    each column of DICT_TABLES. DuckDB reads the file in parallel and spills
+    the sort to disk, so the CSV is never loaded whole in memory.
+    """
+    _, lst_index_columns, lst_order_columns = DICT_TABLES[str_table]
+    str_read = "read_csv({}, header=true, all_varchar=true)".format(get_sql_string(str_csv_path))
+    lst_columns = [x[0] for x in con.execute('DESCRIBE SELECT * FROM ' + str_read).fetchall()]
+
+    lst_select = []
+    lst_names = []
+    for str_column in lst_columns:
+        str_name = str_column
+        if str_column in LST_KEY_ALIASES and 'FILE-NAME' not in lst_columns:
+            str_name = 'FILE-NAME'
+        str_expression = get_sql_name(str_column)
+        if str_name in DICT_INTEGER_COLUMNS:
+            str_expression = 'TRY_CAST({} AS {})'.format(str_expression,
+                                                           DICT_INTEGER_COLUMNS[str_name])
+        lst_select.append('{} AS {}'.format(str_expression, get_sql_name(str_name)))
+        lst_names.append(str_name)
+
+    lst_order_columns = [x for x in lst_order_columns if x in lst_names]
+
+    con.execute('CREATE TABLE {} AS SELECT {} FROM {}{}'.format(
+        str_table, ', '.join(lst_select), str_read,
+        ' ORDER BY ' + ', '.join(map(get_sql_name, lst_order_columns))
+        if lst_order_columns else ''))
+
+    create_indexes(con, str_table, lst_index_columns)
+
+    return con.execute('SELECT COUNT(*) FROM ' + str_table).fetchone()[0]
+
+
+def create_table_capes(con, str_capes_file_path):
+    """
+    Load the CAPES file, with every column, into the table capes.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection to the index.
+        str_capes_file_path (str): The Excel file of step 1.
+
+    Returns:
+        int: The number of rows loaded.
+
+    DuckDB reads Excel files only through an extension downloaded on first
+    use, so the file is read by pandas, imported here only, as in
+    merge_capes_x_lattes.
+    """
+    import pandas as pd
+
+    df_capes = pd.read_excel(str_capes_file_path, dtype=str)
+    con.register('df_capes', df_capes)
+    con.execute('CREATE TABLE capes AS SELECT * FROM df_capes ORDER BY ID_PESSOA')
+    con.unregister('df_capes')
+
+    create_indexes(con, 'capes', ['ID_PESSOA'])
+
+    return len(df_capes)
+
+
+def create_indexes(con, str_table, lst_columns):
+    """
+    Create an ART index on each column of a table that has it.
+    """
+    set_columns = {x[0] for x in con.execute('DESCRIBE ' + str_table).fetchall()}
+    for str_column in lst_columns:
+        if str_column in set_columns:
+            con.execute('CREATE INDEX {} ON {} ({})'.format(
+                get_sql_name('idx_{}_{}'.format(str_table, str_column)), str_table,
+                get_sql_name(str_column)))
+
+
+def create_views(con):
+    """
+    Create the summary tables and the views of the canned queries.
+
+    Args:
+        con (duckdb.DuckDBPyConnection): The connection to the index.
+
+    Returns:
+        None
+
+    n_producao counts the productions by CV, type and year. It has a row per
+    distinct (FILE-NAME, tipo_prod, ANO), a small fraction of producao, so
+    the counts by type, year, researcher or program read it instead of the
+    productions. n_producao_capes adds the ID_PESSOA of the CV, when the
+    merge was indexed.
+    """
+    set_tables = {x[0] for x in con.execute('SELECT table_name FROM duckdb_tables()').fetchall()}
+
+    if 'producao' in set_tables:
+        con.execute('CREATE TABLE n_producao AS SELECT "FILE-NAME", tipo_prod, ANO, '
+                    'COUNT(*) AS N FROM producao GROUP BY ALL ORDER BY tipo_prod, ANO')
+        create_indexes(con, 'n_producao', ['FILE-NAME'])
+
+    if {'producao', 'match'} <= set_tables:
+        con.execute('CREATE VIEW producao_capes AS SELECT m.ID_PESSOA, p.* '
+                    'FROM producao p JOIN match m USING ("FILE-NAME")')
+        con.execute('CREATE VIEW n_producao_capes AS SELECT m.ID_PESSOA, n.* '
+                    'FROM n_producao n JOIN match m USING ("FILE-NAME")')
+
+
+def get_db_path(args):
+    """
+    Get the DuckDB file of the arguments: --db, or lattes.duckdb in the data folder.
+    """
+    if args.db:
+        return args.db
+
+    return os.path.join(util.format_path(args.data_folder), DB_FILE_NAME)
+
+
+def get_sql_name(str_name):
+    """
+    Quote a table or column name, such as FILE-NAME, for SQL.
+
+    Example:
+        >>> get_sql_name('FILE-NAME')
+        '"FILE-NAME"'
+    """
+    return '"{}"'.format(str_name.replace('"', '""'))
+
+
+def get_sql_string(str_value):
+    """
+    Quote a text, such as a file path, for SQL.
+    """
+    return "'{}'".format(str_value.replace("'", "''"))
+
+
+def index_folder(str_data_path, str_db_path, str_capes_file_path=None):
+    """
+    Build the index of a data folder.
+
+    Args:
+        str_data_path (str): The folder with the CSV files of the parse and of
+            the merge.
+        str_db_path (str): The DuckDB file written, replaced if it exists.
+        str_capes_file_path (str, optional): The Excel file of step 1, loaded
+            into the table capes. Defaults to None.
+
+    Returns:
+        list: Tuples (table, rows) of the tables loaded.
+
+    The CSV files missing from the folder, such as the match before the
+    merge, are skipped. The index is built in a temporary file that replaces
+    the previous one only when complete, so queries keep working on it
+    meanwhile.
+    """
+    str_tmp_path = str_db_path + '.tmp'
+    if os.path.exists(str_tmp_path):
+        os.remove(str_tmp_path)
+
+    lst_return = []
+    con = duckdb.connect(str_tmp_path)
+    try:
+        for str_table, (str_csv_name, _, _) in DICT_TABLES.items():
+            str_csv_path = os.path.join(str_data_path, str_csv_name)
+            if os.path.exists(str_csv_path):
+                lst_return.append((str_table, create_table_csv(con, str_table, str_csv_path)))
+
+        if str_capes_file_path:
+            lst_return.append(('capes', create_table_capes(con, str_capes_file_path)))
+
+        create_views(con)
+        con.execute('CHECKPOINT')
+    finally:
+        con.close()
+
+    os.replace(str_tmp_path, str_db_path)
+
+    return lst_return
+
+
+def run_query(str_db_path, str_query, n_limit=100, str_csv_path=None):
+    """
+    Run a query on the index and print, or save, its result.
+
+    Args:
+        str_db_path (str): The DuckDB file.
+        str_query (str): SQL, the name of a query of DICT_QUERIES or the path
+            of a .sql file.
+        n_limit (int, optional): The maximum number of rows printed.
+            Defaults to 100.
+        str_csv_path (str, optional): A CSV file where every row of the result
+            is written instead. Defaults to None.
+
+    Returns:
+        float: The time of the query, in seconds.
+
+    The index is opened read-only, so several queries may run at the same
+    time, even while the stages run.
+
+    Example:
+        >>> run_query('../data/lattes.duckdb', 'producao_por_ano', 3)
+        tipo_prod	ANO	N
+        artigo	1987	412
+        ...
+    """
+    if str_query in DICT_QUERIES:
+        str_query = DICT_QUERIES[str_query]
+    elif str_query.endswith('.sql') and os.path.exists(str_query):
+        with open(str_query, encoding='utf-8') as file_sql:
+            str_query = file_sql.read()
+
+    time_start = time.monotonic()
+    con = duckdb.connect(str_db_path, read_only=True)
+    try:
+        relation = con.sql(str_query)
+        if str_csv_path:
+            relation.write_csv(str_csv_path)
+            return time.monotonic() - time_start
+
+        lst_rows = relation.fetchmany(n_limit + 1)
+        float_seconds = time.monotonic() - time_start
+        print('\t'.join(relation.columns))
+    finally:
+        con.close()
+
+    for tpl_row in lst_rows[:n_limit]:
+        print('\t'.join('' if x is None else str(x) for x in tpl_row))
+    if len(lst_rows) > n_limit:
+        print('... (mais de {} linhas; use --limit ou --csv)'.format(n_limit))
+
+    return float_seconds
+
+
+def main_index(args):
+    """
+    Run the index subcommand with the parsed arguments.
+
+    Example:
+        $ python query_lattes.py index ../data --capes-file ../data/capes-2020.xlsx
+        producao: 812304 linhas
+        ...
+        ../data/lattes.duckdb em 6.2s
+    """
+    check_duckdb()
+    str_db_path = get_db_path(args)
+
+    time_start = time.monotonic()
+    lst_tables = index_folder(util.format_path(args.data_folder), str_db_path, args.capes_file)
+    if not lst_tables:
+        sys.exit('nenhum arquivo CSV encontrado em {}'.format(
+            util.format_path(args.data_folder)))
+
+    for str_table, n_rows in lst_tables:
+        print('{}: {} linhas'.format(str_table, n_rows))
+    print('{} em {:.1f}s'.format(str_db_path, time.monotonic() - time_start))
+
+
+def main_query(args):
+    """
+    Run the query subcommand with the parsed arguments.
+
+    Example:
+        $ python query_lattes.py query ../data producao_por_tipo
+        tipo_prod	N
+        artigo	301522
+        ...
+        consulta em 0.012s
+    """
+    check_duckdb()
+    str_db_path = get_db_path(args)
+    if not os.path.exists(str_db_path):
+        sys.exit('indice nao encontrado em {}; execute antes o index'.format(str_db_path))
+
+    try:
+        float_seconds = run_query(str_db_path, args.sql, args.limit, args.csv)
+    except duckdb.Error as error:
+        sys.exit('erro na consulta: {}'.format(error))
+
+    print('consulta em {:.3f}s'.format(float_seconds), file=sys.stderr)
+
+
+def main(args=None):
+    """
+    Index the CSV files of the parse and of the merge, or query the index.
+
+    The index is a DuckDB file, a columnar SQL database in a single file,
+    with the productions, the general data, the academic background, the
+    data for disambiguation, the match with CAPES and, optionally, the CAPES
+    file. It answers the usual counts in a fraction of a second without
+    reading the CSV files, which may take minutes to load in pandas.
+
+    Args:
+        args (argparse.Namespace, optional): The arguments, as parsed by get_args
+            or by the index and query subcommands of lattes_cli. Parsed from
+            the command line when omitted.
+
+    Example:
+        $ python query_lattes.py index ../data
+        $ python query_lattes.py query ../data "SELECT ANO, COUNT(*) FROM producao WHERE tipo_prod = 'artigo' GROUP BY ANO"
+    """
+    if args is None:
+        args = get_args()
+
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 26 11:02:44 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import csv
+import glob
+import os
+import shutil
+import sys
+import utils_args as cli_args
+import utils_cv_store as store
+import utils_download_manifest as manifest
+import utils_lattes_cnpq as util
+import utils_parse_parts as parts
+import utils_search_journal as journal
+import utils_shard as shard
+
+# CSV files written without a header line
+LST_HEADERLESS_FILES = ['idlattes_to_download.csv']
+
+# CSV files whose rows are keyed by a column, by file: the same production
+# may be an item of several shards, so only its first row is kept
+DICT_KEY_COLUMNS = {'lattes_producao_item.csv': 'ID_ITEM'}
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+
+    It expects one positional argument:
+        - output_folder (str): The output folder given to the stage run with
+          --shard, holding its 'shard_<i>_of_<N>' subfolders.
+    And accepts the option --store, the CV store given to the download.
+    """
+    parser = argparse.ArgumentParser(description='Combina os resultados das '
+                                     'execucoes com --shard.')
+    cli_args.add_args_reduce(parser)
+
+    return parser.parse_args()
+
+
+def concat_csv_files(lst_csv_paths, str_csv_path, str_key_column=None):
+    """
+    Concatenate CSV files with possibly different columns into one.
+
+    Args:
+        lst_csv_paths (list): The CSV files, each with a header line, or
+            gzip parts of CSV files (see utils_parse_parts).
+        str_csv_path (str): The CSV file written, replaced if it exists.
+        str_key_column (str, optional): A column identifying the rows; a row
+            whose value was already written is skipped. Defaults to None.
+
+    Returns:
+        int: The number of rows written.
+
+    The header is the union of the headers, in the order the columns first
+    appear, and a row lacks the columns its file did not have. The parse
+    writes one column per XML attribute found, so two shards rarely have
+    the same columns, nor do two parts of a parse. The files are streamed,
+    not loaded in memory.
+
+    Example:
+        >>> concat_csv_files(['a/shard_1_of_2/lattes_producao.csv',
+        ...                   'a/shard_2_of_2/lattes_producao.csv'], 'a/lattes_producao.csv')
+        812304
+    """
+    lst_fields = []
+    for str_path in lst_csv_paths:
+        with parts.open_csv(str_path) as file_csv:
+            lst_header = next(csv.reader(file_csv), [])
+        lst_fields.extend(x for x in lst_header if x not in lst_fields)
+
+    n_rows = 0
+    set_keys = set()
+    with open(str_csv_path, mode='w', newline='', encoding='utf-8') as file_out:
+        writer = csv.DictWriter(file_out, fieldnames=lst_fields, lineterminator='\n')
+        writer.writeheader()
+        for str_path in lst_csv_paths:
+            with parts.open_csv(str_path) as file_csv:
+                for dict_row in csv.DictReader(file_csv):
+                    if str_key_column:
+                        if dict_row[str_key_column] in set_keys:
+                            continue
+                        set_keys.add(dict_row[str_key_column])
+                    writer.writerow(dict_row)
+                    n_rows += 1
+
+    return n_rows
+
+
+def concat_lines_files(lst_paths, str_path_out):
+    """
+    Concatenate files of one value per line, such as the lists of IDs,
+    dropping repeated lines.
+
+    Args:
+        lst_paths (list): The files.
+        str_path_out (str): The file written, replaced if it exists.
+
+    Returns:
+        int: The number of lines written.
+    """
+    set_lines = set()
+    with open(str_path_out, mode='w', encoding='utf-8') as file_out:
+        for str_path in lst_paths:
+            with open(str_path, encoding='utf-8') as file_in:
+                for str_line in file_in:
+                    if str_line.strip() and str_line not in set_lines:
+                        set_lines.add(str_line)
+                        file_out.write(str_line)
+
+    return len(set_lines)
+
+
+def link_files(lst_paths, str_folder_path):
+    """
+    Bring files, such as the downloaded zip files, into a folder.
+
+    Args:
+        lst_paths (list): The files.
+        str_folder_path (str): The destination folder.
+
+    Returns:
+        int: The number of files linked or copied.
+
+    A hard link is made when the folders share a file system, so the zip
+    files are not stored twice, otherwise the file is copied. A file already
+    in the folder is replaced only by a newer one, as after a refresh.
+    """
+    n_linked = 0
+    for str_path in lst_paths:
+        str_dest_path = os.path.join(str_folder_path, os.path.basename(str_path))
+        if os.path.exists(str_dest_path):
+            if os.path.getmtime(str_dest_path) >= os.path.getmtime(str_path):
+                continue
+            os.remove(str_dest_path)
+
+        try:
+            os.link(str_path, str_dest_path)
+        except OSError:
+            shutil.copy2(str_path, str_dest_path)
+        n_linked += 1
+
+    return n_linked
+
+
+def reduce_folder(str_folder_path, lst_shard_paths):
+    """
+    Merge the outputs of the shards into the output folder.
+
+    Args:
+        str_folder_path (str): The output folder of the stage.
+        lst_shard_paths (list): The shard folders, as returned by
+            utils_shard.get_lst_shard_paths.
+
+    Returns:
+        list: Tuples (file name, count) describing what was merged.
+
+    The search journals and the download manifests are merged into the
+    journal and the manifest of the output folder, which may already hold
+    the results of an unsharded run; the zip files are linked into it; the
+    CSV files, which are derived from the journals and the CVs, are
+    rebuilt from the CSV files of the shards. Running it again after a shard
+    is rerun, or finishes, merges only what changed. The download metrics
+    stay in the folder of each shard.
+
+    A parse run with --csv-parts, in a shard or in the output folder itself,
+    contributes the gzip parts listed in its manifest instead of its CSV
+    files (see utils_parse_parts), so the CSV files are concatenated from
+    the parts even when there are no shards.
+    """
+    lst_paths = [x for _, _, x in lst_shard_paths]
+    lst_return = []
+
+    lst_journals = [journal.get_journal_path(x) for x in lst_paths
+                    if os.path.exists(journal.get_journal_path(x))]
+    if lst_journals:
+        str_journal_path = journal.get_journal_path(str_folder_path)
+        lst_return.append((journal.JOURNAL_FILE_NAME,
+                           sum(journal.merge_journal(str_journal_path, x) for x in lst_journals)))
+
+    lst_manifests = [manifest.get_manifest_path(x) for x in lst_paths
+                     if os.path.exists(manifest.get_manifest_path(x))]
+    if lst_manifests:
+        str_manifest_path = manifest.get_manifest_path(str_folder_path)
+        lst_return.append((manifest.MANIFEST_FILE_NAME,
+                           sum(manifest.merge_manifest(str_manifest_path, x)
+                               for x in lst_manifests)))
+
+    lst_zip_files = [x for str_path in lst_paths
+                     for x in sorted(glob.glob(os.path.join(str_path, '*.zip')))]
+    if lst_zip_files:
+        lst_return.append(('*.zip', link_files(lst_zip_files, str_folder_path)))
+
+    dict_csv_paths = dict()
+    for str_path in lst_paths + [str_folder_path]:
+        dict_part_paths = parts.get_dict_part_paths(parts.get_parts_path(str_path))
+        if not dict_part_paths and str_path != str_folder_path:
+            dict_part_paths = {os.path.basename(x): [x]
+                               for x in sorted(glob.glob(os.path.join(str_path, '*.csv')))}
+        for str_csv_name, lst_csv_paths in dict_part_paths.items():
+            dict_csv_paths.setdefault(str_csv_name, []).extend(lst_csv_paths)
+
+    for str_csv_name, lst_csv_paths in sorted(dict_csv_paths.items()):
+        str_csv_path = os.path.join(str_folder_path, str_csv_name)
+        if str_csv_name in LST_HEADERLESS_FILES:
+            lst_return.append((str_csv_name, concat_lines_files(lst_csv_paths, str_csv_path)))
+        else:
+            lst_return.append((str_csv_name, concat_csv_files(
+                lst_csv_paths, str_csv_path, DICT_KEY_COLUMNS.get(str_csv_name))))
+
+    return lst_return
+
+
+def main(args=None):
+    """
+    Merge the outputs of a stage run with --shard into its standard files.
+
+    Each node, or each local process, runs the search, the download or the
+    parse with --shard i/N, writing to the 'shard_<i>_of_<N>' subfolder of
+    the output folder. Once the subfolders are gathered in one output folder,
+    this script merges them into the files an unsharded run would have
+    written, and the CV stores of the shards into --store. It warns about
+    missing shards and refuses shards of different sizes. It also
+    concatenates the parts written by the parse with --csv-parts into the
+    CSV files of an unsharded run.
+
+    Args:
+        args (argparse.Namespace, optional): The arguments, as parsed by get_args
+            or by the matching subcommand of lattes_cli. Parsed from the
+            command line when omitted.
+
+    Example:
+        $ for i in 1 2 3 4; do python download_xml_lattes.py ids.csv xml_lattes --shard $i/4 & done; wait
+        $ python reduce_shards.py xml_lattes
+        shards: 4 de 4
+        download_manifest.sqlite: 25102
+        *.zip: 24890
+    """
+    if args is None:
+        args = get_args()
+
+    str_folder_path = util.format_path(args.output_folder)
+    lst_shard_paths = shard.get_lst_shard_paths(str_folder_path)
+
+    lst_store_paths = []
+    if args.store:
+        lst_store_paths = shard.get_lst_shard_paths(args.store)
+
+    set_n_shards = {n_shards for _, n_shards, _ in lst_shard_paths + lst_store_paths}
+    if not set_n_shards and not parts.get_dict_part_paths(parts.get_parts_path(str_folder_path)):
+        sys.exit('nenhum shard ou parte do parse encontrado em {}'.format(str_folder_path))
+    if len(set_n_shards) > 1:
+        sys.exit('shards de tamanhos diferentes: {}'.format(sorted(set_n_shards)))
+
+    if set_n_shards:
+        n_shards = set_n_shards.pop()
+        lst_missing = sorted(set(range(1, n_shards + 1)) - {x for x, _, _ in lst_shard_paths})
+        print('shards: {} de {}'.format(n_shards - len(lst_missing), n_shards))
+        if lst_shard_paths and lst_missing:
+            print('faltam os shards: {}'.format(', '.join(map(str, lst_missing))))
+
+    for str_file_name, n_count in reduce_folder(str_folder_path, lst_shard_paths):
+        print('{}: {}'.format(str_file_name, n_count))
+
+    if lst_store_paths:
+        print('{}: {}'.format(args.store, sum(store.merge_store(args.store, x)
+                                               for _, _, x in lst_store_paths)))
+
+if __name__ == "__main__":
+    main()
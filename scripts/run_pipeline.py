@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 09:05:48 2026
+
+@author: andrefelix
+"""
+
+import argparse
+from functools import partial
+import os
+import queue
+from threading import Thread
+import download_id_lattes as search
+import download_xml_lattes as xml
+import parse_xml_lattes as parse
+import utils_args as cli_args
+import utils_cv_store as store
+import utils_download_manifest as manifest
+import utils_download_metrics as metrics
+import utils_lattes_cnpq as util
+import utils_profile as profile
+import utils_search_journal as journal
+
+
+def get_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+
+    It expects two positional arguments:
+        - capes_file (str): The CAPES Excel file, as in download_id_lattes.
+        - output_folder (str): The data folder. The search results go to its
+          'capes_x_lattes' subfolder, the zip files to 'xml_lattes' and the
+          CSV files of the parse to the folder itself.
+    And accepts the options of the three stages, prefixed by the stage when
+    they share a name: --search-rate, --preview-workers, --kid-cache,
+    --min-score, --download-rate, --download-workers, --captcha-workers,
+    --store and --max-attempts, plus --queue-size, the size of the queues
+    between the stages, and --profile.
+
+    Returns the parsed arguments as a namespace object.
+    """
+    parser = argparse.ArgumentParser(description='Busca, download e parse dos '
+                                     'curriculos Lattes em paralelo.')
+    parser.add_argument('capes_file', metavar='input_capes', type=str,
+                        help='arquivo Excel baixado do site da Capes com as '
+                        'variaveis ID_PESSOA e NM_DOCENTE')
+    parser.add_argument('output_folder', metavar='output_path', type=str,
+                        help='pasta onde serao gravados o journal, os arquivos '
+                        'zip e os arquivos csv')
+    parser.add_argument('--search-rate', type=float, default=5.0,
+                        help='numero maximo de requisicoes por segundo da busca')
+    parser.add_argument('--preview-workers', type=int, default=8,
+                        help='numero de paginas de preview buscadas em paralelo')
+    parser.add_argument('--kid-cache', type=str, default=None,
+                        help='journal com o cache de K-ids a ser reaproveitado')
+    parser.add_argument('--min-score', type=float, default=0.0,
+                        help='pontuacao minima do trecho para baixar um homonimo')
+    parser.add_argument('--download-rate', type=float, default=2.0,
+                        help='numero maximo de requisicoes por segundo do download')
+    parser.add_argument('--download-workers', type=int, default=4,
+                        help='numero maximo de downloads simultaneos')
+    parser.add_argument('--captcha-workers', type=int, default=4,
+                        help='numero de captchas resolvidos simultaneamente')
+    parser.add_argument('--store', type=str, default=None,
+                        help='arquivo SQLite onde os curriculos serao gravados')
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='numero maximo de captchas gastos com um mesmo ID')
+    parser.add_argument('--queue-size', type=int, default=100,
+                        help='tamanho maximo das filas entre as etapas')
+    cli_args.add_args_profile(parser)
+
+    return parser.parse_args()
+
+
+def put_downloaded_cv(queue_cvs, str_id_lattes, future):
+    """
+    Pass a finished download to the parse stage.
+
+    Args:
+        queue_cvs (queue.Queue): The queue of CVs to parse.
+        str_id_lattes (str): The CNPq ID downloaded.
+        future (concurrent.futures.Future): The future of the download.
+
+    Called by the download executor when the download finishes; only
+    successful downloads are queued. Blocks while the queue is full, which
+    holds back the download workers.
+
+    """
+    if not future.exception() and future.result() == xml.STATUS_OK:
+        queue_cvs.put(str_id_lattes)
+
+
+def run_download_stage(args, str_xml_folder_path, queue_ids, queue_cvs):
+    """
+    Download the CVs of the IDs found by the search stage.
+
+    Args:
+        args (argparse.Namespace): The arguments returned by get_args.
+        str_xml_folder_path (str): The download folder, with a trailing slash.
+        queue_ids (queue.Queue): The CNPq IDs found, ended by None.
+        queue_cvs (queue.Queue): The CNPq IDs downloaded, ended by None when
+            every download has finished.
+
+    The CVs already downloaded in earlier runs, as recorded in the manifest,
+    are passed to the parse stage first. Each ID is then checked against the
+    manifest, so IDs already downloaded or that used up their retry budget
+    cost nothing. The captcha workers start with the first ID to download and
+    their demand grows with every ID submitted. submit_download blocks while
+    the executor is full, which holds back the search stage.
+
+    """
+    b_ids_done = False
+    try:
+        str_manifest_path = manifest.get_manifest_path(str_xml_folder_path)
+
+        if args.store and not os.path.exists(args.store):
+            store.import_zip_folder(args.store, str_xml_folder_path)
+        xml.init_manifest(str_manifest_path, str_xml_folder_path, args.store)
+
+        for str_id_lattes in manifest.get_lst_ids_ok(str_manifest_path):
+            queue_cvs.put(str_id_lattes)
+
+        dbc_client = xml.get_dbc_client()
+        dict_download = xml.get_dict_download(args.download_rate, args.download_workers, 0,
+                                              args.store, str_manifest_path,
+                                              metrics.get_metrics_path(str_xml_folder_path))
+        xml.record_balance(dict_download, dbc_client, 'start')
+
+        lst_threads = None
+        set_ids_seen = set()
+        for str_id_lattes in iter(queue_ids.get, None):
+            if str_id_lattes in set_ids_seen or dict_download['b_stop']:
+                continue
+            set_ids_seen.add(str_id_lattes)
+
+            manifest.add_lst_ids(str_manifest_path, [str_id_lattes])
+            if not manifest.is_to_download(str_manifest_path, str_id_lattes,
+                                           args.max_attempts):
+                continue
+
+            if lst_threads is None:
+                lst_threads = xml.start_captcha_threads(args.captcha_workers, str_id_lattes,
+                                                        dbc_client, dict_download)
+
+            xml.add_download_demand(dict_download, 1)
+            future = xml.submit_download(dict_download, str_id_lattes, str_xml_folder_path)
+            future.add_done_callback(partial(put_downloaded_cv, queue_cvs, str_id_lattes))
+        b_ids_done = True
+
+        xml.finish_downloads(dict_download, lst_threads or [], dbc_client)
+
+        for str_status, str_error, n_count in manifest.get_lst_summary(str_manifest_path,
+                                                                       args.max_attempts):
+            print('manifest: {} {} {}'.format(n_count, str_status, str_error or ''))
+    finally:
+        queue_cvs.put(None)
+        if not b_ids_done:
+            # keep the search stage from blocking on a full queue
+            for _ in iter(queue_ids.get, None):
+                pass
+
+
+def run_parse_stage(pool, str_xml_folder_path, str_store_path, queue_cvs):
+    """
+    Parse the CVs as they are downloaded.
+
+    Args:
+        pool (multiprocessing.Pool): The pool of parse processes.
+        str_xml_folder_path (str): The download folder, with a trailing slash.
+        str_store_path (str or None): The CV store, or None to read the zip files.
+        queue_cvs (queue.Queue): The CNPq IDs downloaded, ended by None.
+
+    Returns:
+        list: The lists returned by parse_root, one per CV.
+
+    The zip files are read in memory, so nothing is extracted to disk.
+
+    """
+    if str_store_path:
+        func_parse = partial(parse.parse_store_cv, str_store_path)
+        iter_cvs = iter(queue_cvs.get, None)
+    else:
+        func_parse = parse.parse_zip_cv
+        iter_cvs = (f"{str_xml_folder_path}{x}.zip" for x in iter(queue_cvs.get, None))
+
+    return list(pool.imap_unordered(func_parse, iter_cvs))
+
+
+def run_search_stage(args, str_search_folder_path, queue_ids):
+    """
+    Search the CAPES names and pass the IDs found to the download stage.
+
+    Args:
+        args (argparse.Namespace): The arguments returned by get_args.
+        str_search_folder_path (str): The folder of the search journal.
+        queue_ids (queue.Queue): The CNPq IDs found, ended by None when the
+            search finishes.
+
+    The IDs already in the journal are passed first, so an interrupted run
+    resumes where it stopped. Then every name not searched yet is searched
+    and its plausible hits (see get_lst_idcnpq_plausible) are passed as soon
+    as they are in the journal. Blocks while the queue is full.
+
+    """
+    try:
+        if not os.path.exists(str_search_folder_path):
+            os.makedirs(str_search_folder_path)
+
+        str_journal_path = journal.get_journal_path(str_search_folder_path)
+        if not os.path.exists(str_journal_path):
+            journal.import_legacy_txt_files(str_journal_path, str_search_folder_path)
+
+        dict_context = search.get_dict_context(search.get_df_capes_context(args.capes_file))
+
+        dict_hits = {}
+        for str_idcnpq, str_bolsista, str_id_pessoa, _, str_snippet in \
+                journal.get_lst_search_result(str_journal_path):
+            if str_idcnpq:
+                dict_hits.setdefault(str_id_pessoa, []).append((str_idcnpq, str_bolsista,
+                                                                str_snippet))
+
+        for str_id_pessoa, lst_idcnpq in dict_hits.items():
+            for str_idcnpq in search.get_lst_idcnpq_plausible([str_id_pessoa], lst_idcnpq,
+                                                              dict_context, args.min_score):
+                queue_ids.put(str_idcnpq)
+
+        def on_result(lst_id, lst_idcnpq):
+            for str_idcnpq in search.get_lst_idcnpq_plausible(lst_id, lst_idcnpq,
+                                                              dict_context, args.min_score):
+                queue_ids.put(str_idcnpq)
+
+        search.search_capes_file(args.capes_file, str_search_folder_path, args.kid_cache,
+                                 args.search_rate, args.preview_workers, args.min_score,
+                                 on_result)
+    finally:
+        queue_ids.put(None)
+
+
+def main():
+    """
+    Run the search, download and parse stages at the same time.
+
+    Each stage reads the output of the previous one from a bounded queue, so
+    XML downloads start with the first ID found and parsing with the first zip
+    downloaded, and a slow stage holds back the faster ones. The search
+    journal and the download manifest are the checkpoints: an interrupted run
+    is resumed by running it again. The CVs downloaded in earlier runs are
+    parsed again, so the CSV files always cover every CV.
+
+    """
+    args = get_args()
+    str_output_path = util.format_path(args.output_folder)
+    str_search_folder_path = f"{str_output_path}capes_x_lattes"
+    str_xml_folder_path = f"{str_output_path}xml_lattes/"
+
+    if not os.path.exists(str_xml_folder_path):
+        os.makedirs(str_xml_folder_path)
+
+    dict_profile = profile.start_profile(args.profile, 'pipeline')
+
+    # the pool is forked before the stage threads start
+    pool = profile.get_pool(dict_profile)
+
+    queue_ids = queue.Queue(maxsize=args.queue_size)
+    queue_cvs = queue.Queue(maxsize=args.queue_size)
+
+    t_search = Thread(target=run_search_stage, args=(args, str_search_folder_path, queue_ids))
+    t_download = Thread(target=run_download_stage, args=(args, str_xml_folder_path,
+                                                         queue_ids, queue_cvs))
+    with profile.profile_step(dict_profile, 'stages'):
+        t_search.start()
+        t_download.start()
+
+        lst_lattes = run_parse_stage(pool, str_xml_folder_path, args.store, queue_cvs)
+
+        t_search.join()
+        t_download.join()
+    pool.close()
+    pool.join()
+
+    parse.save_lst_lattes(lst_lattes, str_output_path, dict_profile)
+
+    profile.stop_profile(dict_profile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 14:12:09 2026
+
+@author: andrefelix
+"""
+
+import utils_shard as shard
+
+
+def add_args_download(parser):
+    """
+    Add the arguments of download_xml_lattes to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the script or of the
+            download subcommand of lattes_cli.
+
+    Returns:
+        None
+
+    Example:
+        >>> parser = argparse.ArgumentParser()
+        >>> add_args_download(parser)
+        >>> parser.parse_args(['idlattes_to_download.csv', 'xml_lattes']).rate
+        2.0
+    """
+    parser.add_argument('input_file', metavar='lista_ids', type=str,
+                        help='nome do arquivo a ser processado. Deve conter uma'
+                        'lista de IDs de 16 digitos')
+    parser.add_argument('output_path', metavar='output_path', type=str,
+                        help='caminho onde serao gravados os arquivos zip')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='numero maximo de requisicoes por segundo ao CNPq')
+    parser.add_argument('--download-workers', type=int, default=4,
+                        help='numero maximo de downloads simultaneos')
+    parser.add_argument('--captcha-workers', type=int, default=4,
+                        help='numero de captchas resolvidos simultaneamente')
+    parser.add_argument('--store', type=str, default=None,
+                        help='arquivo SQLite onde os curriculos serao gravados '
+                        'em vez de um arquivo zip por ID')
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='numero maximo de captchas gastos com um mesmo ID')
+    parser.add_argument('--refresh', type=str, default=None,
+                        help='arquivo lattes_dados_gerais.csv; baixa novamente '
+                        'apenas os curriculos atualizados desde entao')
+    parser.add_argument('--kid-cache', type=str, default=None,
+                        help='journal de busca com os K-ids usados para consultar '
+                        'a data de atualizacao no preview')
+    parser.add_argument('--refresh-workers', type=int, default=8,
+                        help='numero de datas de atualizacao consultadas simultaneamente')
+    parser.add_argument('--shard', type=shard.get_tpl_shard, default=None,
+                        help='processa apenas a fatia i de N (i/N) dos IDs, numa '
+                        'subpasta shard_i_of_N da pasta de saida e num arquivo '
+                        '--store proprio. Veja reduce_shards')
+    add_args_profile(parser)
+
+
+def add_args_index(parser):
+    """
+    Add the arguments of the index subcommand of query_lattes to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the subcommand of
+            query_lattes or of lattes_cli.
+
+    Returns:
+        None
+    """
+    parser.add_argument('data_folder', metavar='data_path', type=str,
+                        help='pasta com os arquivos CSV do parse e do merge')
+
+    parser.add_argument('--db', type=str, default=None,
+                        help='arquivo DuckDB gravado. Padrao: lattes.duckdb na '
+                        'pasta dos dados')
+
+    parser.add_argument('--capes-file', type=str, default=None,
+                        help='arquivo Excel da Capes (passo 1), carregado com todas '
+                        'as colunas na tabela capes')
+
+
+def add_args_merge(parser):
+    """
+    Add the arguments of merge_capes_x_lattes to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the script or of the
+            merge subcommand of lattes_cli.
+
+    Returns:
+        None
+    """
+    parser.add_argument('capes_file', metavar='input_capes', type=str,
+                        help='caminho do arquivo CAPES ser combinado. Deve apontar '
+                        'para um arquivo Excel baixado do site da Capes. O '
+                        'arquivo deve conter as variaves ID_PESSOA, NM_DOCENTE, '
+                        'NM_IES_TITULACAO e AN_TITULACAO')
+
+    parser.add_argument('lattes_file', metavar='input_lattes', type=str,
+                        help='caminho do arquivo Lattes a ser combinado. Deve apontar '
+                        'para um arquivo csv (desambiguate) gerado pelo script '
+                        'parse_xml_lattes. Os resultados sao gravados na mesma pasta')
+
+    add_args_profile(parser)
+
+
+def add_args_parse(parser):
+    """
+    Add the arguments of parse_xml_lattes to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the script or of the
+            parse subcommand of lattes_cli.
+
+    Returns:
+        None
+    """
+    parser.add_argument('input_folder', metavar='content_folder', type=str,
+                        help='caminho dos arquivos a serem processados. Deve '
+                        'conter arquivos xml baixados do site do CNPq')
+
+    parser.add_argument('output_folder', metavar='output_path', type=str,
+                        help='caminho onde serao gravados os arquivos csv')
+
+    parser.add_argument('--store', type=str, default=None,
+                        help='arquivo SQLite com os curriculos a serem '
+                        'processados em vez da pasta de arquivos xml')
+
+    parser.add_argument('--shard', type=shard.get_tpl_shard, default=None,
+                        help='processa apenas a fatia i de N (i/N) dos curriculos, numa '
+                        'subpasta shard_i_of_N da pasta de saida. Veja reduce_shards')
+
+    parser.add_argument('--timeout', type=float, default=300.0,
+                        help='tempo maximo, em segundos, para interpretar um curriculo; '
+                        'o curriculo que o excede fica de fora dos arquivos csv. '
+                        'O limite e aproximado: a leitura do xml pelo lxml ou pelo expat '
+                        'nao e interrompida e termina antes. 0 desativa o limite')
+
+    parser.add_argument('--xml-backend', type=str, default='auto',
+                        choices=['auto', 'lxml', 'etree'],
+                        help='interpretador XML: lxml, mais rapido, se instalado, ou '
+                        'etree, da biblioteca padrao. Padrao: auto, o lxml quando '
+                        'instalado')
+
+    group_output = parser.add_mutually_exclusive_group()
+
+    group_output.add_argument('--csv-parts', action='store_true',
+                              help='grava os arquivos csv em partes comprimidas (gzip), '
+                              'escritas pelos processos do parse a cada lote de curriculos, '
+                              'na subpasta parse_parts com um manifesto. O reduce_shards '
+                              'as concatena nos arquivos csv')
+
+    group_output.add_argument('--disambiguate-only', action='store_true',
+                              help='grava apenas o id_lattes_to_disambiguate.csv, lendo '
+                              'cada curriculo somente ate a formacao academica, direto '
+                              'dos arquivos zip, para que o merge comece logo apos o '
+                              'download')
+
+    add_args_profile(parser)
+
+
+def add_args_profile(parser):
+    """
+    Add the --profile argument, shared by every stage, to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of a script or of a
+            subcommand of lattes_cli.
+
+    Returns:
+        None
+    """
+    parser.add_argument('--profile', type=str, default=None,
+                        help='pasta onde sera gravado o perfil de CPU e memoria '
+                        'da execucao, numa subpasta por execucao. Torna a '
+                        'execucao mais lenta')
+
+
+def add_args_query(parser):
+    """
+    Add the arguments of the query subcommand of query_lattes to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the subcommand of
+            query_lattes or of lattes_cli.
+
+    Returns:
+        None
+    """
+    parser.add_argument('data_folder', metavar='data_path', type=str,
+                        help='pasta com o arquivo lattes.duckdb')
+
+    parser.add_argument('sql', metavar='sql', type=str,
+                        help='consulta SQL, arquivo .sql ou nome de uma consulta '
+                        'pronta: tabelas, producao_por_tipo, producao_por_ano, '
+                        'producao_por_docente, producao_por_programa, itens_por_ano, '
+                        'itens_por_programa')
+
+    parser.add_argument('--db', type=str, default=None,
+                        help='arquivo DuckDB consultado. Padrao: lattes.duckdb na '
+                        'pasta dos dados')
+
+    parser.add_argument('--limit', type=int, default=100,
+                        help='numero maximo de linhas exibidas')
+
+    parser.add_argument('--csv', type=str, default=None,
+                        help='arquivo CSV onde sera gravado o resultado completo')
+
+
+def add_args_reduce(parser):
+    """
+    Add the arguments of reduce_shards to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the script or of the
+            reduce subcommand of lattes_cli.
+
+    Returns:
+        None
+    """
+    parser.add_argument('output_folder', metavar='output_path', type=str,
+                        help='pasta de saida de uma etapa executada com --shard, '
+                        'com as subpastas shard_i_of_N a serem combinadas')
+
+    parser.add_argument('--store', type=str, default=None,
+                        help='arquivo SQLite informado na opcao --store do '
+                        'download; os arquivos de cada shard sao combinados nele')
+
+
+def add_args_search(parser):
+    """
+    Add the arguments of download_id_lattes to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser of the script or of the
+            search subcommand of lattes_cli.
+
+    Returns:
+        None
+    """
+    parser.add_argument('input_file', metavar='content_file', type=str,
+                        help='nome do arquivo a ser processado. Deve apontar '
+                        'para um arquivo Excel baixado do site da Capes. O '
+                        'arquivo deve conter as variaves ID_PESSOA e NM_DOCENTE')
+
+    parser.add_argument('output_folder', metavar='output_path', type=str,
+                        help='caminho onde serao gravados o journal de buscas '
+                        'e os arquivos csv')
+
+    parser.add_argument('--rate', type=float, default=5.0,
+                        help='numero maximo de requisicoes por segundo ao CNPq')
+
+    parser.add_argument('--preview-workers', type=int, default=8,
+                        help='numero de paginas de preview buscadas em paralelo')
+
+    parser.add_argument('--kid-cache', type=str, default=None,
+                        help='journal com o cache de K-ids a ser reaproveitado '
+                        'entre execucoes. Padrao: o journal da pasta de saida')
+
+    parser.add_argument('--min-score', type=float, default=0.0,
+                        help='pontuacao minima (0 a 1) do trecho exibido na busca '
+                        'para que um homonimo seja baixado. Padrao: 0, todos')
+
+    parser.add_argument('--shard', type=shard.get_tpl_shard, default=None,
+                        help='processa apenas a fatia i de N (i/N) dos nomes, numa '
+                        'subpasta shard_i_of_N da pasta de saida. Veja reduce_shards')
+
+    add_args_profile(parser)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 08:41:05 2026
+
+@author: andrefelix
+"""
+
+import contextlib
+import datetime
+import glob
+import hashlib
+import os
+import sqlite3
+import threading
+import urllib.parse
+import zipfile
+import zlib
+
+# bytes of curriculo.xml read from the zip file at a time
+N_CHUNK_SIZE = 1 << 20
+
+# read-only connections of get_cv_xml, kept open for every CV read by the
+# thread, e.g. by a worker of the parse pool
+thread_local_read = threading.local()
+
+
+def connect_store(str_store_path):
+    """
+    Open a connection to the CV store, creating its schema if needed.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file.
+
+    Returns:
+        sqlite3.Connection: An open connection to the store.
+
+    Used by the functions that write the store; the CV reads of the parse use
+    connect_store_read. The store keeps every curriculo.xml in a single file instead of one zip
+    and one XML per researcher. Payloads are zlib compressed and keyed by the
+    SHA-256 of the XML, so a CV that did not change between two refresh cycles
+    is stored only once. The cv table maps each CNPq ID to its current payload;
+    a payload no longer referenced by any ID is deleted.
+
+    Example:
+        >>> with contextlib.closing(connect_store('../data/cv_store.sqlite')) as conn:
+        ...     pass
+    """
+    conn = sqlite3.connect(str_store_path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS cv_blob ('
+                 'SHA256 TEXT PRIMARY KEY, '
+                 'N_SIZE INTEGER NOT NULL, '
+                 'DATA BLOB NOT NULL)')
+    conn.execute('CREATE TABLE IF NOT EXISTS cv ('
+                 'ID_LATTES TEXT PRIMARY KEY, '
+                 'SHA256 TEXT NOT NULL REFERENCES cv_blob (SHA256), '
+                 'DT_STORED TEXT NOT NULL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS cv_sha256 ON cv (SHA256)')
+    conn.commit()
+
+    return conn
+
+
+def connect_store_read(str_store_path):
+    """
+    Get the read-only connection of the thread to the CV store.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file.
+
+    Returns:
+        sqlite3.Connection: A connection opened in read-only mode, without
+        creating the schema, and reused by the next calls of the thread with
+        the same store. A new one is opened in a process forked after it.
+
+    Raises:
+        sqlite3.OperationalError: If the store does not exist.
+
+    Example:
+        >>> connect_store_read('../data/cv_store.sqlite') is connect_store_read('../data/cv_store.sqlite')
+        True
+    """
+    str_key = os.path.abspath(str_store_path)
+
+    # a connection must not be used in a process forked from the one that opened it
+    if getattr(thread_local_read, 'n_pid', None) != os.getpid():
+        thread_local_read.n_pid = os.getpid()
+        thread_local_read.dict_connections = dict()
+
+    if str_key not in thread_local_read.dict_connections:
+        thread_local_read.dict_connections[str_key] = sqlite3.connect(
+            'file:{}?mode=ro'.format(urllib.parse.quote(str_key)), uri=True, timeout=60)
+
+    return thread_local_read.dict_connections[str_key]
+
+
+def get_cv_xml(str_store_path, str_id_lattes):
+    """
+    Get the curriculo.xml content of a CNPq ID.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file.
+        str_id_lattes (str): The CNPq ID.
+
+    Returns:
+        bytes or None: The XML content, still in its original encoding, or
+        None if the ID is not in the store.
+
+    The connection of connect_store_read is reused, so the parse workers open
+    the store once each instead of once per CV.
+
+    Example:
+        >>> get_cv_xml('../data/cv_store.sqlite', '1234567890123456')[:38]
+        b'<?xml version="1.0" encoding="ISO-8859'
+    """
+    row = connect_store_read(str_store_path).execute(
+        'SELECT cv_blob.DATA FROM cv JOIN cv_blob USING (SHA256) '
+        'WHERE cv.ID_LATTES = ?', (str_id_lattes,)).fetchone()
+
+    return zlib.decompress(row[0]) if row else None
+
+
+def get_dict_sizes_stored(str_store_path):
+    """
+    Get the size of the XML of each CV stored.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file.
+
+    Returns:
+        dict: The uncompressed size in bytes, by CNPq ID.
+
+    Example:
+        >>> get_dict_sizes_stored('../data/cv_store.sqlite')
+        {'1234567890123456': 183204, '6543210987654321': 40211}
+    """
+    with contextlib.closing(connect_store(str_store_path)) as conn:
+        return dict(conn.execute('SELECT cv.ID_LATTES, cv_blob.N_SIZE FROM cv '
+                                 'JOIN cv_blob USING (SHA256)'))
+
+
+def get_lst_ids_stored(str_store_path):
+    """
+    Get the CNPq IDs stored, sorted by ID.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file.
+
+    Returns:
+        list: The CNPq IDs with a CV in the store.
+
+    Example:
+        >>> get_lst_ids_stored('../data/cv_store.sqlite')
+        ['1234567890123456', '6543210987654321']
+    """
+    with contextlib.closing(connect_store(str_store_path)) as conn:
+        return [row[0] for row in conn.execute('SELECT ID_LATTES FROM cv ORDER BY ID_LATTES')]
+
+
+def import_zip_folder(str_store_path, str_folder_path):
+    """
+    Import the '<id>.zip' files of a download folder into the store.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file.
+        str_folder_path (str): The folder holding the zip files.
+
+    Returns:
+        int: The number of files imported.
+
+    IDs already in the store and invalid zip files are skipped, so the import
+    can be repeated safely.
+
+    Example:
+        >>> import_zip_folder('../data/cv_store.sqlite', '../data/xml_lattes')
+        1520
+    """
+    set_stored = set(get_lst_ids_stored(str_store_path))
+    n_imported = 0
+
+    for str_file_name in glob.glob(os.path.join(str_folder_path, '*.zip')):
+        str_id_lattes = os.path.basename(str_file_name).split('.')[0]
+        if str_id_lattes in set_stored or not zipfile.is_zipfile(str_file_name):
+            continue
+
+        put_cv_zip(str_store_path, str_id_lattes, str_file_name)
+        n_imported += 1
+
+    return n_imported
+
+
+def merge_store(str_store_path, str_store_path_other):
+    """
+    Copy the CVs of another store, e.g. of a shard.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file that
+            receives the CVs.
+        str_store_path_other (str): The store whose CVs are copied.
+
+    Returns:
+        int: The number of CNPq IDs copied.
+
+    Payloads already stored are not copied again. An ID in both stores keeps
+    the CV stored last, so the merge can be repeated safely. The payloads left
+    without any ID by the merge are deleted.
+
+    Example:
+        >>> merge_store('../data/cv_store.sqlite', '../data/cv_store.shard_1_of_4.sqlite')
+        6244
+    """
+    connect_store(str_store_path_other).close()
+
+    with contextlib.closing(connect_store(str_store_path)) as conn:
+        conn.execute('ATTACH DATABASE ? AS other', (str_store_path_other,))
+        with conn:
+            conn.execute('INSERT OR IGNORE INTO main.cv_blob (SHA256, N_SIZE, DATA) '
+                         'SELECT SHA256, N_SIZE, DATA FROM other.cv_blob')
+            cursor = conn.execute('INSERT OR REPLACE INTO main.cv (ID_LATTES, SHA256, DT_STORED) '
+                                  'SELECT o.ID_LATTES, o.SHA256, o.DT_STORED FROM other.cv o '
+                                  'LEFT JOIN main.cv m ON m.ID_LATTES = o.ID_LATTES '
+                                  'WHERE m.ID_LATTES IS NULL OR o.DT_STORED > m.DT_STORED')
+            n_copied = cursor.rowcount
+            conn.execute('DELETE FROM main.cv_blob WHERE SHA256 NOT IN '
+                         '(SELECT SHA256 FROM main.cv)')
+        conn.execute('DETACH DATABASE other')
+
+    return n_copied
+
+
+def put_cv_zip(str_store_path, str_id_lattes, str_zip_file_name):
+    """
+    Store the curriculo.xml of a downloaded zip file.
+
+    Args:
+        str_store_path (str): The path of the SQLite store file.
+        str_id_lattes (str): The CNPq ID of the CV.
+        str_zip_file_name (str): The path of a valid Lattes zip file.
+
+    Returns:
+        bool: True if the XML content was new, False if an identical payload
+        was already stored and is only referenced again.
+
+    The XML is read from the zip file in chunks of N_CHUNK_SIZE bytes, which
+    are hashed and compressed as they are read, so only the compressed
+    payload is held in memory. When the ID had another payload and no other
+    ID references it, that payload is deleted.
+
+    Example:
+        >>> put_cv_zip('../data/cv_store.sqlite', '1234567890123456',
+        ...            '../data/xml_lattes/1234567890123456.zip.part')
+        True
+    """
+    hash_xml = hashlib.sha256()
+    compress_xml = zlib.compressobj()
+    lst_compressed = []
+    n_size = 0
+
+    with zipfile.ZipFile(str_zip_file_name) as lattes_zip:
+        with lattes_zip.open('curriculo.xml') as file_xml:
+            for bytes_chunk in iter(lambda: file_xml.read(N_CHUNK_SIZE), b''):
+                hash_xml.update(bytes_chunk)
+                lst_compressed.append(compress_xml.compress(bytes_chunk))
+                n_size += len(bytes_chunk)
+    lst_compressed.append(compress_xml.flush())
+
+    str_sha256 = hash_xml.hexdigest()
+    str_now = datetime.datetime.now().isoformat(timespec='seconds')
+
+    with contextlib.closing(connect_store(str_store_path)) as conn:
+        with conn:
+            row_old = conn.execute('SELECT SHA256 FROM cv WHERE ID_LATTES = ?',
+                                   (str_id_lattes,)).fetchone()
+            cursor = conn.execute('INSERT OR IGNORE INTO cv_blob (SHA256, N_SIZE, DATA) '
+                                  'VALUES (?, ?, ?)',
+                                  (str_sha256, n_size, b''.join(lst_compressed)))
+            b_new = cursor.rowcount > 0
+            conn.execute('INSERT OR REPLACE INTO cv (ID_LATTES, SHA256, DT_STORED) '
+                         'VALUES (?, ?, ?)', (str_id_lattes, str_sha256, str_now))
+            if row_old and row_old[0] != str_sha256:
+                conn.execute('DELETE FROM cv_blob WHERE SHA256 = ? AND NOT EXISTS '
+                             '(SELECT 1 FROM cv WHERE cv.SHA256 = cv_blob.SHA256)',
+                             (row_old[0],))
+
+    return b_new
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 15:27:52 2026
+
+@author: andrefelix
+"""
+
+import contextlib
+import datetime
+import os
+import sqlite3
+
+
+MANIFEST_FILE_NAME = 'download_manifest.sqlite'
+
+STATUS_PENDING = 'pending'
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+
+ERROR_CAPTCHA = 'captcha'
+ERROR_INVALID_ZIP = 'invalid_zip'
+ERROR_NO_TOKEN = 'no_token'
+
+
+def add_lst_ids(str_manifest_path, lst_ids):
+    """
+    Add the IDs of an input list to the manifest as pending.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        lst_ids (list): The CNPq IDs to be downloaded.
+
+    IDs already in the manifest keep their status and attempt count.
+
+    Example:
+        >>> add_lst_ids('../data/xml_lattes/download_manifest.sqlite',
+        ...             ['1234567890123456', '6543210987654321'])
+    """
+    str_now = get_str_now()
+
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO manifest '
+                             '(ID_LATTES, STATUS, N_ATTEMPTS, DT_FIRST) '
+                             'VALUES (?, ?, 0, ?)',
+                             [(x, STATUS_PENDING, str_now) for x in lst_ids])
+
+
+def connect_manifest(str_manifest_path):
+    """
+    Open a connection to the download manifest, creating its schema if needed.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+
+    Returns:
+        sqlite3.Connection: An open connection to the manifest.
+
+    The manifest has one row per CNPq ID with its status (pending, ok or error),
+    the number of attempts that spent a CAPTCHA, the class of the last error,
+    the bytes downloaded and the time of the first and last attempts.
+
+    Example:
+        >>> with contextlib.closing(connect_manifest('download_manifest.sqlite')) as conn:
+        ...     pass
+    """
+    conn = sqlite3.connect(str_manifest_path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS manifest ('
+                 'ID_LATTES TEXT PRIMARY KEY, '
+                 'STATUS TEXT NOT NULL, '
+                 'N_ATTEMPTS INTEGER NOT NULL, '
+                 'LAST_ERROR TEXT, '
+                 'N_BYTES INTEGER, '
+                 'DT_FIRST TEXT NOT NULL, '
+                 'DT_LAST TEXT)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_manifest_status ON manifest (STATUS)')
+    conn.commit()
+
+    return conn
+
+
+def get_dict_id_lattes(str_manifest_path, str_id_lattes):
+    """
+    Get the manifest row of an ID.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        str_id_lattes (str): The CNPq ID.
+
+    Returns:
+        dict or None: The columns of the row by name, or None if the ID is
+        not in the manifest.
+
+    Example:
+        >>> get_dict_id_lattes('download_manifest.sqlite', '1234567890123456')['STATUS']
+        'ok'
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        cursor = conn.execute('SELECT * FROM manifest WHERE ID_LATTES = ?', (str_id_lattes,))
+        row = cursor.fetchone()
+
+        return dict(zip([x[0] for x in cursor.description], row)) if row else None
+
+
+def get_lst_ids_to_download(str_manifest_path, n_max_attempts):
+    """
+    Get the IDs not downloaded yet that still have attempts left.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        n_max_attempts (int): The retry budget of each ID.
+
+    Returns:
+        list: The CNPq IDs to download, sorted.
+
+    Example:
+        >>> get_lst_ids_to_download('download_manifest.sqlite', 3)
+        ['6543210987654321']
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        return [row[0] for row in
+                conn.execute('SELECT ID_LATTES FROM manifest '
+                             'WHERE STATUS != ? AND N_ATTEMPTS < ? ORDER BY ID_LATTES',
+                             (STATUS_OK, n_max_attempts))]
+
+
+def get_lst_attempts_histogram(str_manifest_path):
+    """
+    Count the IDs of the manifest by status and number of attempts.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+
+    Returns:
+        list: A list of tuples (status, number of attempts, number of IDs),
+        which shows how many CAPTCHAs the downloads took.
+
+    Example:
+        >>> get_lst_attempts_histogram('download_manifest.sqlite')
+        [('error', 3, 4), ('ok', 1, 1480), ('ok', 2, 22)]
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        return conn.execute('SELECT STATUS, N_ATTEMPTS, COUNT(*) FROM manifest '
+                            'GROUP BY STATUS, N_ATTEMPTS ORDER BY STATUS, N_ATTEMPTS').fetchall()
+
+
+def get_lst_ids_exhausted(str_manifest_path, n_max_attempts):
+    """
+    Get the IDs not downloaded that used up their retry budget.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        n_max_attempts (int): The retry budget of each ID.
+
+    Returns:
+        list: The CNPq IDs no longer retried, sorted.
+
+    Example:
+        >>> get_lst_ids_exhausted('download_manifest.sqlite', 3)
+        ['1111111111111111']
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        return [row[0] for row in
+                conn.execute('SELECT ID_LATTES FROM manifest '
+                             'WHERE STATUS != ? AND N_ATTEMPTS >= ? ORDER BY ID_LATTES',
+                             (STATUS_OK, n_max_attempts))]
+
+
+def get_lst_ids_ok(str_manifest_path):
+    """
+    Get the IDs already downloaded.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+
+    Returns:
+        list: The CNPq IDs with status ok, sorted.
+
+    Example:
+        >>> get_lst_ids_ok('download_manifest.sqlite')
+        ['1234567890123456']
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        return [row[0] for row in
+                conn.execute('SELECT ID_LATTES FROM manifest WHERE STATUS = ? '
+                             'ORDER BY ID_LATTES', (STATUS_OK,))]
+
+
+def get_lst_summary(str_manifest_path, n_max_attempts):
+    """
+    Count the IDs of the manifest by status and last error.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        n_max_attempts (int): The retry budget of each ID; IDs that used it
+            all are reported with the status 'exhausted'.
+
+    Returns:
+        list: A list of tuples (status, last error, number of IDs). The last
+        error of IDs downloaded after a failure is not reported.
+
+    Example:
+        >>> get_lst_summary('download_manifest.sqlite', 3)
+        [('error', 'captcha', 12), ('exhausted', 'invalid_zip', 3), ('ok', None, 1502)]
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        return conn.execute('SELECT CASE WHEN STATUS != ? AND N_ATTEMPTS >= ? '
+                            'THEN \'exhausted\' ELSE STATUS END AS STATUS_RUN, '
+                            'CASE WHEN STATUS != ? THEN LAST_ERROR END AS ERROR_RUN, '
+                            'COUNT(*) FROM manifest '
+                            'GROUP BY STATUS_RUN, ERROR_RUN ORDER BY STATUS_RUN, ERROR_RUN',
+                            (STATUS_OK, n_max_attempts, STATUS_OK)).fetchall()
+
+
+def get_manifest_path(str_download_folder_path):
+    """
+    Get the path of the download manifest inside the download folder.
+
+    Args:
+        str_download_folder_path (str): The path of the download folder.
+
+    Returns:
+        str: The path of the manifest file.
+
+    Example:
+        >>> get_manifest_path('../data/xml_lattes/')
+        '../data/xml_lattes/download_manifest.sqlite'
+    """
+    return os.path.join(str_download_folder_path, MANIFEST_FILE_NAME)
+
+
+def get_str_now():
+    """
+    Get the current time formatted for the manifest.
+
+    Returns:
+        str: The current time in ISO format, to the second.
+    """
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def is_to_download(str_manifest_path, str_id_lattes, n_max_attempts):
+    """
+    Check whether an ID is not downloaded yet and still has attempts left.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        str_id_lattes (str): The CNPq ID.
+        n_max_attempts (int): The retry budget of each ID.
+
+    Returns:
+        bool: True if the ID is in the manifest and should be downloaded.
+
+    Example:
+        >>> is_to_download('download_manifest.sqlite', '6543210987654321', 3)
+        True
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        return conn.execute('SELECT 1 FROM manifest WHERE ID_LATTES = ? '
+                            'AND STATUS != ? AND N_ATTEMPTS < ?',
+                            (str_id_lattes, STATUS_OK, n_max_attempts)).fetchone() is not None
+
+
+def mark_lst_ids_ok(str_manifest_path, lst_ids):
+    """
+    Mark IDs downloaded before the manifest existed as ok.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        lst_ids (list): The CNPq IDs already downloaded.
+
+    Example:
+        >>> mark_lst_ids_ok('download_manifest.sqlite', ['1234567890123456'])
+    """
+    str_now = get_str_now()
+
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO manifest '
+                             '(ID_LATTES, STATUS, N_ATTEMPTS, DT_FIRST, DT_LAST) '
+                             'VALUES (?, ?, 0, ?, ?)',
+                             [(x, STATUS_OK, str_now, str_now) for x in lst_ids])
+
+
+def merge_manifest(str_manifest_path, str_manifest_path_other):
+    """
+    Copy the rows of another manifest, e.g. of a shard.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file that
+            receives the rows.
+        str_manifest_path_other (str): The manifest whose rows are copied.
+
+    Returns:
+        int: The number of rows copied.
+
+    An ID in both manifests keeps the row downloaded successfully or, when
+    both or neither were, the row of the latest attempt, so the merge can be
+    repeated safely.
+
+    Example:
+        >>> merge_manifest('xml_lattes/download_manifest.sqlite',
+        ...                'xml_lattes/shard_1_of_4/download_manifest.sqlite')
+        6244
+    """
+    connect_manifest(str_manifest_path_other).close()
+
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        conn.execute('ATTACH DATABASE ? AS other', (str_manifest_path_other,))
+        with conn:
+            cursor = conn.execute(
+                'INSERT OR REPLACE INTO main.manifest '
+                'SELECT o.* FROM other.manifest o '
+                'LEFT JOIN main.manifest m ON m.ID_LATTES = o.ID_LATTES '
+                'WHERE m.ID_LATTES IS NULL '
+                'OR (o.STATUS = ?) > (m.STATUS = ?) '
+                "OR ((o.STATUS = ?) = (m.STATUS = ?) "
+                "AND COALESCE(o.DT_LAST, '') > COALESCE(m.DT_LAST, ''))",
+                (STATUS_OK, STATUS_OK, STATUS_OK, STATUS_OK))
+        conn.execute('DETACH DATABASE other')
+
+    return cursor.rowcount
+
+
+def requeue_lst_ids(str_manifest_path, lst_ids):
+    """
+    Mark IDs as pending again with a fresh retry budget.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        lst_ids (list): The CNPq IDs to be downloaded again, e.g. CVs updated
+            since they were downloaded.
+
+    Example:
+        >>> requeue_lst_ids('download_manifest.sqlite', ['1234567890123456'])
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        with conn:
+            conn.executemany('UPDATE manifest SET STATUS = ?, N_ATTEMPTS = 0, '
+                             'LAST_ERROR = NULL WHERE ID_LATTES = ?',
+                             [(STATUS_PENDING, x) for x in lst_ids])
+
+
+def record_failure(str_manifest_path, str_id_lattes, str_error, b_attempt):
+    """
+    Record a failed download.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        str_id_lattes (str): The CNPq ID.
+        str_error (str): The error class, e.g. 'captcha', 'invalid_zip' or
+            one of the classes of utils_rate_control.classify_error.
+        b_attempt (bool): Whether the failure spent a CAPTCHA and counts for
+            the retry budget.
+
+    Example:
+        >>> record_failure('download_manifest.sqlite', '1234567890123456', 'captcha', True)
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        with conn:
+            conn.execute('UPDATE manifest SET STATUS = ?, N_ATTEMPTS = N_ATTEMPTS + ?, '
+                         'LAST_ERROR = ?, DT_LAST = ? WHERE ID_LATTES = ?',
+                         (STATUS_ERROR, int(b_attempt), str_error, get_str_now(),
+                          str_id_lattes))
+
+
+def record_success(str_manifest_path, str_id_lattes, n_bytes):
+    """
+    Record a successful download.
+
+    Args:
+        str_manifest_path (str): The path of the SQLite manifest file.
+        str_id_lattes (str): The CNPq ID.
+        n_bytes (int): The size of the downloaded zip file.
+
+    Example:
+        >>> record_success('download_manifest.sqlite', '1234567890123456', 48213)
+    """
+    with contextlib.closing(connect_manifest(str_manifest_path)) as conn:
+        with conn:
+            conn.execute('UPDATE manifest SET STATUS = ?, N_ATTEMPTS = N_ATTEMPTS + 1, '
+                         'N_BYTES = ?, DT_LAST = ? WHERE ID_LATTES = ?',
+                         (STATUS_OK, n_bytes, get_str_now(), str_id_lattes))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 10:17:36 2026
+
+@author: andrefelix
+"""
+
+import datetime
+import json
+import os
+import threading
+
+
+METRICS_FILE_NAME = 'download_metrics.jsonl'
+
+CAPTCHA_OK = 'ok'
+CAPTCHA_INCORRECT = 'incorrect'
+CAPTCHA_ACCESS_DENIED = 'access_denied'
+CAPTCHA_EMPTY = 'empty'
+CAPTCHA_ERROR = 'error'
+
+# per-ID timings summarized at the end of the run
+LST_TIMINGS = ['captcha_s', 'token_wait_s', 'token_age_s', 'get_s', 'post_s', 'total_s']
+
+
+def get_metrics_path(str_download_folder_path):
+    """
+    Get the path of the metrics log inside the download folder.
+
+    Args:
+        str_download_folder_path (str): The path of the download folder.
+
+    Returns:
+        str: The path of the JSONL metrics file.
+
+    Example:
+        >>> get_metrics_path('../data/xml_lattes/')
+        '../data/xml_lattes/download_metrics.jsonl'
+    """
+    return os.path.join(str_download_folder_path, METRICS_FILE_NAME)
+
+
+def get_percentiles(lst_values):
+    """
+    Get the median and the 95th percentile of a list of values.
+
+    Args:
+        lst_values (list): The values, in any order.
+
+    Returns:
+        tuple: p50 and p95, or (None, None) if the list is empty.
+
+    Example:
+        >>> get_percentiles([3.0, 1.0, 2.0])
+        (2.0, 3.0)
+    """
+    if not lst_values:
+        return None, None
+
+    lst_sorted = sorted(lst_values)
+    n_size = len(lst_sorted)
+
+    return lst_sorted[int(n_size * 0.50)], lst_sorted[min(n_size - 1, int(n_size * 0.95))]
+
+
+class DownloadMetrics:
+    """
+    Per-stage timing, cost and error counters of an XML download run.
+
+    Args:
+        str_metrics_path (str): The JSONL file the events are appended to.
+
+    Every CAPTCHA solve and every download is written as one JSON line, tagged
+    with the start time of the run, so several runs can share the same log.
+    The counters and timings are also kept in memory for the summary printed
+    at the end of the run. The DeathByCaptcha balance is read at the start and
+    at the end, which gives the amount actually spent per CAPTCHA and per CV.
+
+    Example:
+        >>> metrics = DownloadMetrics('../data/xml_lattes/download_metrics.jsonl')
+        >>> metrics.record_balance('start', 1520.3)
+        >>> metrics.record_captcha(0, 18.2, 'ok')
+        >>> metrics.close()
+    """
+
+    def __init__(self, str_metrics_path):
+        self.str_run = datetime.datetime.now().isoformat(timespec='seconds')
+        self.file = open(str_metrics_path, mode='a', encoding='utf-8')
+        self.dict_captcha = {x: 0 for x in [CAPTCHA_OK, CAPTCHA_INCORRECT,
+                                            CAPTCHA_ACCESS_DENIED, CAPTCHA_EMPTY,
+                                            CAPTCHA_ERROR]}
+        self.dict_balance = {}
+        self.dict_timings = {x: [] for x in LST_TIMINGS}
+        self.dict_status = {}
+        self.dict_validation = {}
+        self.n_bytes = 0
+        self.lock = threading.Lock()
+
+    def write_event(self, str_event, dict_event):
+        """
+        Append an event to the JSONL log. Must hold the lock.
+        """
+        self.file.write(json.dumps(dict(dict_event, run=self.str_run, event=str_event,
+                                        ts=datetime.datetime.now().isoformat(timespec='milliseconds'))) + '\n')
+        self.file.flush()
+
+    def record_balance(self, str_moment, float_balance):
+        """
+        Register the DeathByCaptcha balance, in US cents, at the start or end of the run.
+        """
+        with self.lock:
+            self.dict_balance[str_moment] = float_balance
+            self.write_event('balance', {'moment': str_moment, 'balance': float_balance})
+
+    def record_captcha(self, str_thread_index, float_seconds, str_result):
+        """
+        Register a CAPTCHA solve attempt, its duration and its result.
+        """
+        with self.lock:
+            self.dict_captcha[str_result] += 1
+            if str_result == CAPTCHA_OK:
+                self.dict_timings['captcha_s'].append(float_seconds)
+            self.write_event('captcha', {'thread': str_thread_index,
+                                         'seconds': round(float_seconds, 3),
+                                         'result': str_result})
+
+    def record_download(self, dict_event):
+        """
+        Register the timings, size, validation result and status of a download.
+        """
+        with self.lock:
+            for str_timing in LST_TIMINGS[1:]:
+                if dict_event.get(str_timing) is not None:
+                    self.dict_timings[str_timing].append(dict_event[str_timing])
+            self.dict_status[dict_event['status']] = \
+                self.dict_status.get(dict_event['status'], 0) + 1
+            if dict_event.get('validation'):
+                self.dict_validation[dict_event['validation']] = \
+                    self.dict_validation.get(dict_event['validation'], 0) + 1
+            self.n_bytes += dict_event.get('bytes') or 0
+            self.write_event('download', {k: round(v, 3) if isinstance(v, float) else v
+                                          for k, v in dict_event.items()})
+
+    def get_summary(self, str_status_ok):
+        """
+        Get the summary of the run.
+
+        Args:
+            str_status_ok (str): The download status counted as a successful CV.
+
+        Returns:
+            dict: Counters of CAPTCHAs by result, downloads by status and by
+            validation result, bytes downloaded, p50/p95 of every timing in
+            seconds and, when both balances are known, the amount spent, the
+            spend per solved CAPTCHA and per successful CV, in US cents.
+        """
+        with self.lock:
+            n_ok = self.dict_status.get(str_status_ok, 0)
+            n_solved = self.dict_captcha[CAPTCHA_OK] + self.dict_captcha[CAPTCHA_INCORRECT]
+            dict_summary = {'captcha': dict(self.dict_captcha),
+                            'status': dict(self.dict_status),
+                            'validation': dict(self.dict_validation),
+                            'bytes': self.n_bytes,
+                            'timings': {x: get_percentiles(lst)
+                                        for x, lst in self.dict_timings.items()}}
+
+            if 'start' in self.dict_balance and 'end' in self.dict_balance:
+                float_spent = self.dict_balance['start'] - self.dict_balance['end']
+                dict_summary['balance'] = dict(self.dict_balance)
+                dict_summary['spent'] = float_spent
+                dict_summary['spent_per_captcha'] = float_spent / n_solved if n_solved else None
+                dict_summary['cost_per_cv'] = float_spent / n_ok if n_ok else None
+
+            self.write_event('summary', dict_summary)
+
+        return dict_summary
+
+    def close(self):
+        """
+        Close the JSONL log.
+        """
+        with self.lock:
+            self.file.close()
+
+
+def show_summary(dict_summary):
+    """
+    Displays the summary of a download run.
+
+    Args:
+        dict_summary (dict): The summary returned by DownloadMetrics.get_summary.
+
+    Returns:
+        None
+
+    Example:
+        >>> show_summary(metrics.get_summary('ok'))
+        captchas: 52 ok, 3 incorrect, 0 access denied, 1 empty, 0 error
+        downloads: {'ok': 49, 'error': 6} - validation: {'ok': 49, 'captcha': 3} - 2.4 MB
+        captcha_s p50: 17.9s p95: 31.2s
+        ...
+        balance: 1520.3 -> 1503.8, spent 16.5 cents - 0.300 per captcha - 0.337 per CV
+    """
+    dict_captcha = dict_summary['captcha']
+    print('captchas: {} ok, {} incorrect, {} access denied, {} empty, {} error'.format(
+        dict_captcha[CAPTCHA_OK], dict_captcha[CAPTCHA_INCORRECT],
+        dict_captcha[CAPTCHA_ACCESS_DENIED], dict_captcha[CAPTCHA_EMPTY],
+        dict_captcha[CAPTCHA_ERROR]))
+    print('downloads: {} - validation: {} - {:.1f} MB'.format(dict_summary['status'],
+                                                             dict_summary['validation'],
+                                                             dict_summary['bytes'] / 2 ** 20))
+
+    for str_timing, (float_p50, float_p95) in dict_summary['timings'].items():
+        if float_p50 is not None:
+            print('{} p50: {:.1f}s p95: {:.1f}s'.format(str_timing, float_p50, float_p95))
+
+    if 'spent' in dict_summary:
+        print('balance: {:.1f} -> {:.1f}, spent {:.1f} cents - {} per captcha - {} per CV'.format(
+            dict_summary['balance']['start'], dict_summary['balance']['end'],
+            dict_summary['spent'],
+            '{:.3f}'.format(dict_summary['spent_per_captcha'])
+            if dict_summary['spent_per_captcha'] is not None else '-',
+            '{:.3f}'.format(dict_summary['cost_per_cv'])
+            if dict_summary['cost_per_cv'] is not None else '-'))
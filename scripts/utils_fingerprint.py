@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 27 15:06:41 2026
+
+@author: andrefelix
+"""
+
+import hashlib
+import re
+import unicodedata
+
+# attributes of the children of a production node that hold its title, its
+# year and its ISSN or ISBN; each node has at most one of each
+LST_TITLE_ATTS = ['TITULO', 'TITULO-DO-ARTIGO', 'TITULO-DO-LIVRO',
+                  'TITULO-DO-CAPITULO-DO-LIVRO', 'TITULO-DO-TEXTO']
+LST_YEAR_ATTS = ['ANO', 'ANO-DO-ARTIGO', 'ANO-DO-TEXTO']
+LST_NUMBER_ATTS = ['ISSN', 'ISBN']
+
+# every attribute read by get_fingerprint
+LST_ATTS = ['DOI'] + LST_TITLE_ATTS + LST_YEAR_ATTS + LST_NUMBER_ATTS
+
+REGEX_DOI = r'10\.\d{4,9}/\S+'
+REGEX_DOI_PREFIX = r'^(https?://(dx\.)?doi\.org/|doi:\s*)'
+
+
+def get_doi(str_doi):
+    """
+    Normalize a DOI as typed in a CV.
+
+    Args:
+        str_doi (str): The DOI attribute, possibly empty or with a resolver prefix.
+
+    Returns:
+        str: The DOI in lower case, without prefix, or '' if it is not a DOI.
+
+    Example:
+        >>> get_doi('https://doi.org/10.1590/S0102-311X2019')
+        '10.1590/s0102-311x2019'
+    """
+    str_doi = re.sub(REGEX_DOI_PREFIX, '', str_doi.strip().lower())
+
+    return str_doi if re.fullmatch(REGEX_DOI, str_doi) else ''
+
+
+def get_fingerprint(dict_prod, str_tipo_prod):
+    """
+    Get the fingerprint of a production, the same in the CV of every coauthor.
+
+    Args:
+        dict_prod (dict): The attributes of LST_ATTS the production has.
+        str_tipo_prod (str): The type of the production, e.g. 'artigo'.
+
+    Returns:
+        str: 'doi:<doi>' when the production has a DOI, otherwise the type,
+        the normalized title, the year and the digits of the ISSN or ISBN
+        joined by '|', or '' when it has neither DOI nor title.
+
+    The type is part of the fingerprint without DOI because titles such as
+    'Mencao honrosa' repeat across productions that are not the same.
+
+    Example:
+        >>> get_fingerprint({'TITULO-DO-ARTIGO': 'Análise  de Dados.', 'ANO-DO-ARTIGO': '2019',
+        ...                  'ISSN': '1234-567X', 'DOI': ''}, 'artigo')
+        'artigo|analise de dados|2019|1234567X'
+    """
+    str_doi = get_doi(dict_prod.get('DOI', ''))
+    if str_doi:
+        return 'doi:' + str_doi
+
+    str_title = get_normalized_title(get_first_att(dict_prod, LST_TITLE_ATTS))
+    if not str_title:
+        return ''
+
+    return '|'.join([str_tipo_prod, str_title, get_first_att(dict_prod, LST_YEAR_ATTS).strip(),
+                     re.sub(r'[^0-9X]', '', get_first_att(dict_prod, LST_NUMBER_ATTS).upper())])
+
+
+def get_first_att(dict_prod, lst_atts):
+    """
+    Get the first non-empty attribute of a list, or ''.
+    """
+    for str_att in lst_atts:
+        if dict_prod.get(str_att):
+            return dict_prod[str_att]
+
+    return ''
+
+
+def get_id_item(str_fingerprint):
+    """
+    Get the integer ID of a fingerprint.
+
+    Args:
+        str_fingerprint (str): A fingerprint, as returned by get_fingerprint.
+
+    Returns:
+        int: The first 63 bits of its BLAKE2 hash, so it fits a signed 64-bit
+        column, or None for an empty fingerprint.
+
+    The ID depends only on the fingerprint, so the shards of the parse, and
+    later runs, give the same ID to the same production without sharing a
+    table of IDs.
+
+    Example:
+        >>> get_id_item('doi:10.1590/s0102-311x2019')
+        3366968512176191641
+    """
+    if not str_fingerprint:
+        return None
+
+    bytes_digest = hashlib.blake2b(str_fingerprint.encode('utf-8'), digest_size=8).digest()
+
+    return int.from_bytes(bytes_digest, 'big') >> 1
+
+
+def get_normalized_title(str_title):
+    """
+    Normalize a title: no accents, lower case, only letters and digits
+    separated by single spaces.
+
+    Example:
+        >>> get_normalized_title(' Análise  de Dados: um estudo.')
+        'analise de dados um estudo'
+    """
+    if not str_title.isascii():
+        str_title = unicodedata.normalize('NFKD', str_title)
+        str_title = ''.join(x for x in str_title if not unicodedata.combining(x))
+    str_title = str_title.lower()
+
+    return ' '.join(re.findall(r'\w+', str_title))
@@ -9,6 +9,21 @@ Created on Wed Oct 19 04:11:33 2022
 import os
 
 
+# base URL of the CNPq search site; LATTES_BASE_URL points the scripts to a
+# local stand-in server, e.g. http://localhost:8000
+URL_BASE = os.environ.get('LATTES_BASE_URL', 'http://buscatextual.cnpq.br').rstrip('/')
+
+# 'Última atualização do currículo em dd/mm/aaaa' of the preview and CV pages
+REGEX_DATE_LAST_UPDATE = r'atualiza\S*\s+do\s+curr\S*\s+em\s+(\d{2}/\d{2}/\d{4})'
+
+# 16-digit CNPq ID of the 'm-logo' link of the preview page and of the
+# 'Endereço para acessar este CV' line of the CV page
+REGEX_ID_LATTES_PREVIEW = r"abrirLink\('http:.*?(\d{16})'\)"
+REGEX_ID_LATTES_DETAIL = r'">(\d{16})</span>'
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.72 Safari/537.36'
+
+
 def convert_special_chars(df, col):
     """
     Convert special characters in a DataFrame column to their Latin counterparts.
@@ -57,9 +72,11 @@ def format_path(str_path):
     str_path (str): The path to be formatted.
     
     Returns:
-    str: The formatted path.
+    str: The formatted path. Absolute paths and paths starting with "."
+    are kept as given, e.g. "./data" gives "./data/" and "xml_lattes"
+    gives "../data/xml_lattes/".
     """
-    if not str_path.startswith("/") or not str_path.startswith("."):
+    if not str_path.startswith("/") and not str_path.startswith("."):
         str_path = os.path.join("..", "data", str_path)
     
     if not str_path.endswith("/"):
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 31 10:05:26 2026
+
+@author: andrefelix
+"""
+
+import csv
+import glob
+import gzip
+import os
+
+PARTS_FOLDER_NAME = 'parse_parts'
+MANIFEST_FILE_NAME = 'manifest.csv'
+
+STR_PART_FILE_NAME = '{}.{:05d}.csv.gz'
+
+# gzip level 6 compresses the CSV files of the parse about as much as
+# level 9 in half the time; mtime 0 gives the same bytes for the same rows
+DICT_COMPRESSION = {'method': 'gzip', 'compresslevel': 6, 'mtime': 0}
+
+LST_MANIFEST_COLUMNS = ['PART', 'FILE', 'N_CVS', 'BYTES']
+
+# each part is a chunk of the pool of the parse (see utils_schedule), made
+# larger than the default chunks so that the fixed cost of building and
+# writing the DataFrames of a part is small, and the parts are few
+N_PARTS_PER_WORKER = 4
+N_MAX_PART_CVS = 5000
+
+
+def get_dict_part_paths(str_parts_path):
+    """
+    Get the parts listed in the manifest of a parts folder.
+
+    Args:
+        str_parts_path (str): The parts folder, as returned by get_parts_path.
+
+    Returns:
+        dict: The paths of the parts of each CSV file, by CSV file name, in
+        the order of the parts, e.g. {'lattes_producao.csv': [...]}. Empty
+        when the folder has no manifest.
+
+    Only the parts in the manifest are returned: the manifest is written
+    when the parse ends, so the parts of an interrupted run are left out.
+
+    Example:
+        >>> get_dict_part_paths('../data/parse_parts')['lattes_formacao.csv'][0]
+        '../data/parse_parts/lattes_formacao.00001.csv.gz'
+    """
+    str_manifest_path = os.path.join(str_parts_path, MANIFEST_FILE_NAME)
+    if not os.path.exists(str_manifest_path):
+        return dict()
+
+    dict_part_paths = dict()
+    with open(str_manifest_path, newline='', encoding='utf-8') as file_csv:
+        for dict_row in csv.DictReader(file_csv):
+            dict_part_paths.setdefault(dict_row['FILE'], []).append(os.path.join(
+                str_parts_path, get_part_file_name(dict_row['FILE'], int(dict_row['PART']))))
+
+    return dict_part_paths
+
+
+def get_part_file_name(str_csv_name, n_part):
+    """
+    Get the file name of a part of a CSV file.
+
+    Example:
+        >>> get_part_file_name('lattes_producao.csv', 12)
+        'lattes_producao.00012.csv.gz'
+    """
+    return STR_PART_FILE_NAME.format(str_csv_name[:-len('.csv')], n_part)
+
+
+def get_parts_path(str_folder_path):
+    """
+    Get the parts folder of an output folder of the parse.
+
+    Example:
+        >>> get_parts_path('../data/')
+        '../data/parse_parts'
+    """
+    return os.path.join(str_folder_path, PARTS_FOLDER_NAME)
+
+
+def open_csv(str_csv_path, str_mode='r'):
+    """
+    Open a CSV file, or a part of one, decompressing the files ending in .gz.
+
+    Args:
+        str_csv_path (str): The file.
+        str_mode (str, optional): 'r' or 'w'. Defaults to 'r'.
+
+    Returns:
+        file: A text file, to be given to csv.reader or csv.writer.
+    """
+    if str_csv_path.endswith('.gz'):
+        return gzip.open(str_csv_path, mode=str_mode + 't', newline='', encoding='utf-8')
+
+    return open(str_csv_path, mode=str_mode, newline='', encoding='utf-8')
+
+
+def remove_parts(str_parts_path):
+    """
+    Remove the parts and the manifest of a previous run from a parts folder.
+
+    Returns:
+        int: The number of files removed.
+    """
+    lst_paths = glob.glob(os.path.join(str_parts_path, '*.csv.gz'))
+    lst_paths += glob.glob(os.path.join(str_parts_path, MANIFEST_FILE_NAME))
+    for str_path in lst_paths:
+        os.remove(str_path)
+
+    return len(lst_paths)
+
+
+def write_manifest(str_parts_path, lst_csv_names, dict_n_cvs):
+    """
+    Write the manifest of the parts written by the pool workers.
+
+    Args:
+        str_parts_path (str): The parts folder.
+        lst_csv_names (list): The CSV files each part was written for.
+        dict_n_cvs (dict): The number of CVs of each part, by part number.
+
+    Returns:
+        int: The total size, in bytes, of the parts.
+
+    The manifest has one row per part and CSV file, with the number of CVs
+    of the part and the size of the compressed file, and is replaced
+    atomically, so it never lists a part that was not written.
+
+    Example:
+        >>> write_manifest('../data/parse_parts', ['lattes_producao.csv'], {1: 40, 2: 812})
+        18320411
+    """
+    str_manifest_path = os.path.join(str_parts_path, MANIFEST_FILE_NAME)
+    n_bytes = 0
+    with open(str_manifest_path + '.tmp', mode='w', newline='', encoding='utf-8') as file_csv:
+        writer = csv.writer(file_csv, lineterminator='\n')
+        writer.writerow(LST_MANIFEST_COLUMNS)
+        for n_part, n_cvs in sorted(dict_n_cvs.items()):
+            for str_csv_name in lst_csv_names:
+                n_part_bytes = os.path.getsize(os.path.join(
+                    str_parts_path, get_part_file_name(str_csv_name, n_part)))
+                writer.writerow([n_part, str_csv_name, n_cvs, n_part_bytes])
+                n_bytes += n_part_bytes
+    os.replace(str_manifest_path + '.tmp', str_manifest_path)
+
+    return n_bytes
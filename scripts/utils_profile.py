@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 10:14:37 2026
+
+@author: andrefelix
+"""
+
+import contextlib
+import cProfile
+import datetime
+import glob
+import io
+import multiprocessing
+import multiprocessing.util
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+
+# number of functions listed in each table of the summary
+N_TOP_FUNCTIONS = 25
+
+# number of allocation sites listed in each memory snapshot
+N_TOP_ALLOCATIONS = 15
+
+
+def start_profile(str_profile_path, str_stage):
+    """
+    Start profiling a run, if a profile folder was given.
+
+    Args:
+        str_profile_path (str or None): The value of --profile: the folder
+            that receives one subfolder per profiled run, or None.
+        str_stage (str): The name of the stage, e.g. 'parse'.
+
+    Returns:
+        dict or None: None when str_profile_path is None, so every other
+        function of this module does nothing. Otherwise the state of the
+        profile: 'path' (the folder of this run), 'stage', 'profile' (the
+        cProfile of the main thread), 'lst_thread_profiles' (one cProfile per
+        thread started since), 'lst_steps' (the steps recorded by
+        profile_step), 'time_start' and 'lock'.
+
+    The main thread is profiled at once and every thread started from now on
+    gets its own profiler.
+    tracemalloc is started too, which slows the run down noticeably.
+
+    Example:
+        >>> dict_profile = start_profile('../data/profile', 'parse')
+        >>> dict_profile['path']
+        '../data/profile/parse_20261025_101502_4242'
+    """
+    if str_profile_path is None:
+        return None
+
+    str_run_path = os.path.join(str_profile_path, '{}_{}_{}'.format(
+        str_stage, datetime.datetime.now().strftime('%Y%m%d_%H%M%S'), os.getpid()))
+    os.makedirs(str_run_path)
+
+    dict_profile = {'path': str_run_path,
+                    'stage': str_stage,
+                    'profile': cProfile.Profile(),
+                    'lst_thread_profiles': [],
+                    'lst_steps': [],
+                    'time_start': time.perf_counter(),
+                    'lock': threading.Lock()}
+
+    def start_thread_profile(frame, event, arg):
+        # runs once in each new thread: the profiler replaces this hook
+        profile = cProfile.Profile()
+        with dict_profile['lock']:
+            dict_profile['lst_thread_profiles'].append(profile)
+        profile.enable()
+
+    threading.setprofile(start_thread_profile)
+    tracemalloc.start()
+    dict_profile['profile'].enable()
+
+    return dict_profile
+
+
+def init_worker_profile(str_run_path):
+    """
+    Profile a pool worker until it exits. Used as the initializer of the pool.
+
+    Args:
+        str_run_path (str): The folder of the run, where the worker writes
+            worker_<pid>.prof when it exits.
+
+    The profile is written by a multiprocessing finalizer, which runs when the
+    worker exits normally, i.e. after pool.close() and pool.join(); workers
+    killed by pool.terminate() leave no profile.
+    """
+    # a forked worker inherits the tracing of the parent, which only slows it
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    profile = cProfile.Profile()
+    multiprocessing.util.Finalize(None, dump_worker_profile, args=(profile, str_run_path),
+                                  exitpriority=10)
+    profile.enable()
+
+
+def dump_worker_profile(profile, str_run_path):
+    """
+    Write the profile of a pool worker.
+    """
+    profile.disable()
+    profile.dump_stats(os.path.join(str_run_path, 'worker_{}.prof'.format(os.getpid())))
+
+
+def get_pool(dict_profile, **kwargs):
+    """
+    Create a multiprocessing pool whose workers are profiled when the run is.
+
+    Args:
+        dict_profile (dict or None): The profile, as returned by start_profile.
+        **kwargs: The other arguments of multiprocessing.Pool.
+
+    Returns:
+        multiprocessing.pool.Pool: The pool. Close and join it before
+        stop_profile, so the workers write their profiles.
+
+    Example:
+        >>> pool = get_pool(dict_profile)
+    """
+    if dict_profile is None:
+        return multiprocessing.Pool(**kwargs)
+
+    return multiprocessing.Pool(initializer=init_worker_profile,
+                                initargs=(dict_profile['path'],), **kwargs)
+
+
+@contextlib.contextmanager
+def profile_step(dict_profile, str_step):
+    """
+    Measure the time and the memory of a step of the run.
+
+    Args:
+        dict_profile (dict or None): The profile, as returned by start_profile.
+        str_step (str): The name of the step, e.g. 'load' or 'csv producao'.
+
+    The peak of traced memory is reset when the step starts. When it ends,
+    the step is recorded with its duration and its current and peak memory,
+    and a snapshot of the largest allocation sites still alive is written to
+    memory_<n>_<step>.txt.
+
+    Example:
+        >>> with profile_step(dict_profile, 'load'):
+        ...     df_capes = get_df_capes(str_capes_file_path)
+    """
+    if dict_profile is None:
+        yield
+        return
+
+    tracemalloc.reset_peak()
+    time_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        float_seconds = time.perf_counter() - time_start
+        n_current, n_peak = tracemalloc.get_traced_memory()
+        dict_profile['lst_steps'].append((str_step, float_seconds, n_current, n_peak))
+
+        # the snapshot is slow and would show as a hotspot of the main thread
+        dict_profile['profile'].disable()
+        str_file_name = 'memory_{:02d}_{}.txt'.format(len(dict_profile['lst_steps']),
+                                                      re.sub(r'\W+', '_', str_step))
+        lst_stats = tracemalloc.take_snapshot().statistics('lineno')
+        with open(os.path.join(dict_profile['path'], str_file_name), mode='w',
+                  encoding='utf-8') as file_snapshot:
+            file_snapshot.write('{}: {:.1f}s, current {:.1f} MB, peak {:.1f} MB\n'.format(
+                str_step, float_seconds, n_current / 2 ** 20, n_peak / 2 ** 20))
+            for stat in lst_stats[:N_TOP_ALLOCATIONS]:
+                file_snapshot.write('{}\n'.format(stat))
+        dict_profile['profile'].enable()
+
+
+def get_str_stats(stats, str_sort_key):
+    """
+    Format the top functions of a profile, sorted by cumulative or internal time.
+    """
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats(str_sort_key).print_stats(N_TOP_FUNCTIONS)
+
+    return stream.getvalue()
+
+
+def stop_profile(dict_profile):
+    """
+    Stop profiling and write the profiles and the summary of the run.
+
+    Args:
+        dict_profile (dict or None): The profile, as returned by start_profile.
+
+    Returns:
+        None
+
+    Writes to the folder of the run:
+        - main.prof: the main thread;
+        - threads.prof: the other threads of the process, merged, when there
+          are any. Threads that mostly wait, as the helpers of a pool, show
+          their waits here;
+        - workers.prof: the pool workers, merged, when there are any;
+        - summary.txt: the steps with their time and memory, and the top
+          functions of each profile by cumulative and by internal time.
+    The .prof files can be opened with pstats or snakeviz. The steps are
+    also printed.
+
+    Example:
+        >>> stop_profile(dict_profile)
+        profile: ../data/profile/parse_20261025_101502_4242 (12.3s)
+        load: 0.1s, current 0.6 MB, peak 0.9 MB
+        ...
+    """
+    if dict_profile is None:
+        return
+
+    dict_profile['profile'].disable()
+    threading.setprofile(None)
+    float_seconds = time.perf_counter() - dict_profile['time_start']
+    tracemalloc.stop()
+
+    lst_sections = [('main thread', 'main.prof', pstats.Stats(dict_profile['profile']))]
+
+    with dict_profile['lock']:
+        lst_thread_profiles = list(dict_profile['lst_thread_profiles'])
+    if lst_thread_profiles:
+        lst_sections.append(('{} other thread(s)'.format(len(lst_thread_profiles)),
+                             'threads.prof', pstats.Stats(*lst_thread_profiles)))
+
+    lst_worker_files = sorted(glob.glob(os.path.join(dict_profile['path'], 'worker_*.prof')))
+    if lst_worker_files:
+        lst_sections.append(('{} pool worker(s)'.format(len(lst_worker_files)),
+                             'workers.prof', pstats.Stats(*lst_worker_files)))
+
+    lst_lines_steps = ['{}: {:.1f}s, current {:.1f} MB, peak {:.1f} MB'.format(
+        str_step, float_step, n_current / 2 ** 20, n_peak / 2 ** 20)
+                       for str_step, float_step, n_current, n_peak in dict_profile['lst_steps']]
+
+    lst_lines = ['{}: {:.1f}s'.format(dict_profile['stage'], float_seconds), '',
+                 'steps (seconds, current MB, peak MB):']
+    lst_lines.extend('  ' + x for x in lst_lines_steps)
+
+    for str_title, str_file_name, stats in lst_sections:
+        stats.dump_stats(os.path.join(dict_profile['path'], str_file_name))
+        for str_sort_key in ['cumulative', 'tottime']:
+            lst_lines.extend(['', '=== {} - top {} by {} ==='.format(str_title, N_TOP_FUNCTIONS,
+                                                                     str_sort_key),
+                              get_str_stats(stats, str_sort_key)])
+
+    with open(os.path.join(dict_profile['path'], 'summary.txt'), mode='w',
+              encoding='utf-8') as file_summary:
+        file_summary.write('\n'.join(lst_lines))
+
+    print('profile: {} ({:.1f}s)'.format(dict_profile['path'], float_seconds))
+    for str_line in lst_lines_steps:
+        print(str_line)
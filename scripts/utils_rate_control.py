@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:03:18 2026
+
+@author: andrefelix
+"""
+
+import collections
+import random
+import threading
+import time
+
+
+ERROR_TIMEOUT = 'timeout'
+ERROR_HTTP = 'http'
+ERROR_PARSE = 'parse'
+ERROR_OTHER = 'other'
+
+# (base delay, max delay) in seconds for each error class
+DCT_BACKOFF = {ERROR_TIMEOUT: (5, 300),
+               ERROR_HTTP: (10, 600),
+               ERROR_PARSE: (1, 30),
+               ERROR_OTHER: (5, 120)}
+
+# error classes that mean the CNPq server is in trouble and count for the breaker
+SET_ERROR_SERVER = {ERROR_TIMEOUT, ERROR_HTTP}
+
+
+def classify_error(excpt):
+    """
+    Classify an exception raised while talking to the CNPq website.
+
+    Args:
+        excpt (Exception): The exception to be classified.
+
+    Returns:
+        str: One of ERROR_TIMEOUT, ERROR_HTTP, ERROR_PARSE or ERROR_OTHER.
+
+    Timeouts and connection failures from requests, selenium or the standard
+    library are grouped as ERROR_TIMEOUT. Responses with status 429 or 5xx are
+    ERROR_HTTP. Pages that do not have the expected content (missing regex
+    matches, invalid zip files) are ERROR_PARSE. Exceptions are recognized by
+    class name so this module does not depend on requests or selenium.
+
+    Example:
+        >>> classify_error(TimeoutError())
+        'timeout'
+        >>> classify_error(IndexError())
+        'parse'
+    """
+    lst_class_names = [cls.__name__ for cls in type(excpt).__mro__]
+
+    response = getattr(excpt, 'response', None)
+    n_status = getattr(response, 'status_code', None)
+    if n_status is not None and (n_status == 429 or n_status >= 500):
+        return ERROR_HTTP
+
+    if isinstance(excpt, (TimeoutError, ConnectionError)) or \
+            any('Timeout' in name or name == 'ConnectionError' for name in lst_class_names):
+        return ERROR_TIMEOUT
+
+    if isinstance(excpt, (IndexError, KeyError, ValueError)) or \
+            'BadZipFile' in lst_class_names:
+        return ERROR_PARSE
+
+    return ERROR_OTHER
+
+
+def get_backoff_delay(str_error_class, n_attempt):
+    """
+    Compute an exponential backoff delay with full jitter.
+
+    Args:
+        str_error_class (str): The error class returned by classify_error.
+        n_attempt (int): How many consecutive errors of this class happened before.
+
+    Returns:
+        float: The delay in seconds, uniformly drawn between zero and
+        min(max delay, base delay * 2 ** n_attempt) of the error class.
+
+    Example:
+        >>> get_backoff_delay('timeout', 3)
+        27.3
+    """
+    n_base, n_max = DCT_BACKOFF[str_error_class]
+
+    return random.uniform(0, min(n_max, n_base * 2 ** n_attempt))
+
+
+class TokenBucket:
+    """
+    Token bucket limiter shared by every worker thread.
+
+    Args:
+        float_rate (float): Tokens added per second.
+        n_capacity (int): Maximum number of tokens kept, i.e. the allowed burst.
+
+    Example:
+        >>> bucket = TokenBucket(2.0, 5)
+        >>> bucket.acquire()
+    """
+
+    def __init__(self, float_rate, n_capacity):
+        self.float_rate = float_rate
+        self.n_capacity = n_capacity
+        self.float_tokens = float(n_capacity)
+        self.time_last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and consume it.
+        """
+        while True:
+            with self.lock:
+                time_now = time.monotonic()
+                self.float_tokens = min(self.n_capacity,
+                                        self.float_tokens +
+                                        (time_now - self.time_last) * self.float_rate)
+                self.time_last = time_now
+
+                if self.float_tokens >= 1:
+                    self.float_tokens -= 1
+                    return
+
+                float_wait = (1 - self.float_tokens) / self.float_rate
+
+            time.sleep(float_wait)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker that pauses every worker together when the server fails.
+
+    Args:
+        float_failure_ratio (float): Share of server failures among the
+            requests of the window that opens the circuit.
+        n_min_requests (int): Requests the window must have before the ratio
+            is checked, so a few errors at the start do not open it.
+        float_window (float): Length in seconds of the counting window.
+        float_cooldown (float): Seconds the circuit stays open the first time.
+        float_max_cooldown (float): Upper limit for the cooldown, which doubles
+            each time the probe of a half open circuit fails.
+
+    While the circuit is open, wait() blocks every caller. After the cooldown
+    the circuit is half open: wait() lets a single caller through, the probe,
+    and keeps blocking the others. The probe gets a token, which any thread
+    may pass to record_success() to close the circuit or to record_failure()
+    to reopen it with a longer cooldown, and to wait() to send further
+    requests of the same probe. The outcomes of other requests are not
+    counted while the circuit is not closed. A probe that reports nothing
+    within the window is replaced by another.
+
+    Example:
+        >>> breaker = CircuitBreaker(0.5, 20, 60, 60, 900)
+        >>> n_probe = breaker.wait()
+        >>> # ... request ...
+        >>> breaker.record_success(n_probe)
+    """
+
+    def __init__(self, float_failure_ratio, n_min_requests, float_window, float_cooldown,
+                 float_max_cooldown):
+        self.float_failure_ratio = float_failure_ratio
+        self.n_min_requests = n_min_requests
+        self.float_window = float_window
+        self.float_base_cooldown = float_cooldown
+        self.float_cooldown = float_cooldown
+        self.float_max_cooldown = float_max_cooldown
+        self.deque_requests = collections.deque()
+        self.time_open_until = 0.0
+        self.b_half_open = False
+        self.n_probe = None
+        self.n_probes = 0
+        self.time_probe = 0.0
+        self.lock = threading.Lock()
+
+    def count_request(self, time_now, b_failure):
+        """
+        Add a request to the counting window and drop the old ones. Must hold
+        the lock.
+
+        Returns:
+            bool: True if the failures of the window reach the ratio.
+        """
+        self.deque_requests.append((time_now, b_failure))
+        while self.deque_requests and time_now - self.deque_requests[0][0] >= self.float_window:
+            self.deque_requests.popleft()
+
+        n_requests = len(self.deque_requests)
+        n_failures = sum(1 for _, b_fail in self.deque_requests if b_fail)
+
+        return n_requests >= self.n_min_requests and \
+            n_failures >= self.float_failure_ratio * n_requests
+
+    def is_probe(self, n_probe):
+        """
+        Tell whether n_probe is the token of the probe of a half open circuit.
+        Must hold the lock.
+        """
+        return self.b_half_open and n_probe is not None and n_probe == self.n_probe
+
+    def record_failure(self, n_probe=None):
+        """
+        Register a server failure, opening the circuit if needed.
+
+        Args:
+            n_probe (int or None): The token returned by wait() for the request.
+        """
+        with self.lock:
+            time_now = time.monotonic()
+
+            if self.b_half_open or self.time_open_until:
+                if self.is_probe(n_probe):
+                    self.float_cooldown = min(self.float_cooldown * 2,
+                                              self.float_max_cooldown)
+                    self.open(time_now)
+                return
+
+            if self.count_request(time_now, True):
+                self.open(time_now)
+
+    def record_success(self, n_probe=None):
+        """
+        Register a successful request, closing a half open circuit if it is the probe.
+
+        Args:
+            n_probe (int or None): The token returned by wait() for the request.
+        """
+        with self.lock:
+            if self.is_probe(n_probe):
+                self.b_half_open = False
+                self.n_probe = None
+                self.float_cooldown = self.float_base_cooldown
+                print('\ncircuit closed')
+            elif not self.time_open_until:
+                self.count_request(time.monotonic(), False)
+
+    def open(self, time_now):
+        """
+        Open the circuit for the current cooldown. Must hold the lock.
+        """
+        self.deque_requests.clear()
+        self.b_half_open = False
+        self.n_probe = None
+        self.time_open_until = time_now + self.float_cooldown
+        print('\ncircuit open: pausing all workers for {:.0f}s'.format(self.float_cooldown))
+
+    def wait(self, n_probe=None):
+        """
+        Block while the circuit is open, or half open with a probe running.
+
+        Args:
+            n_probe (int or None): The token of a probe already running, so
+            its further requests are let through.
+
+        Returns:
+            int or None: The token of the probe if the caller is the probe of
+            a half open circuit, otherwise None.
+        """
+        while True:
+            with self.lock:
+                time_now = time.monotonic()
+                float_wait = self.time_open_until - time_now
+                if self.time_open_until and float_wait <= 0:
+                    self.time_open_until = 0.0
+                    self.b_half_open = True
+
+                if self.b_half_open:
+                    if self.is_probe(n_probe):
+                        self.time_probe = time_now
+                        return n_probe
+                    if self.n_probe is None or time_now - self.time_probe >= self.float_window:
+                        self.n_probes += 1
+                        self.n_probe = self.n_probes
+                        self.time_probe = time_now
+                        return self.n_probe
+                    float_wait = 0.5
+                elif float_wait <= 0:
+                    return None
+
+            time.sleep(min(float_wait, 5))
+
+    def is_open(self):
+        """
+        Tell whether the circuit is open or half open, i.e. pausing the workers.
+        """
+        with self.lock:
+            return bool(self.time_open_until) or self.b_half_open
+
+
+class RateControl:
+    """
+    Rate control layer shared by the threads of a downloader.
+
+    Args:
+        float_rate (float): Requests per second allowed to CNPq.
+        n_burst (int): Maximum burst of requests.
+
+    Combines a TokenBucket, a CircuitBreaker and an exponential backoff with
+    full jitter whose attempt count is kept separately for each error class.
+
+    Example:
+        >>> rate_control = RateControl(2.0, 5)
+        >>> n_probe = rate_control.acquire()
+        >>> # ... request ...
+        >>> rate_control.record_success(n_probe)
+    """
+
+    def __init__(self, float_rate, n_burst):
+        self.bucket = TokenBucket(float_rate, n_burst)
+        self.breaker = CircuitBreaker(0.5, 20, 60, 60, 900)
+        self.dict_attempts = {x: 0 for x in DCT_BACKOFF}
+        self.lock = threading.Lock()
+
+    def acquire(self, n_probe=None):
+        """
+        Wait for the circuit to be closed and for a token of the bucket.
+
+        Args:
+            n_probe (int or None): The probe token of an earlier request whose
+            outcome is not recorded yet (see CircuitBreaker.wait).
+
+        Returns:
+            int or None: The probe token to pass to record_success() or
+            record_failure(), from whichever thread records the outcome.
+        """
+        n_probe = self.breaker.wait(n_probe)
+        self.bucket.acquire()
+
+        return n_probe
+
+    def record_failure(self, excpt, n_probe=None):
+        """
+        Register a failed request and compute how long the caller should back off.
+
+        Args:
+            excpt (Exception): The exception raised by the request.
+            n_probe (int or None): The token returned by acquire() for the request.
+
+        Returns:
+            tuple: The error class (str) and the backoff delay in seconds (float).
+        """
+        str_error_class = classify_error(excpt)
+
+        if str_error_class in SET_ERROR_SERVER:
+            self.breaker.record_failure(n_probe)
+
+        with self.lock:
+            n_attempt = self.dict_attempts[str_error_class]
+            self.dict_attempts[str_error_class] += 1
+
+        return str_error_class, get_backoff_delay(str_error_class, n_attempt)
+
+    def record_success(self, n_probe=None):
+        """
+        Register a successful request, resetting the backoff of every error class.
+
+        Args:
+            n_probe (int or None): The token returned by acquire() for the request.
+        """
+        self.breaker.record_success(n_probe)
+
+        with self.lock:
+            for str_error_class in self.dict_attempts:
+                self.dict_attempts[str_error_class] = 0
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 28 09:41:15 2026
+
+@author: andrefelix
+"""
+
+from functools import partial
+import os
+import signal
+import time
+
+# a chunk holds about 1/N_CHUNKS_PER_WORKER of the bytes of a worker, and at
+# most N_MAX_CHUNK_ITEMS items
+N_CHUNKS_PER_WORKER = 32
+N_MAX_CHUNK_ITEMS = 64
+
+# True while a pool worker runs a task, so a timer expiring just after the
+# task returns does not interrupt the worker
+B_TASK_RUNNING = False
+
+
+class TaskTimeout(BaseException):
+    """
+    Raised in a pool worker when a task runs longer than its timeout.
+
+    Like KeyboardInterrupt, it is not an Exception, so the tasks that catch
+    every Exception, as the parse of a CV does, do not catch it.
+    """
+
+
+def get_lst_chunks(lst_items, lst_sizes, n_workers, n_chunks_per_worker=N_CHUNKS_PER_WORKER,
+                   n_max_chunk_items=N_MAX_CHUNK_ITEMS):
+    """
+    Split the items of a pool into chunks, the largest items first.
+
+    Args:
+        lst_items (list): The items, e.g. file paths or CNPq IDs.
+        lst_sizes (list): The size of each item, e.g. in bytes.
+        n_workers (int): The number of processes of the pool.
+        n_chunks_per_worker (int, optional): The number of chunks per worker
+            aimed at. Defaults to N_CHUNKS_PER_WORKER.
+        n_max_chunk_items (int, optional): The maximum number of items of a
+            chunk. Defaults to N_MAX_CHUNK_ITEMS.
+
+    Returns:
+        list: Lists of items, the chunks, in decreasing order of item size.
+
+    An item at least as large as the target of a chunk, the total size
+    divided by n_workers * n_chunks_per_worker, is a chunk of its own, and
+    the smaller items are grouped until a chunk reaches the target or
+    n_max_chunk_items. The largest items are handed out first and the pool
+    gives each chunk to the first idle worker, so the last tasks are small
+    and the workers finish at about the same time.
+
+    Example:
+        >>> get_lst_chunks(['a', 'b', 'c', 'd'], [900, 10, 5000, 20], 2)
+        [['c'], ['a'], ['d', 'b']]
+    """
+    lst_pairs = sorted(zip(lst_sizes, lst_items), key=lambda x: x[0], reverse=True)
+    n_target = sum(lst_sizes) / max(1, n_workers * n_chunks_per_worker)
+
+    lst_chunks = []
+    lst_chunk = []
+    n_chunk_size = 0
+    for n_size, item in lst_pairs:
+        lst_chunk.append(item)
+        n_chunk_size += n_size
+        if n_chunk_size >= n_target or len(lst_chunk) >= n_max_chunk_items:
+            lst_chunks.append(lst_chunk)
+            lst_chunk = []
+            n_chunk_size = 0
+
+    if lst_chunk:
+        lst_chunks.append(lst_chunk)
+
+    return lst_chunks
+
+
+def print_report(lst_results, float_time_start, float_time_end, n_workers):
+    """
+    Print how busy the workers of a pool were.
+
+    Args:
+        lst_results (list): The tuples returned by run_tasks.
+        float_time_start (float): The time the tasks were handed to the pool.
+        float_time_end (float): The time the last result arrived.
+        n_workers (int): The number of processes of the pool.
+
+    Returns:
+        None
+
+    The utilization is the time the workers spent in tasks over the time
+    they were available. Each worker also shows how long before the end it
+    ran out of tasks, which is large when a few huge tasks were left to the
+    end.
+
+    Example:
+        >>> print_report(lst_results, time_start, time.time(), 4)
+        pool: 4 processos, 61.2s, 231.0s em tarefas, utilizacao 94%
+        worker 4120: 6210 tarefas, 58.1s (95%), ocioso 0.4s antes do fim
+        ...
+        timeout: 1 tarefas: 1234567890123456.xml
+    """
+    float_seconds = max(float_time_end - float_time_start, 1e-9)
+
+    dict_workers = dict()
+    for _, _, n_pid, float_start, float_end, _ in lst_results:
+        n_tasks, float_busy, float_last = dict_workers.get(n_pid, (0, 0.0, float_time_start))
+        dict_workers[n_pid] = (n_tasks + 1, float_busy + float_end - float_start,
+                               max(float_last, float_end))
+
+    float_busy = sum(x[1] for x in dict_workers.values())
+    print('pool: {} processos, {:.1f}s, {:.1f}s em tarefas, utilizacao {:.0%}'.format(
+        n_workers, float_seconds, float_busy, float_busy / (float_seconds * n_workers)))
+
+    for n_pid, (n_tasks, float_busy, float_last) in sorted(dict_workers.items()):
+        print('worker {}: {} tarefas, {:.1f}s ({:.0%}), ocioso {:.1f}s antes do fim'.format(
+            n_pid, n_tasks, float_busy, float_busy / float_seconds,
+            max(0.0, float_time_end - float_last)))
+
+    lst_timeouts = [os.path.basename(str(x[0])) for x in lst_results if x[5]]
+    if lst_timeouts:
+        print('timeout: {} tarefas: {}'.format(len(lst_timeouts), ', '.join(lst_timeouts)))
+
+
+def raise_task_timeout(n_signal, frame):
+    """
+    Interrupt the task running in a pool worker. The handler of SIGALRM.
+    """
+    if B_TASK_RUNNING:
+        raise TaskTimeout()
+
+
+def run_chunk(func, float_timeout, func_chunk, tpl_chunk):
+    """
+    Run a function on each item of a chunk, in a pool worker.
+
+    Args:
+        func (callable): The function of one item, e.g. parse_files.
+        float_timeout (float): The maximum time, in seconds, of each item;
+            0 or None for no limit.
+        func_chunk (callable): A function of the number of the chunk and of
+            the tuples returned, called in the worker once the chunk is done,
+            e.g. to write the results to disk. It returns the tuples sent
+            back to the parent. None to send the results as they are.
+        tpl_chunk (tuple): The number of the chunk, from 1, and its items, a
+            list returned by get_lst_chunks.
+
+    Returns:
+        list: Tuples (item, result, pid, start, end, timed out) per item; the
+        result is None for the items that timed out.
+
+    The timeout is a best effort. It is a SIGALRM timer, available only on
+    Unix, and the TaskTimeout is raised between two Python operations: a
+    single call to C code, such as the parse of a whole XML document by lxml
+    or expat, is not interrupted and finishes first, however long it takes.
+    So the timeout cuts the item short only once that call returns, and
+    bounds the time spent in the Python code of the item, e.g. the
+    extraction of the fields of the parsed document.
+    """
+    global B_TASK_RUNNING
+
+    b_timer = bool(float_timeout) and hasattr(signal, 'setitimer')
+    if b_timer:
+        signal.signal(signal.SIGALRM, raise_task_timeout)
+
+    n_chunk, lst_items = tpl_chunk
+    lst_return = []
+    for item in lst_items:
+        time_start = time.time()
+        result = None
+        b_timeout = False
+        try:
+            if b_timer:
+                signal.setitimer(signal.ITIMER_REAL, float_timeout)
+            B_TASK_RUNNING = True
+            result = func(item)
+            B_TASK_RUNNING = False
+        except TaskTimeout:
+            b_timeout = True
+        finally:
+            B_TASK_RUNNING = False
+            if b_timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        lst_return.append((item, result, os.getpid(), time_start, time.time(), b_timeout))
+
+    if func_chunk is not None:
+        lst_return = func_chunk(n_chunk, lst_return)
+
+    return lst_return
+
+
+def run_tasks(pool, func, lst_items, lst_sizes, float_timeout, n_workers, func_chunk=None,
+              tpl_chunking=(N_CHUNKS_PER_WORKER, N_MAX_CHUNK_ITEMS)):
+    """
+    Run a function on each item in a pool, scheduled by the size of the items.
+
+    Args:
+        pool (multiprocessing.pool.Pool): The pool.
+        func (callable): The function of one item. It must be picklable.
+        lst_items (list): The items.
+        lst_sizes (list): The size of each item, e.g. of its file in bytes.
+        float_timeout (float): The maximum time, in seconds, of each item;
+            0 or None for no limit.
+        n_workers (int): The number of processes of the pool.
+        func_chunk (callable, optional): A function of each chunk, called in
+            the worker after its items; see run_chunk. It must be picklable.
+            Defaults to None.
+        tpl_chunking (tuple, optional): The number of chunks per worker and
+            the maximum number of items of a chunk; see get_lst_chunks.
+            Defaults to (N_CHUNKS_PER_WORKER, N_MAX_CHUNK_ITEMS).
+
+    Returns:
+        tuple: The tuples returned by run_chunk for every item, in the order
+        they finished, the time the tasks were handed to the pool and the
+        time the last result arrived.
+
+    Example:
+        >>> lst_results, time_start, time_end = run_tasks(
+        ...     pool, parse_files, lst_files, [os.path.getsize(x) for x in lst_files], 300, 4)
+    """
+    lst_chunks = get_lst_chunks(lst_items, lst_sizes, n_workers, *tpl_chunking)
+
+    time_start = time.time()
+    lst_results = []
+    for lst_chunk_results in pool.imap_unordered(partial(run_chunk, func, float_timeout,
+                                                         func_chunk),
+                                                 enumerate(lst_chunks, 1)):
+        lst_results.extend(lst_chunk_results)
+
+    return lst_results, time_start, time.time()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:40 2026
+
+@author: andrefelix
+"""
+
+import contextlib
+import datetime
+import glob
+import os
+import sqlite3
+
+
+JOURNAL_FILE_NAME = 'search_journal.sqlite'
+
+
+def connect_journal(str_journal_path):
+    """
+    Open a connection to the search journal, creating its schema if needed.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+
+    Returns:
+        sqlite3.Connection: An open connection to the journal.
+
+    The journal uses write-ahead logging with full synchronous writes, so a
+    crash in the middle of a search never leaves a partially written result:
+    each ID_PESSOA is committed in a single transaction. The table is indexed
+    on ID_PESSOA, which makes resume checks and consolidation plain queries,
+    and holds each pair of ID_PESSOA and CNPq ID once, even when the same
+    ID_PESSOA is searched under two names.
+    The journal also keeps the K-id to 16-digit ID mappings already resolved.
+    Journals created before the SNIPPET column existed get it on connection.
+
+    Example:
+        >>> with contextlib.closing(connect_journal('out/search_journal.sqlite')) as conn:
+        ...     pass
+    """
+    conn = sqlite3.connect(str_journal_path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=FULL')
+    conn.execute('CREATE TABLE IF NOT EXISTS search_result ('
+                 'ID_PESSOA TEXT NOT NULL, '
+                 'ID_CNPQ TEXT NOT NULL, '
+                 'BOLSISTA TEXT NOT NULL, '
+                 'DT_SEARCH TEXT NOT NULL, '
+                 "SNIPPET TEXT NOT NULL DEFAULT '')")
+    if 'SNIPPET' not in [row[1] for row in conn.execute('PRAGMA table_info(search_result)')]:
+        conn.execute("ALTER TABLE search_result ADD COLUMN SNIPPET TEXT NOT NULL DEFAULT ''")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_search_result_id_pessoa '
+                 'ON search_result (ID_PESSOA)')
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND "
+                        "name = 'idx_search_result_unique'").fetchone():
+        # journals written before the index may repeat the hits of an
+        # ID_PESSOA searched under two names; the first row of each is kept
+        conn.execute('DELETE FROM search_result WHERE rowid NOT IN '
+                     '(SELECT MIN(rowid) FROM search_result GROUP BY ID_PESSOA, ID_CNPQ)')
+        conn.execute('CREATE UNIQUE INDEX idx_search_result_unique '
+                     'ON search_result (ID_PESSOA, ID_CNPQ)')
+    conn.execute('CREATE TABLE IF NOT EXISTS kid_cache ('
+                 'ID_K TEXT PRIMARY KEY, '
+                 'ID_CNPQ TEXT NOT NULL, '
+                 'DT_RESOLVED TEXT NOT NULL)')
+    conn.commit()
+
+    return conn
+
+
+def get_dict_kid_cache(str_journal_path):
+    """
+    Get every K-id to 16-digit ID mapping stored in the journal.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+
+    Returns:
+        dict: A dictionary mapping K-ids to CNPq IDs.
+
+    Example:
+        >>> get_dict_kid_cache('out/search_journal.sqlite')
+        {'K4723925J2': '1234567890123456'}
+    """
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        return dict(conn.execute('SELECT ID_K, ID_CNPQ FROM kid_cache'))
+
+
+def get_dict_idcnpq_kid(str_journal_path):
+    """
+    Get the K-id of every 16-digit ID stored in the journal.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+
+    Returns:
+        dict: A dictionary mapping CNPq IDs to K-ids, the reverse of the K-id cache.
+
+    Example:
+        >>> get_dict_idcnpq_kid('out/search_journal.sqlite')
+        {'1234567890123456': 'K4723925J2'}
+    """
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        return dict(conn.execute('SELECT ID_CNPQ, ID_K FROM kid_cache'))
+
+
+def get_journal_path(str_download_folder_path):
+    """
+    Get the path of the search journal inside the download folder.
+
+    Args:
+        str_download_folder_path (str): The path of the download folder.
+
+    Returns:
+        str: The path of the journal file.
+
+    Example:
+        >>> get_journal_path('../data/capes_x_lattes')
+        '../data/capes_x_lattes/search_journal.sqlite'
+    """
+    return os.path.join(str_download_folder_path, JOURNAL_FILE_NAME)
+
+
+def get_lst_search_result(str_journal_path):
+    """
+    Get every search result stored in the journal with its homonym flag.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+
+    Returns:
+        list: A list of tuples (ID_CNPQ, Bolsista, ID_PESSOA, Homonimo, Snippet),
+        in the same layout as the capes-x-lattes.csv file.
+
+    An ID_PESSOA is flagged as homonym when the search returned more than one
+    distinct CNPq ID for it.
+
+    Example:
+        >>> get_lst_search_result('out/search_journal.sqlite')
+        [('1234567890123456', 'Bolsista de Produtividade', '123', 0,
+          'Doutorado em Fisica pela Universidade de Sao Paulo')]
+    """
+    str_query = ('SELECT s.ID_CNPQ, s.BOLSISTA, s.ID_PESSOA, h.N_CNPQ > 1, s.SNIPPET '
+                 'FROM search_result AS s JOIN '
+                 "(SELECT ID_PESSOA, COUNT(DISTINCT NULLIF(ID_CNPQ, '')) AS N_CNPQ "
+                 'FROM search_result GROUP BY ID_PESSOA) AS h USING (ID_PESSOA) '
+                 'ORDER BY s.ID_PESSOA, s.rowid')
+
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        return conn.execute(str_query).fetchall()
+
+
+def get_lst_search_result_by_id(str_journal_path, str_id):
+    """
+    Get the search results of an ID_PESSOA or of a CNPq ID.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+        str_id (str): A CAPES ID_PESSOA or a 16-digit CNPq ID.
+
+    Returns:
+        list: A list of tuples (ID_PESSOA, ID_CNPQ, Bolsista, date of the
+        search, Snippet), in the order they were written.
+
+    Example:
+        >>> get_lst_search_result_by_id('out/search_journal.sqlite', '123')
+        [('123', '1234567890123456', '', '2026-10-19T10:02:11',
+          'Doutorado em Fisica pela Universidade de Sao Paulo')]
+    """
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        return conn.execute('SELECT ID_PESSOA, ID_CNPQ, BOLSISTA, DT_SEARCH, SNIPPET '
+                            'FROM search_result WHERE ID_PESSOA = ? OR ID_CNPQ = ? '
+                            'ORDER BY rowid', (str_id, str_id)).fetchall()
+
+
+def get_search_summary(str_journal_path):
+    """
+    Count the ID_PESSOA values searched and the CNPq IDs found.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+
+    Returns:
+        tuple: The number of ID_PESSOA values searched, of those with at least
+        one hit and of distinct CNPq IDs found.
+
+    Example:
+        >>> get_search_summary('out/search_journal.sqlite')
+        (24510, 22874, 25102)
+    """
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        return conn.execute("SELECT COUNT(DISTINCT ID_PESSOA), "
+                            "COUNT(DISTINCT CASE WHEN ID_CNPQ != '' THEN ID_PESSOA END), "
+                            "COUNT(DISTINCT NULLIF(ID_CNPQ, '')) "
+                            "FROM search_result").fetchone()
+
+
+def get_set_id_pessoa_searched(str_journal_path):
+    """
+    Get the set of ID_PESSOA values that already have results in the journal.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+
+    Returns:
+        set: The ID_PESSOA values already searched.
+
+    Example:
+        >>> get_set_id_pessoa_searched('out/search_journal.sqlite')
+        {'123', '456'}
+    """
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        return {row[0] for row in
+                conn.execute('SELECT DISTINCT ID_PESSOA FROM search_result')}
+
+
+def import_legacy_txt_files(str_journal_path, str_download_folder_path):
+    """
+    Import the one-file-per-ID_PESSOA results of older runs into the journal.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+        str_download_folder_path (str): The folder holding the legacy .txt files.
+
+    Returns:
+        int: The number of files imported.
+
+    Each legacy file is named after the ID_PESSOA and holds one
+    "ID_CNPQ,Bolsista" line per search hit. Empty files are kept as a single
+    row with an empty ID_CNPQ, as the old consolidation did. Files whose
+    ID_PESSOA is already in the journal are skipped, so the import can be
+    repeated safely.
+
+    Example:
+        >>> import_legacy_txt_files('out/search_journal.sqlite', 'out')
+        1520
+    """
+    set_searched = get_set_id_pessoa_searched(str_journal_path)
+    n_imported = 0
+
+    for file_path in glob.glob('{}/*.txt'.format(str_download_folder_path)):
+        str_id_pessoa = os.path.basename(file_path).split('.')[0]
+        if str_id_pessoa in set_searched:
+            continue
+
+        with open(file_path, 'r') as file:
+            lst_idcnpq = [tuple((line.strip().split(',') + [''])[:2])
+                          for line in file if line.strip()]
+
+        write_search_result(str_journal_path, [str_id_pessoa],
+                            lst_idcnpq or [('', '')])
+        n_imported += 1
+
+    return n_imported
+
+
+def merge_journal(str_journal_path, str_journal_path_other):
+    """
+    Copy the results and the K-id cache of another journal, e.g. of a shard.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file that
+            receives the rows.
+        str_journal_path_other (str): The journal whose rows are copied.
+
+    Returns:
+        int: The number of ID_PESSOA values copied.
+
+    The results of an ID_PESSOA already in the journal are not copied, so
+    the merge can be repeated safely. Both journals are updated to the
+    current schema first.
+
+    Example:
+        >>> merge_journal('out/search_journal.sqlite',
+        ...               'out/shard_1_of_4/search_journal.sqlite')
+        6127
+    """
+    connect_journal(str_journal_path_other).close()
+
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        conn.execute('ATTACH DATABASE ? AS other', (str_journal_path_other,))
+        with conn:
+            n_merged = conn.execute('SELECT COUNT(DISTINCT ID_PESSOA) FROM other.search_result '
+                                    'WHERE ID_PESSOA NOT IN '
+                                    '(SELECT ID_PESSOA FROM main.search_result)').fetchone()[0]
+            conn.execute('INSERT OR IGNORE INTO main.search_result '
+                         '(ID_PESSOA, ID_CNPQ, BOLSISTA, DT_SEARCH, SNIPPET) '
+                         'SELECT ID_PESSOA, ID_CNPQ, BOLSISTA, DT_SEARCH, SNIPPET '
+                         'FROM other.search_result WHERE ID_PESSOA NOT IN '
+                         '(SELECT ID_PESSOA FROM main.search_result)')
+            conn.execute('INSERT OR IGNORE INTO main.kid_cache (ID_K, ID_CNPQ, DT_RESOLVED) '
+                         'SELECT ID_K, ID_CNPQ, DT_RESOLVED FROM other.kid_cache')
+        conn.execute('DETACH DATABASE other')
+
+    return n_merged
+
+
+def write_search_result(str_journal_path, lst_id_pessoa, lst_idcnpq):
+    """
+    Append the search results of a name to the journal.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+        lst_id_pessoa (list): The CAPES ID_PESSOA values that share the searched name.
+        lst_idcnpq (list): A list of tuples (ID_CNPQ, Bolsista) or
+            (ID_CNPQ, Bolsista, Snippet) found for it.
+
+    The hits are written for every ID_PESSOA in one transaction, so readers see
+    either every hit of a search or none of them. A hit already written for
+    an ID_PESSOA, e.g. by the search of another of its names, is ignored.
+
+    Example:
+        >>> write_search_result('out/search_journal.sqlite', ['123', '789'],
+        ...                     [('1234567890123456', '')])
+    """
+    str_now = datetime.datetime.now().isoformat(timespec='seconds')
+    lst_rows = [(str(str_id_pessoa), str(tpl_idcnpq[0]), str(tpl_idcnpq[1]), str_now,
+                 str(tpl_idcnpq[2]) if len(tpl_idcnpq) > 2 else '')
+                for str_id_pessoa in lst_id_pessoa
+                for tpl_idcnpq in lst_idcnpq]
+
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO search_result '
+                             '(ID_PESSOA, ID_CNPQ, BOLSISTA, DT_SEARCH, SNIPPET) '
+                             'VALUES (?, ?, ?, ?, ?)', lst_rows)
+
+
+def write_kid_cache(str_journal_path, str_k_cnpq, str_idcnpq):
+    """
+    Store the 16-digit ID a K-id resolved to.
+
+    Args:
+        str_journal_path (str): The path of the SQLite journal file.
+        str_k_cnpq (str): The K-id of the search result.
+        str_idcnpq (str): The CNPq ID it resolved to.
+
+    Example:
+        >>> write_kid_cache('out/search_journal.sqlite', 'K4723925J2', '1234567890123456')
+    """
+    str_now = datetime.datetime.now().isoformat(timespec='seconds')
+
+    with contextlib.closing(connect_journal(str_journal_path)) as conn:
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO kid_cache (ID_K, ID_CNPQ, DT_RESOLVED) '
+                         'VALUES (?, ?, ?)', (str_k_cnpq, str_idcnpq, str_now))
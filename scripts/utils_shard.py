@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 26 09:31:18 2026
+
+@author: andrefelix
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+
+REGEX_SHARD = r'(\d+)/(\d+)'
+
+# name of the subfolder, or suffix of the file, of each shard: shard_2_of_4
+STR_SHARD_NAME = 'shard_{}_of_{}'
+REGEX_SHARD_NAME = r'shard_(\d+)_of_(\d+)'
+
+
+def get_lst_ids_shard(lst_ids, tpl_shard):
+    """
+    Keep only the IDs of a shard.
+
+    Args:
+        lst_ids (list): The IDs, e.g. CNPq IDs or normalized names.
+        tpl_shard (tuple or None): The shard (i, N), or None for every ID.
+
+    Returns:
+        list: The IDs of the shard, in their original order.
+
+    Example:
+        >>> get_lst_ids_shard(['1234567890123456', '6543210987654321'], (1, 2))
+        ['1234567890123456']
+    """
+    if tpl_shard is None:
+        return list(lst_ids)
+
+    return [x for x in lst_ids if is_in_shard(x, tpl_shard)]
+
+
+def get_lst_shard_paths(str_path):
+    """
+    Get the shard folders, or the shard files, of a path.
+
+    Args:
+        str_path (str): A folder holding 'shard_<i>_of_<N>' subfolders, or a
+            file with siblings named as in get_shard_file_path.
+
+    Returns:
+        list: Tuples (i, N, path) sorted by i.
+
+    Example:
+        >>> get_lst_shard_paths('../data/xml_lattes/')
+        [(1, 2, '../data/xml_lattes/shard_1_of_2'), (2, 2, '../data/xml_lattes/shard_2_of_2')]
+    """
+    if os.path.isdir(str_path):
+        str_pattern = os.path.join(str_path, 'shard_*_of_*')
+    else:
+        str_root, str_ext = os.path.splitext(str_path)
+        str_pattern = '{}.shard_*_of_*{}'.format(str_root, str_ext)
+
+    lst_return = []
+    for str_shard_path in glob.glob(str_pattern):
+        match = re.search(REGEX_SHARD_NAME, os.path.basename(str_shard_path))
+        if match:
+            lst_return.append((int(match.group(1)), int(match.group(2)), str_shard_path))
+
+    return sorted(lst_return)
+
+
+def get_shard_file_path(str_file_path, tpl_shard):
+    """
+    Get the path of a file, such as the CV store, written by a shard.
+
+    Args:
+        str_file_path (str): The path given on the command line.
+        tpl_shard (tuple or None): The shard (i, N), or None.
+
+    Returns:
+        str: The path with '.shard_<i>_of_<N>' before the extension, or the
+        path itself when tpl_shard is None.
+
+    Example:
+        >>> get_shard_file_path('../data/cv_store.sqlite', (2, 4))
+        '../data/cv_store.shard_2_of_4.sqlite'
+    """
+    if tpl_shard is None or str_file_path is None:
+        return str_file_path
+
+    str_root, str_ext = os.path.splitext(str_file_path)
+
+    return '{}.{}{}'.format(str_root, STR_SHARD_NAME.format(*tpl_shard), str_ext)
+
+
+def get_shard_folder_path(str_folder_path, tpl_shard):
+    """
+    Get the output folder of a shard, creating it if needed.
+
+    Args:
+        str_folder_path (str): The output folder given on the command line,
+            with or without a trailing slash.
+        tpl_shard (tuple or None): The shard (i, N), or None.
+
+    Returns:
+        str: The 'shard_<i>_of_<N>' subfolder, keeping the trailing slash if
+        str_folder_path had one, or the folder itself when tpl_shard is None.
+
+    Example:
+        >>> get_shard_folder_path('../data/xml_lattes/', (2, 4))
+        '../data/xml_lattes/shard_2_of_4/'
+    """
+    if tpl_shard is None:
+        return str_folder_path
+
+    str_shard_path = os.path.join(str_folder_path, STR_SHARD_NAME.format(*tpl_shard))
+
+    if not os.path.exists(str_shard_path):
+        os.makedirs(str_shard_path)
+
+    return str_shard_path + ('/' if str_folder_path.endswith('/') else '')
+
+
+def get_tpl_shard(str_shard):
+    """
+    Parse the value of --shard. Used as the argparse type of the option.
+
+    Args:
+        str_shard (str): The shard as 'i/N', with 1 <= i <= N.
+
+    Returns:
+        tuple: The shard (i, N).
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is not a valid shard.
+
+    Example:
+        >>> get_tpl_shard('2/4')
+        (2, 4)
+    """
+    match = re.fullmatch(REGEX_SHARD, str_shard.strip())
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError('shard invalido: {}. Use i/N, com 1 <= i <= N'
+                                         .format(str_shard))
+
+    return int(match.group(1)), int(match.group(2))
+
+
+def is_in_shard(str_id, tpl_shard):
+    """
+    Tell whether an ID belongs to a shard.
+
+    Args:
+        str_id (str): The ID, e.g. a CNPq ID or a normalized name.
+        tpl_shard (tuple): The shard (i, N).
+
+    Returns:
+        bool: True if the MD5 of the ID, modulo N, is i - 1.
+
+    The hash does not depend on the machine, the Python version or the
+    order of the list, so every node computes the same split.
+
+    Example:
+        >>> is_in_shard('1234567890123456', (1, 2))
+        True
+    """
+    n_shard, n_shards = tpl_shard
+    n_hash = int(hashlib.md5(str_id.strip().encode('utf-8')).hexdigest(), 16)
+
+    return n_hash % n_shards == n_shard - 1
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 29 10:12:37 2026
+
+@author: andrefelix
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+# lxml is optional: when it is installed the CVs are parsed by libxml2,
+# otherwise by the expat parser of the standard library
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+LST_BACKENDS = ['lxml', 'etree']
+
+# the backend chosen by the parent, inherited by the pool workers even when
+# they are spawned instead of forked
+STR_ENV_BACKEND = 'LATTES_XML_BACKEND'
+
+STR_BACKEND = None
+
+LXML_PARSER = None
+
+
+def get_backend():
+    """
+    Get the XML backend in use.
+
+    Returns:
+        str: 'lxml' or 'etree'. Unless set_backend chose one, the backend of
+        the LATTES_XML_BACKEND environment variable, or lxml when it is
+        installed.
+
+    Example:
+        >>> get_backend()
+        'lxml'
+    """
+    global STR_BACKEND
+
+    if STR_BACKEND is None:
+        str_backend = os.environ.get(STR_ENV_BACKEND, 'auto')
+        if str_backend not in LST_BACKENDS or (str_backend == 'lxml' and lxml_etree is None):
+            str_backend = 'lxml' if lxml_etree is not None else 'etree'
+        STR_BACKEND = str_backend
+
+    return STR_BACKEND
+
+
+def get_lxml_parser():
+    """
+    Get the lxml parser, created once per process.
+
+    The parser keeps the attributes and elements ElementTree keeps: comments
+    and processing instructions are dropped, entities of a DTD are not
+    loaded and there is no limit on the size of the tree, as some CVs have
+    tens of megabytes.
+    """
+    global LXML_PARSER
+
+    if LXML_PARSER is None:
+        LXML_PARSER = lxml_etree.XMLParser(**get_lxml_parser_options())
+
+    return LXML_PARSER
+
+
+def get_lxml_parser_options():
+    """
+    Get the options of the lxml parser, shared by get_lxml_parser and
+    parse_head.
+    """
+    return {'huge_tree': True, 'remove_comments': True, 'remove_pis': True,
+            'resolve_entities': False, 'no_network': True}
+
+
+def parse_bytes(bytes_xml):
+    """
+    Parse an XML document held in memory.
+
+    Args:
+        bytes_xml (bytes): The document, still in its original encoding.
+
+    Returns:
+        Element: The root element, an xml.etree.ElementTree.Element or an
+        lxml.etree._Element, both with the find, findall, iteration and
+        attrib interface used by parse_xml_lattes.
+
+    Raises:
+        Exception: xml.etree.ElementTree.ParseError or lxml.etree.XMLSyntaxError
+        if the document is not well formed.
+
+    The bytes are given to the parser as they are, so the ISO-8859-1 of the
+    Lattes files, declared in the XML header, is decoded by the C parser and
+    never by Python.
+
+    Example:
+        >>> parse_bytes(b'<?xml version="1.0" encoding="ISO-8859-1" ?><CURRICULO-VITAE/>').tag
+        'CURRICULO-VITAE'
+    """
+    if get_backend() == 'lxml':
+        return lxml_etree.fromstring(bytes_xml, get_lxml_parser())
+
+    return ET.fromstring(bytes_xml)
+
+
+def parse_file(str_file_name):
+    """
+    Parse an XML file. Same as parse_bytes, but the parser reads the file.
+    """
+    if get_backend() == 'lxml':
+        return lxml_etree.parse(str_file_name, get_lxml_parser()).getroot()
+
+    return ET.parse(str_file_name).getroot()
+
+
+def parse_head(file_xml, lst_stop_tags):
+    """
+    Parse the beginning of an XML document, up to the end of an element.
+
+    Args:
+        file_xml (file): The document, a binary file opened for reading, such
+            as the curriculo.xml of a zip file opened by ZipFile.open.
+        lst_stop_tags (list): The tags of the elements that end the parse.
+
+    Returns:
+        Element: The root element, with the elements read so far, up to the
+        first element of lst_stop_tags closed, with all its children; the
+        whole document if none is found.
+
+    Raises:
+        Exception: As parse_bytes, if the part of the document read is not
+        well formed. The rest of the document is neither read nor checked.
+
+    The document is read in small blocks by iterparse, so a CV whose
+    DADOS-GERAIS come first is read only up to them, a fraction of the
+    file, and a zip member is decompressed only that far.
+
+    Example:
+        >>> with zipfile.ZipFile('1234567890123456.zip') as lattes_zip:
+        ...     root = parse_head(lattes_zip.open('curriculo.xml'), ['DADOS-GERAIS'])
+        >>> root.find('./DADOS-GERAIS').get('NOME-COMPLETO')
+        'Maria da Silva'
+    """
+    if get_backend() == 'lxml':
+        iter_events = lxml_etree.iterparse(file_xml, events=('start', 'end'),
+                                           **get_lxml_parser_options())
+    else:
+        iter_events = ET.iterparse(file_xml, events=('start', 'end'))
+
+    set_stop_tags = set(lst_stop_tags)
+    root = None
+    for str_event, node in iter_events:
+        if root is None:
+            root = node
+        elif str_event == 'end' and node.tag in set_stop_tags:
+            break
+
+    return root
+
+
+def set_backend(str_backend):
+    """
+    Choose the XML backend of this process and of the processes it creates.
+
+    Args:
+        str_backend (str): 'lxml', 'etree' or 'auto', for lxml when it is
+            installed.
+
+    Returns:
+        str: The backend chosen.
+
+    Raises:
+        ValueError: If the backend is unknown, or is lxml and lxml is not
+        installed.
+
+    Example:
+        >>> set_backend('etree')
+        'etree'
+    """
+    global STR_BACKEND
+
+    if str_backend == 'auto':
+        str_backend = 'lxml' if lxml_etree is not None else 'etree'
+    if str_backend not in LST_BACKENDS:
+        raise ValueError('backend XML desconhecido: {}'.format(str_backend))
+    if str_backend == 'lxml' and lxml_etree is None:
+        raise ValueError('o backend lxml nao esta instalado: pip install lxml')
+
+    STR_BACKEND = str_backend
+    os.environ[STR_ENV_BACKEND] = str_backend
+
+    return str_backend